@@ -69,6 +69,7 @@ public class BenchService: Service() {
             Log.d(TAG, "got a connection")
             val url = session.getUri()
             return when {
+                url.contains("/time") -> handleTime()
                 url.contains("/mac") -> handleMac()
                 url.contains("/throughput") -> handleT(session)
                 url.contains("/messages") -> handleM(session)
@@ -175,6 +176,12 @@ public class BenchService: Service() {
             return NanoHTTPD.Response(NanoHTTPD.Response.Status.OK, "text/plain", result.toString())
         }
 
+        // wall clock of the device, for the controller to estimate its offset
+        private fun handleTime(): NanoHTTPD.Response {
+            val now = System.currentTimeMillis()
+            return NanoHTTPD.Response(NanoHTTPD.Response.Status.OK, "text/plain", now.toString())
+        }
+
         private fun handleMac(): NanoHTTPD.Response {
             val adapter = BluetoothAdapter.getDefaultAdapter()
             val name = adapter.getName()
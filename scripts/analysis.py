@@ -0,0 +1,318 @@
+import sys
+
+import numpy
+
+import ingest
+
+# one structured dtype per csv schema served by BenchService
+THROUGHPUT_DTYPE = numpy.dtype([
+    ('from', 'S64'), ('to', 'S64'), ('bytes', 'i8'), ('nanotime', 'i8')
+])
+
+TOKEN_DTYPE = numpy.dtype([
+    ('sender', 'S64'), ('receiver', 'S64'),
+    ('payloadSize', 'i8'), ('numRounds', 'i8'),
+    ('started', 'i8'), ('connected', 'i8'), ('received', 'i8'),
+    ('finished', 'i8'), ('sleep', 'i8')
+])
+
+MESSAGES_DTYPE = numpy.dtype([
+    ('from', 'S64'), ('to', 'S64'), ('message_size', 'i8'),
+    ('started', 'i8'), ('received', 'i8'), ('finished', 'i8')
+])
+
+SCHEMAS = {
+    'throughput': THROUGHPUT_DTYPE,
+    'token': TOKEN_DTYPE,
+    'messages': MESSAGES_DTYPE,
+}
+
+CHUNK_SIZE = 4096
+
+
+def from_rows(rows, dtype):
+    # rows can be any iterable of csv dicts (e.g. a streamed report); they
+    # are packed into a growing typed array instead of a list of dicts
+    names = dtype.names
+    convert = [str if dtype[n].kind == 'S' else int for n in names]
+    fields = zip(names, convert)
+
+    arr = numpy.empty(CHUNK_SIZE, dtype=dtype)
+    n = 0
+    for row in rows:
+        if n == len(arr):
+            arr = numpy.resize(arr, 2 * len(arr))
+        arr[n] = tuple(c(row[name]) for name, c in fields)
+        n += 1
+    return arr[:n].copy()
+
+
+def load(path, dtype):
+    return from_rows(ingest.read_report(path), dtype)
+
+
+def load_throughput(rows):
+    return from_rows(rows, THROUGHPUT_DTYPE)
+
+
+def load_token(rows):
+    return from_rows(rows, TOKEN_DTYPE)
+
+
+def load_messages(rows):
+    return from_rows(rows, MESSAGES_DTYPE)
+
+
+def detect_schema(path):
+    with open(path, 'r') as f:
+        header = tuple(f.readline().strip().split(','))
+    for name, dtype in SCHEMAS.iteritems():
+        if header == dtype.names:
+            return name
+    return None
+
+
+def group_by(arr, *fields):
+    # unique keys and, for every row, the index of its key
+    keys = arr[list(fields)] if len(fields) > 1 else arr[fields[0]]
+    return numpy.unique(keys, return_inverse=True)
+
+
+def group_stats(inverse, values, ngroups):
+    values = numpy.asarray(values, dtype=numpy.float64)
+    count = numpy.bincount(inverse, minlength=ngroups)
+    total = numpy.bincount(inverse, weights=values, minlength=ngroups)
+    squares = numpy.bincount(inverse, weights=values ** 2, minlength=ngroups)
+
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        std = numpy.sqrt(numpy.maximum(squares / count - mean ** 2, 0))
+
+    order = numpy.argsort(inverse, kind='mergesort')
+    starts = numpy.concatenate(([0], numpy.cumsum(count)[:-1]))
+    present = count > 0
+    lo = numpy.full(ngroups, numpy.nan)
+    hi = numpy.full(ngroups, numpy.nan)
+    if len(values):
+        lo[present] = numpy.minimum.reduceat(values[order], starts[present])
+        hi[present] = numpy.maximum.reduceat(values[order], starts[present])
+
+    return dict(count=count, mean=mean, std=std, min=lo, max=hi)
+
+
+# which device's clock stamped every timestamp column of a report
+MESSAGES_CLOCKS = (('from', ('started', 'finished')), ('to', ('received',)))
+TOKEN_CLOCKS = (('sender', ('started', 'connected', 'received', 'finished')),)
+
+
+def correct_clocks(arr, clocks, to_controller):
+    # a copy of arr with the timestamps moved to the controller's clock;
+    # to_controller(device, values) is e.g. ClockTable.to_controller
+    arr = arr.copy()
+    for key, columns in clocks:
+        keys, inverse = group_by(arr, key)
+        for i, k in enumerate(keys):
+            rows = inverse == i
+            for c in columns:
+                arr[c][rows] = numpy.round(to_controller(k, arr[c][rows]))
+    return arr
+
+
+def describe(values):
+    # (mean, min, max, std) of a flat sample, None when it is empty
+    values = numpy.asarray(values, dtype=numpy.float64)
+    if len(values) == 0:
+        return None
+    return values.mean(), values.min(), values.max(), values.std()
+
+
+def bootstrap_ci(values, confidence=0.95, resamples=2000, rng=numpy.random):
+    # percentile bootstrap of the mean, all resamples drawn at once
+    values = numpy.asarray(values, dtype=numpy.float64)
+    if len(values) < 2:
+        return None
+    idx = rng.randint(0, len(values), size=(resamples, len(values)))
+    means = values[idx].mean(axis=1)
+    tail = (1 - confidence) / 2 * 100
+    lo, hi = numpy.percentile(means, [tail, 100 - tail])
+    return lo, hi
+
+
+def throughput_rates(arr):
+    kbits = arr['bytes'] * 8 / 10.0 ** 3
+    seconds = arr['nanotime'] / 10.0 ** 9
+    return kbits / seconds  # kbits / s
+
+
+def throughput_summary(arr):
+    keys, inverse = group_by(arr, 'from', 'to')
+    stats = group_stats(inverse, throughput_rates(arr), len(keys))
+    return dict(
+        ((k['from'], k['to']), dict((s, v[i]) for s, v in stats.iteritems()))
+        for i, k in enumerate(keys)
+    )
+
+
+def token_metrics(arr, payload_size):
+    rtt = arr['finished'] - arr['started']
+    return dict(
+        rtt=rtt,
+        connection=arr['connected'] - arr['started'],
+        sleep_time=arr['sleep'],
+        throughput=(payload_size / 1000.0) / (rtt * 1000.0),
+    )
+
+
+def token_summary(arr, payload_size):
+    # averages of every metric per sender->receiver link
+    keys, inverse = group_by(arr, 'sender', 'receiver')
+    metrics = token_metrics(arr, payload_size)
+    means = dict(
+        (m, group_stats(inverse, v, len(keys))['mean'])
+        for m, v in metrics.iteritems() if m != 'sleep_time'
+    )
+
+    order = numpy.argsort(inverse, kind='mergesort')
+    bounds = numpy.cumsum(numpy.bincount(inverse, minlength=len(keys)))[:-1]
+    sleeps = numpy.split(metrics['sleep_time'][order], bounds)
+
+    results = {}
+    for i, k in enumerate(keys):
+        item = dict((m, v[i]) for m, v in means.iteritems())
+        item['sleep_time'] = sleeps[i].tolist()
+        results[k['sender'] + '->' + k['receiver']] = item
+    return results
+
+
+HOP_PHASES = ('sleep', 'connect', 'transfer', 'response')
+
+
+def token_hops(arr, ring_size=None):
+    # every hop split in its phases, all read from the sender's clock: the
+    # random sleep before the ping, connecting, writing the ping and waiting
+    # for the pong. The master appends one row per hop in ring order, so
+    # rounds follow from the row index
+    if ring_size is None:
+        ring_size = max(len(numpy.unique(arr['sender'])), 1)
+    index = numpy.arange(len(arr['sender']))
+    return dict(
+        sleep=arr['sleep'],
+        connect=arr['connected'] - arr['started'],
+        transfer=arr['received'] - arr['connected'],
+        response=arr['finished'] - arr['received'],
+        round=index // ring_size,
+        position=index % ring_size,
+    )
+
+
+def hop_matrix(arr, values):
+    # mean of values per sender (rows) and receiver (columns), nan for the
+    # links without hops
+    devices = numpy.unique(numpy.concatenate((arr['sender'], arr['receiver'])))
+    n = len(devices)
+    flat = numpy.searchsorted(devices, arr['sender']) * n + \
+        numpy.searchsorted(devices, arr['receiver'])
+    total = numpy.bincount(flat, weights=values, minlength=n * n)
+    count = numpy.bincount(flat, minlength=n * n)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        return devices, (total / count).reshape(n, n)
+
+
+def hop_heatmap(arr):
+    # data of the token_heatmap figure, nan (unused links) becomes null;
+    # None without hops (a failed run)
+    if not len(arr['sender']):
+        return None
+    hops = token_hops(arr)
+    matrices = {}
+    for p in HOP_PHASES:
+        devices, m = hop_matrix(arr, hops[p])
+        matrices[p] = [[None if numpy.isnan(v) else v for v in row]
+                       for row in m.tolist()]
+    return dict(devices=devices.tolist(), phases=HOP_PHASES,
+                matrices=matrices)
+
+
+def hop_timeline(arr):
+    # data of the token_timeline figure: the phases of every hop, by
+    # round; None without hops
+    if not len(arr['sender']):
+        return None
+    hops = token_hops(arr)
+    phases = numpy.column_stack([hops[p] for p in HOP_PHASES])
+    rounds = [phases[hops['round'] == r].tolist()
+              for r in numpy.unique(hops['round'])]
+    ring = arr['sender'][hops['round'] == 0]
+    return dict(devices=ring.tolist(), phases=HOP_PHASES, rounds=rounds)
+
+
+def token_hop_summary(arr):
+    # mean of every phase per sender->receiver link
+    keys, inverse = group_by(arr, 'sender', 'receiver')
+    hops = token_hops(arr)
+    stats = dict((p, group_stats(inverse, hops[p], len(keys)))
+                 for p in HOP_PHASES)
+
+    results = {}
+    for i, k in enumerate(keys):
+        item = dict((p, stats[p]['mean'][i]) for p in HOP_PHASES)
+        item['count'] = stats['sleep']['count'][i]
+        results[k['sender'] + '->' + k['receiver']] = item
+    return results
+
+
+def messages_summary(arr):
+    # from, to, message_size, started, received, finished
+    if len(arr) == 0:
+        return None
+    finished = arr['finished']
+    return dict(
+        received=len(arr),
+        first=finished.min(),
+        last=finished.max(),
+        timespan=(finished.max() - finished.min()) / 1000.0,  # s
+        rtts=finished - arr['started'],
+        conn_cost_approx=arr['received'] - arr['started'],
+    )
+
+
+def messages_by_target(arr):
+    keys, inverse = group_by(arr, 'to')
+    rtts = group_stats(inverse, arr['finished'] - arr['started'], len(keys))
+    spans = group_stats(inverse, arr['finished'], len(keys))
+    return dict(
+        (k, dict(received=rtts['count'][i], rtt=rtts['mean'][i],
+                 timespan=(spans['max'][i] - spans['min'][i]) / 1000.0))
+        for i, k in enumerate(keys)
+    )
+
+
+def main():
+    for path in sys.argv[1:]:
+        schema = detect_schema(path)
+        if schema is None:
+            print path, ': unknown report, skipping'
+            continue
+
+        arr = load(path, SCHEMAS[schema])
+        print '***', path, '(' + schema + ',', len(arr), 'rows) ***'
+        if schema == 'throughput':
+            for (s, r), st in sorted(throughput_summary(arr).items()):
+                print '{0} -> {1}: {2:.1f} kbit/s (std {3:.1f}, n={4})'.format(
+                    s, r, st['mean'], st['std'], st['count'])
+        elif schema == 'token':
+            payload = arr['payloadSize'][0] if len(arr) else 0
+            hops = token_hop_summary(arr)
+            for link, st in sorted(token_summary(arr, payload).items()):
+                print '{0}: rtt {1:.1f} ms, connection {2:.1f} ms'.format(
+                    link, st['rtt'], st['connection'])
+                print '  ' + ', '.join('{0} {1:.1f} ms'.format(p, hops[link][p])
+                                       for p in HOP_PHASES)
+        else:
+            for target, st in sorted(messages_by_target(arr).items()):
+                print '{0}: {1} msgs, rtt {2:.1f} ms, span {3:.1f} s'.format(
+                    target, st['received'], st['rtt'], st['timespan'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+import argparse
+import json
+import os
+import re
+import shutil
+from multiprocessing import Pool
+
+import numpy
+
+import analysis
+import render
+import resultstore
+
+SOURCE_DIR = 'token_results'
+ARCHIVE_DIR = 'token_archive'
+FNAME_RE = re.compile(r'^token_(\d+)_(\d+)\.csv$')
+
+# dictionary encoded columns, the rest are copied from the csv as they are
+CODED = ('ordering', 'sender', 'receiver')
+COLUMNS = ('ordering', 'payload', 'run') + analysis.TOKEN_DTYPE.names
+TABLES = ('orderings', 'devices', 'files', 'segments', 'superseded')
+
+
+def find_reports(src):
+    for ordering in sorted(os.listdir(src)):
+        dirname = os.path.join(src, ordering)
+        if not os.path.isdir(dirname):
+            continue
+        for fname in sorted(os.listdir(dirname)):
+            m = FNAME_RE.match(fname)
+            if m is not None:
+                yield (os.path.join(ordering, fname), ordering,
+                       int(m.group(1)), int(m.group(2)))
+
+
+def file_stat(path):
+    # tells a report apart from the one that was ingested
+    st = os.stat(path)
+    return dict(size=st.st_size, mtime=st.st_mtime)
+
+
+def changed(entry, stat):
+    # archives from before the stat was kept only have the row count
+    return not isinstance(entry, dict) or \
+        any(entry.get(k) != v for k, v in stat.iteritems())
+
+
+def parse_report(args):
+    src, relpath, ordering, payload, run = args
+    path = os.path.join(src, relpath)
+    if analysis.detect_schema(path) != 'token':
+        # failed runs leave "no results yet" or an empty file behind
+        return relpath, ordering, payload, run, None
+    return relpath, ordering, payload, run, analysis.load(
+        path, analysis.TOKEN_DTYPE)
+
+
+class TokenArchive(object):
+    # append-only: every ingest writes its rows as a new segment (one .npy
+    # per column) and queries memmap the segments one by one, so an ingest
+    # costs what it adds, not what is already there. The rows of a report
+    # that was ingested again are superseded in the older segments rather
+    # than rewritten
+
+    def __init__(self, root=ARCHIVE_DIR):
+        self.root = root
+        self.tables = dict((t, self._load_table(t)) for t in TABLES)
+        if not self.tables['segments'] and \
+                os.path.exists(self._column_path('.', 'run')):
+            # an archive from before segments is its first segment
+            self.tables['segments'] = [dict(name='.', rows=len(numpy.load(
+                self._column_path('.', 'run'), mmap_mode='r')))]
+        self._columns = {}
+
+    def _load_table(self, name):
+        path = os.path.join(self.root, name + '.json')
+        if not os.path.exists(path):
+            return {} if name in ('files', 'superseded') else []
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def _column_path(self, segment, name):
+        return os.path.join(self.root, segment, name + '.npy')
+
+    def columns(self, segment):
+        if segment not in self._columns:
+            self._columns[segment] = dict(
+                (name, numpy.load(self._column_path(segment, name),
+                                  mmap_mode='r')) for name in COLUMNS)
+        return self._columns[segment]
+
+    def _live(self, segment):
+        # rows of the segment that no later ingest superseded
+        columns = self.columns(segment)
+        live = numpy.ones(len(columns['run']), dtype=bool)
+        for ordering, payload, run in self.tables['superseded'].get(
+                segment, ()):
+            live &= ~((columns['ordering'] == ordering) &
+                      (columns['payload'] == payload) &
+                      (columns['run'] == run))
+        return live
+
+    def __len__(self):
+        return sum(int(self._live(seg['name']).sum())
+                   for seg in self.tables['segments'])
+
+    def _code(self, table, value):
+        values = self.tables[table]
+        try:
+            return values.index(value)
+        except ValueError:
+            values.append(value)
+            return len(values) - 1
+
+    def ingest(self, src=SOURCE_DIR, workers=None):
+        # new reports and the ones that changed since (a retried test
+        # writes its report again), whose old rows are superseded
+        files = self.tables['files']
+        todo = []
+        for relpath, ordering, payload, run in find_reports(src):
+            if changed(files.get(relpath),
+                       file_stat(os.path.join(src, relpath))):
+                todo.append((src, relpath, ordering, payload, run))
+        if not todo:
+            return 0
+
+        for _, relpath, ordering, payload, run in todo:
+            if relpath in files and ordering in self.tables['orderings']:
+                key = [self.tables['orderings'].index(ordering), payload, run]
+                for seg in self.tables['segments']:
+                    self.tables['superseded'].setdefault(
+                        seg['name'], []).append(key)
+
+        pool = Pool(workers)
+        try:
+            parsed = pool.map(parse_report, todo, chunksize=16)
+        finally:
+            pool.close()
+            pool.join()
+
+        new = dict((name, []) for name in COLUMNS)
+        for relpath, ordering, payload, run, arr in parsed:
+            files[relpath] = dict(file_stat(os.path.join(src, relpath)),
+                                  rows=0 if arr is None else len(arr))
+            if not files[relpath]['rows']:
+                continue
+
+            n = len(arr)
+            new['ordering'].append(numpy.repeat(
+                self._code('orderings', ordering), n).astype(numpy.int32))
+            new['payload'].append(numpy.repeat(payload, n).astype(numpy.int32))
+            new['run'].append(numpy.repeat(run, n).astype(numpy.int32))
+            for name in analysis.TOKEN_DTYPE.names:
+                if name in CODED:
+                    codes = [self._code('devices', d) for d in arr[name]]
+                    new[name].append(numpy.array(codes, dtype=numpy.int32))
+                else:
+                    new[name].append(arr[name])
+
+        self._write(new)
+        return sum(1 for t in todo if files[t[1]]['rows'])
+
+    def _write(self, new):
+        # the segment is written aside and renamed in place, the tables go
+        # last: an interrupted ingest leaves a segment nobody knows about,
+        # and is simply redone
+        if new['run']:
+            name = 'segment-{0:06d}'.format(len(self.tables['segments']))
+            path = os.path.join(self.root, name)
+            tmp_path = path + '.tmp'
+            for p in (path, tmp_path):
+                if os.path.exists(p):
+                    shutil.rmtree(p)
+            os.makedirs(tmp_path)
+            for column in COLUMNS:
+                with open(os.path.join(tmp_path, column + '.npy'), 'wb') as f:
+                    numpy.save(f, numpy.concatenate(new[column]))
+            os.rename(tmp_path, path)
+            self.tables['segments'].append(
+                dict(name=name, rows=sum(len(a) for a in new['run'])))
+
+        for name in TABLES:
+            path = os.path.join(self.root, name + '.json')
+            with open(path + '.tmp', 'w') as f:
+                json.dump(self.tables[name], f, indent=1, sort_keys=True)
+            os.rename(path + '.tmp', path)
+
+    def _mask(self, columns, column, table, values):
+        if values is None:
+            return None
+        if not isinstance(values, (list, tuple, set)):
+            values = [values]
+        if table is not None:
+            values = [self.tables[table].index(v)
+                      for v in values if v in self.tables[table]]
+        return numpy.in1d(columns[column], list(values))
+
+    def query(self, ordering=None, payload=None, run=None, decode=True):
+        # rows matching every given filter (a value or a list of values),
+        # as a dict of column arrays
+        parts = dict((name, []) for name in COLUMNS)
+        for seg in self.tables['segments']:
+            columns = self.columns(seg['name'])
+            mask = self._live(seg['name'])
+            for m in (self._mask(columns, 'ordering', 'orderings', ordering),
+                      self._mask(columns, 'payload', None, payload),
+                      self._mask(columns, 'run', None, run)):
+                if m is not None:
+                    mask &= m
+            idx = numpy.flatnonzero(mask)
+            for name in COLUMNS:
+                parts[name].append(columns[name][idx])
+        if not parts['run']:
+            return dict((name, numpy.array([])) for name in COLUMNS)
+
+        out = dict((name, numpy.concatenate(parts[name])) for name in COLUMNS)
+        if decode:
+            out['ordering'] = numpy.asarray(self.tables['orderings'])[out['ordering']]
+            devices = numpy.asarray(self.tables['devices'])
+            out['sender'] = devices[out['sender']]
+            out['receiver'] = devices[out['receiver']]
+        return out
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Compact token_results into a columnar archive.')
+    parser.add_argument('action', choices=('ingest', 'query', 'heatmap'))
+    parser.add_argument('--src', '-s', type=str, default=SOURCE_DIR,
+                        help='Directory with the token results')
+    parser.add_argument('--archive', '-a', type=str, default=ARCHIVE_DIR,
+                        help='Directory of the archive')
+    parser.add_argument('--workers', '-w', type=int, default=None,
+                        help='Number of parser processes')
+    parser.add_argument('--ordering', '-o', type=str, nargs='*')
+    parser.add_argument('--payload', '-p', type=int, nargs='*')
+    parser.add_argument('--run', '-r', type=int, nargs='*')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    archive = TokenArchive(args.archive)
+
+    if args.action == 'ingest':
+        added = archive.ingest(args.src, args.workers)
+        print 'ingested', added, 'new or changed reports,', len(archive), \
+            'rows in total'
+        return
+
+    res = archive.query(args.ordering, args.payload, args.run)
+    if args.action == 'heatmap':
+        # every ordering of the campaign together fills the whole matrix
+        jobs = []
+        for payload in numpy.unique(res['payload']):
+            mask = res['payload'] == payload
+            data = analysis.hop_heatmap(
+                dict((name, res[name][mask]) for name in COLUMNS))
+            data['payload'] = int(payload)
+            jobs.append(resultstore.make_job(
+                'token_heatmap',
+                'token-archive-heatmap-{0}.png'.format(payload), data))
+        for dest in render.render_all(jobs, args.workers):
+            print dest
+        return
+
+    print len(res['run']), 'rows'
+    for i in xrange(len(res['run'])):
+        print ', '.join(str(res[name][i]) for name in COLUMNS)
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,659 @@
+import threading
+import time
+import numpy
+import requests
+
+import analysis
+import client
+import clocksync
+import histogram
+import manifest
+import matrix
+import poller
+import resultcache
+import resultstore
+import scheduler
+import sweep
+import timeseries
+import tracing
+
+results_cache = resultcache.ResultCache()
+# the live dashboard, when one was asked for
+live = None
+# clocksync.ClockTable of the run, None when clocks are not synced
+clocks = None
+
+THROUGHPUT_MANIFEST = 'throughput_manifest.json'
+N_MESSAGES = 40
+# reports of a pair asked for before it is left out of the matrix
+PAIR_ATTEMPTS = 5
+THROUGHPUT_RESOLUTION = 0.1  # kbit/s
+
+ADAPTIVE_DEFAULTS = dict(
+    batch=10,
+    min_iterations=10,
+    max_iterations=100,
+    ci_width=0.1,  # fraction of the mean
+    confidence=0.95,
+)
+
+
+def get_throughput_report(receiver, sender, cached=False, iterations=None,
+                          port=38080, batch=None):
+    url = 'http://{0}:{1}/throughput'.format(receiver['ip'], port)
+    params = dict(target=sender['mac'])
+    if iterations is not None:
+        params['iterations'] = iterations
+
+    timeout = client.launch_timeout(
+        (iterations or client.THROUGHPUT_ITERATIONS) * client.MESSAGE_SIZE)
+
+    def fetch():
+        tracing.count('requests_total', endpoint='throughput')
+        try:
+            return client.get(url, params=params, stream=True,
+                              timeout=timeout)
+        except requests.RequestException:
+            return None
+
+    key = dict(receiver=receiver['mac'], sender=sender['mac'],
+               iterations=iterations, port=port)
+    if batch is not None:
+        # successive batches of an adaptive measurement are different data
+        key['batch'] = batch
+    with tracing.span('get_throughput_report', receiver=receiver['name'],
+                      sender=sender['name'], batch=batch):
+        return results_cache.rows('throughput', key, fetch, cached)
+
+
+def publish(name, kind, data):
+    if live is not None:
+        live.update(name, kind, data)
+
+
+def report_status(key, text):
+    if live is not None:
+        live.set_status(key, text)
+
+
+def avg(l):
+    # None for no values at all, e.g. the links of a failed run
+    if len(l) == 0:
+        return None
+    return float(sum(l)) / len(l)
+
+
+def print_percentiles(label, h, unit):
+    print label + ':', histogram.format_summary(h, unit)
+
+
+def on_controller_clock(arr, devices, columns, kind, key, since,
+                        port=38080):
+    # a report fetched since `since`: estimate the clocks of devices once
+    # more, right after it, so every report lies between two estimates,
+    # and keep the estimates with the cached report. Offsets move, so a
+    # report from the cache is corrected with the estimates kept with it,
+    # or not at all
+    if clocks is None or not len(arr):
+        return arr
+    entry = results_cache.entry(kind, key)
+    if entry is not None and entry['created'] < since:
+        if 'clocks' not in entry:
+            print 'cached', kind, 'report has no clock estimates, its ' \
+                                  'timestamps are not corrected'
+            return arr
+        table = clocksync.ClockTable.from_snapshot(entry['clocks'])
+    else:
+        clocks.sync(devices, port, quiet=True)
+        table = clocks
+        results_cache.annotate(kind, key, clocks=clocks.snapshot(devices))
+    return analysis.correct_clocks(arr, columns, table.to_controller)
+
+
+@tracing.traced('bench_token')
+def bench_token(devices, payload_size=512, num_rounds=5,
+                dest_path='token.png', cache=False, port=38080):
+    print 'Running token benchmark:'
+    url = 'http://{0}:{1}/token'.format(devices[0]['ip'], port)
+    targets = map(lambda x: x['mac'], devices[1:])
+
+    def fetch():
+        tracing.count('requests_total', endpoint='token')
+        try:
+            r = client.get(url, params=dict(devices=targets,
+                                            payloadLength=payload_size,
+                                            rounds=num_rounds))
+        except requests.RequestException:
+            return None
+        uuid = r.content.strip()
+        print 'uuid: ', uuid
+
+        token_poller = poller.TokenPoller(workers=1, port=port)
+        try:
+            job = token_poller.submit(devices[0]['ip'], uuid, len(devices),
+                                      payload_size, num_rounds)
+            response = job.wait()
+        finally:
+            token_poller.close()
+
+        if not job.ok:
+            print 'token run', uuid, 'timed out after', job.polls, 'polls'
+            tracing.count('device_failures_total', device=devices[0]['name'])
+            return None
+        return response
+
+    key = dict(master=devices[0]['mac'], targets=targets,
+               payload_size=payload_size, rounds=num_rounds, port=port)
+    since = time.time()
+    rows = results_cache.rows('token', key, fetch, cache)
+    return on_controller_clock(analysis.load_token(rows), devices,
+                               analysis.TOKEN_CLOCKS, 'token', key, since,
+                               port)
+
+
+@tracing.traced('token_plot')
+def token_plot(devices, dest_path, cache=True, port=38080):
+    conns = []
+    rtts = []
+    measured = []
+    jobs = []
+    # the sleep is random by design, there is nothing to compare there
+    phases = [p for p in analysis.HOP_PHASES if p != 'sleep']
+    samples = dict(dict((p, {}) for p in phases), rtt={}, connection={})
+    histograms = dict(rtt={}, connection={})
+    names = dict((d['mac'], d['name']) for d in devices)
+    sizes = (512, 1024, 2048, 4096)
+    for l in sizes:
+        print 'testing with payload=', l
+        arr = bench_token(devices, l, 5, '', cache, port)
+        if not len(arr):
+            # timed out or could not be fetched, the size is left out
+            print 'token run with payload=', l, 'failed, skipping it'
+            report_status('token', 'payload={0} failed'.format(l))
+            continue
+        metrics = analysis.token_metrics(arr, l)
+        samples['rtt'][str(l)] = metrics['rtt'].tolist()
+        samples['connection'][str(l)] = metrics['connection'].tolist()
+        for m in histograms:
+            histograms[m][str(l)] = histogram.of(metrics[m])
+        print_percentiles('rtt, payload={0}'.format(l),
+                          histograms['rtt'][str(l)], ' ms')
+
+        # where the time of every hop goes, per link and per round
+        hops = analysis.token_hops(arr)
+        for p in phases:
+            samples[p][str(l)] = hops[p].tolist()
+        for kind, data in (('token_heatmap', analysis.hop_heatmap(arr)),
+                           ('token_timeline', analysis.hop_timeline(arr))):
+            if data is None:
+                continue
+            data['devices'] = [names.get(m, m) for m in data['devices']]
+            data['payload'] = l
+            jobs.append(resultstore.make_job(
+                kind, '{0}-{1}.png'.format(kind.replace('_', '-'), l), data))
+
+        # averages of rtt, connection and throughput per sender->receiver link
+        res = analysis.token_summary(arr, l)
+        conn_cost = avg([item['connection'] for item in res.itervalues()])
+        rtt = avg([item['rtt'] - item['connection'] for item in res.itervalues()])
+        measured.append(l)
+        conns.append(conn_cost)
+        rtts.append(rtt)
+        publish('token', 'token', dict(sizes=measured, conns=conns,
+                                       rtts=rtts))
+        report_status('token', '{0} of {1} payload sizes'.format(
+            len(measured), len(sizes)))
+
+    if not measured:
+        print 'no token run succeeded, nothing to plot'
+        return jobs
+    return [resultstore.make_job('token', dest_path, dict(
+        sizes=measured, conns=conns, rtts=rtts), samples,
+        histograms=histograms)] + jobs
+
+
+def measure_pair(receiver, sender, cache=False, port=38080):
+    # None when the pair could not be measured
+    r_name = receiver['name']
+    s_name = sender['name']
+
+    for attempt in xrange(PAIR_ATTEMPTS):
+        if not client.healthy(receiver['ip']):
+            break
+        print r_name, ' <- ', s_name
+
+        # get_throughput_report(receiver, sender, cache)  # warmup
+        # a retry asks the device, whatever the cache holds
+        report = get_throughput_report(receiver, sender,
+                                       cache and attempt == 0, port=port)
+
+        try:
+            rates = analysis.throughput_rates(
+                analysis.load_throughput(report))
+        except requests.RequestException:
+            rates = numpy.array([])
+        stats = analysis.describe(rates)
+
+        if stats is not None:
+            mean, lo, hi, std = stats
+            print r_name, ' <- ', s_name, 'DONE.'
+            return (mean, lo, hi), (mean, std), rates.tolist()
+
+        print r_name, ' <- ', s_name, 'FAILED. Retrying'
+        tracing.count('retries_total', operation='throughput')
+        time.sleep(client.backoff(attempt))
+
+    print r_name, ' <- ', s_name, 'GAVE UP.'
+    return None
+
+
+def measure_pair_adaptive(receiver, sender, cache=False, port=38080,
+                          adaptive=None):
+    # keep asking for batches until the bootstrap CI of the mean is at most
+    # ci_width * mean wide, within the min/max iteration budget
+    r_name = receiver['name']
+    s_name = sender['name']
+    adaptive = dict(ADAPTIVE_DEFAULTS, **(adaptive or {}))
+
+    samples = numpy.array([])
+    ci = None
+    batch = 0
+    failures = 0
+    while len(samples) < adaptive['max_iterations']:
+        if failures >= PAIR_ATTEMPTS or not client.healthy(receiver['ip']):
+            break
+        print r_name, ' <- ', s_name, 'batch', batch, \
+            '({0} samples)'.format(len(samples))
+        report = get_throughput_report(receiver, sender, cache,
+                                       adaptive['batch'], port, batch)
+        try:
+            rates = analysis.throughput_rates(analysis.load_throughput(report))
+        except requests.RequestException:
+            rates = numpy.array([])
+        batch += 1
+
+        if not len(rates):
+            print r_name, ' <- ', s_name, 'FAILED. Retrying'
+            tracing.count('retries_total', operation='throughput')
+            time.sleep(client.backoff(failures))
+            failures += 1
+            continue
+        failures = 0
+        samples = numpy.concatenate((samples, rates))
+
+        if len(samples) < adaptive['min_iterations']:
+            continue
+        ci = analysis.bootstrap_ci(samples, adaptive['confidence'])
+        if ci is not None and \
+                ci[1] - ci[0] <= adaptive['ci_width'] * samples.mean():
+            break
+
+    if not len(samples):
+        print r_name, ' <- ', s_name, 'GAVE UP.'
+        return None
+    mean, lo, hi, std = analysis.describe(samples)
+    if ci is None:
+        ci = (mean, mean)
+    print r_name, ' <- ', s_name, 'DONE. {0} samples, CI [{1:.1f}, {2:.1f}]'\
+        .format(len(samples), ci[0], ci[1])
+    return (mean, lo, hi), (mean, std, ci[0], ci[1]), samples.tolist()
+
+
+def pair_unit_id(receiver, sender, iterations=None):
+    return 'throughput/{0}/{1}/{2}'.format(
+        receiver['mac'], sender['mac'], iterations or 'default')
+
+
+def measure_planned_pair(campaign_manifest, receiver, sender, cache=False,
+                         port=38080, adaptive=None):
+    unit_id = pair_unit_id(receiver, sender, adaptive and 'adaptive')
+    campaign_manifest.start(unit_id)
+    with tracing.span('measure_pair', receiver=receiver['name'],
+                      sender=sender['name']):
+        if adaptive is None:
+            result = measure_pair(receiver, sender, cache, port)
+        else:
+            result = measure_pair_adaptive(receiver, sender, cache, port,
+                                           adaptive)
+    # a failed pair stays in the manifest, to be retried on resume
+    campaign_manifest.finish(unit_id, result is not None,
+                             result and list(result))
+    return result
+
+
+@tracing.traced('bench_throughput')
+def bench_throughput(devices, dest_path, cache=False, concurrency=None,
+                     port=38080, manifest_path=THROUGHPUT_MANIFEST,
+                     adaptive=None, matrix_path=matrix.MATRIX_PATH,
+                     incremental=None):
+    # incremental: dict(max_age, max_cv, changed) to only measure the pairs
+    # the matrix has no fresh, quiet result of; None measures them all
+    print 'Running throughput benchmark:'
+    results = {}
+    results_stddev = {}
+    samples = {}
+    histograms = {}
+
+    pairs = [(r, s) for r in xrange(len(devices))
+             for s in xrange(len(devices)) if r != s]
+    throughput_matrix = matrix.ThroughputMatrix(matrix_path)
+    reused = {}
+    if incremental is not None:
+        for r, s in pairs:
+            why = throughput_matrix.why_stale(devices[r], devices[s],
+                                              **incremental)
+            if why is None:
+                reused[(r, s)] = throughput_matrix.result(devices[r],
+                                                          devices[s])
+            else:
+                print devices[r]['name'], ' <- ', devices[s]['name'], \
+                    'to measure:', why
+        print 'Incremental: {0} of {1} pairs up to date, measuring {2}'.format(
+            len(reused), len(pairs), len(pairs) - len(reused))
+        pairs = [p for p in pairs if p not in reused]
+        # a report from the cache is exactly what is being replaced
+        cache = False
+
+    units = dict((pair_unit_id(devices[r], devices[s],
+                               adaptive and 'adaptive'), (r, s))
+                 for r, s in pairs)
+    campaign_manifest = manifest.Manifest(manifest_path)
+    campaign_manifest.plan([(u, dict(receiver=devices[r]['mac'],
+                                     sender=devices[s]['mac'],
+                                     iterations=adaptive))
+                            for u, (r, s) in units.iteritems()])
+
+    # pairs measured by an interrupted run are not measured again
+    measured = {}
+    for u, pair in units.iteritems():
+        if not campaign_manifest.todo([u]):
+            result = campaign_manifest.result(u)
+            # manifests written before samples were kept have none
+            rates = result[2] if len(result) > 2 else []
+            measured[pair] = (tuple(result[0]), tuple(result[1]), rates)
+    if measured:
+        print 'Resuming: {0} of {1} pairs already measured'.format(
+            len(measured), len(units))
+    measured.update(reused)
+
+    # the dashboard gets the partial matrix after every pair
+    partial = {}
+    lock = threading.Lock()
+
+    def update_live(r, s, values):
+        with lock:
+            partial.setdefault(devices[r]['name'], {})[devices[s]['name']] = \
+                values
+            publish('throughput', 'throughput', partial)
+            report_status('throughput', '{0} of {1} pairs'.format(
+                sum(len(v) for v in partial.itervalues()),
+                len(units) + len(reused)))
+
+    for (r, s), result in measured.iteritems():
+        update_live(r, s, result[0])
+
+    def measure(r, s):
+        result = measure_planned_pair(
+            campaign_manifest, devices[r], devices[s], cache, port, adaptive)
+        if result is not None:
+            throughput_matrix.update(devices[r], devices[s], result)
+            update_live(r, s, result[0])
+        return result
+
+    # pairs sharing no device run concurrently, one round at a time
+    rounds = [[p for p in r if p not in measured]
+              for r in scheduler.directed_rounds(len(devices))]
+    measured.update(scheduler.run_rounds(
+        [r for r in rounds if r], tracing.bind(measure), concurrency))
+
+    if campaign_manifest.complete(units.keys()):
+        campaign_manifest.remove()
+
+    failed = sorted(pair for pair, result in measured.iteritems()
+                    if result is None)
+    for r, s in failed:
+        entry = throughput_matrix.get(devices[r], devices[s])
+        if incremental is not None and entry is not None:
+            print devices[r]['name'], ' <- ', devices[s]['name'], \
+                'could not be measured, keeping the result of', \
+                time.strftime('%Y-%m-%d %H:%M',
+                              time.localtime(entry['measured']))
+            measured[(r, s)] = throughput_matrix.result(devices[r],
+                                                        devices[s])
+            continue
+        print devices[r]['name'], ' <- ', devices[s]['name'], \
+            'left out, it could not be measured'
+        del measured[(r, s)]
+
+    for (r, s), (values, stddev, rates) in measured.iteritems():
+        r_name = devices[r]['name']
+        s_name = devices[s]['name']
+
+        if r_name not in results:
+            results[r_name] = {}
+            results_stddev[r_name] = {}
+
+        results[r_name][s_name] = values
+        results_stddev[r_name][s_name] = stddev
+        samples[r_name + '<-' + s_name] = rates
+        histograms[r_name + '<-' + s_name] = histogram.of(
+            rates, resolution=THROUGHPUT_RESOLUTION)
+
+    # every link together, from the histograms alone
+    if histograms:
+        print_percentiles('throughput, all links',
+                          histogram.merged(histograms.itervalues()),
+                          ' kbit/s')
+    return [
+        resultstore.make_job('throughput', dest_path, results,
+                             dict(throughput=samples),
+                             histograms=dict(throughput=histograms)),
+        resultstore.make_job('throughput', 'throughput-stdvar.png',
+                             results_stddev)
+    ]
+
+
+@tracing.traced('plot_throughput_over_time')
+def plot_throughput_over_time(device1, device2, cache=False, port=38080,
+                              iterations=None, window=None):
+    jobs = []
+    for sender, receiver in ((device1, device2), (device2, device1)):
+        print receiver['name'], ' <- ', sender['name']
+
+        report = get_throughput_report(receiver, sender, cache, iterations,
+                                       port)
+        arr = analysis.load_throughput(report)
+        rates = analysis.throughput_rates(arr).tolist()
+        series = timeseries.throughput_series(arr, window)
+        for start, end in series['stalls']:
+            print receiver['name'], ' <- ', sender['name'], \
+                'stalled from {0:.1f} s to {1:.1f} s'.format(start, end)
+
+        dest_path = 'throughput-over-time-{0}-{1}.png'.format(
+            receiver['name'].replace(' ', '_'), sender['name'].replace(' ', '_'))
+        data = dict(series, receiver=receiver['name'], sender=sender['name'])
+        publish(dest_path[:-len('.png')], 'throughput_over_time', data)
+        jobs.append(resultstore.make_job(
+            'throughput_over_time', dest_path, data,
+            dict(throughput={receiver['name'] + '<-' + sender['name']: rates})))
+    return jobs
+
+
+def messages_data(results):
+    devices = sorted(results)
+    return dict(
+        rtts=[results[i]['rtts'].mean() for i in devices],
+        msgs_per_sec=[results[i]['received_msgs'] / results[i]['timespan'] for i in devices],
+        devices=devices
+    )
+
+
+def get_messages_report(master, targets, n_messages=N_MESSAGES, size=None,
+                        cache=False, port=38080):
+    url = 'http://{0}:{1}/messages'.format(master['ip'], port)
+    vars = dict(
+        target=[d['mac'] for d in targets],
+        messages=n_messages
+    )
+    if size is not None:
+        vars['size'] = size
+    # the targets share the master's radio
+    timeout = client.launch_timeout(
+        n_messages * (size or client.MESSAGE_SIZE) * len(targets))
+
+    def fetch():
+        print url
+        print targets
+
+        tracing.count('requests_total', endpoint='messages')
+        try:
+            r = client.get(url, params=vars, stream=True, timeout=timeout)
+        except requests.RequestException:
+            return None
+        print r.url
+        return r
+
+    return results_cache.rows(
+        'messages', messages_key(master, targets, n_messages, size, port),
+        fetch, cache)
+
+
+def messages_key(master, targets, n_messages=N_MESSAGES, size=None,
+                 port=38080):
+    return dict(master=master['mac'], targets=[d['mac'] for d in targets],
+                messages=n_messages, size=size, port=port)
+
+
+@tracing.traced('get_messages_per_sec_throughput')
+def get_messages_per_sec_throughput(devices, dest_path, cache=False,
+                                    port=38080, n_messages=N_MESSAGES,
+                                    size=None):
+    assert len(devices) >= 2, 'Need at least two devices'
+
+    master = devices[0]
+    others = devices[1:]
+    results = {}
+    samples = dict(rtt={}, conn_cost_approx={})
+    # conn_cost_approx mixes two clocks and can still be negative when
+    # they are not synced, rtt can not
+    histograms = dict(rtt={})
+
+    for i in range(1, len(others) + 1):
+        targets = others[:i]
+        print targets
+
+        since = time.time()
+        res = get_messages_report(master, targets, n_messages, size, cache,
+                                  port)
+
+        # from, to, message_size, started, received, finished
+        # % msg persi, RTT (finished-started), conn cost approx (rec - started)
+        arr = on_controller_clock(
+            analysis.load_messages(res), [master] + targets,
+            analysis.MESSAGES_CLOCKS, 'messages',
+            messages_key(master, targets, n_messages, size, port), since,
+            port)
+        summary = analysis.messages_summary(arr)
+        if summary is None:
+            # nothing came back (the report could not be fetched)
+            print 'messages to {0} targets failed, skipping them'.format(i)
+            report_status('messages', '{0} targets failed'.format(i))
+            continue
+        received = summary['received']
+
+        if i not in results:
+            results[i] = {}
+        print 'first: ', summary['first'], ' , second: ', summary['last']
+        results[i]['timespan'] = summary['timespan']
+        results[i]['rtts'] = summary['rtts']
+        results[i]['conn_cost_approx'] = summary['conn_cost_approx']
+        samples['rtt'][str(i)] = summary['rtts'].tolist()
+        samples['conn_cost_approx'][str(i)] = \
+            summary['conn_cost_approx'].tolist()
+        histograms['rtt'][str(i)] = histogram.of(summary['rtts'])
+        print_percentiles('rtt, {0} targets'.format(i),
+                          histograms['rtt'][str(i)], ' ms')
+        results[i]['received_msgs_rate'] = \
+            received * 100.0 / (n_messages * len(targets))
+        results[i]['received_msgs'] = float(received) / len(targets)
+
+        publish('messages', 'messages', messages_data(results))
+        report_status('messages', '{0} of {1} targets'.format(i, len(others)))
+
+    # print results
+
+
+    # fig = double_bar_plot(
+    #     [avg(results[i]['rtts']) for i in range(1, len(others) + 1)],
+    #     [avg(results[i]['conn_cost_approx']) for i in range(1, len(others) + 1)],
+    #     'Round trip time (ms)',
+    #     'Number of devices',
+    #     range(1, len(others) + 1),
+    #     'Average message round trip time',
+    #     'Cost of connection establishment (approx.)'
+    # )
+
+    return [resultstore.make_job('messages', dest_path,
+                                 messages_data(results), samples,
+                                 histograms=histograms)]
+
+
+@tracing.traced('bench_messages_sweep')
+def bench_messages_sweep(devices, dest_path, cache=False, port=38080,
+                         counts=sweep.COUNTS, sizes=sweep.SIZES, fanouts=None,
+                         masters=1, concurrency=None):
+    print 'Running messages sweep:'
+    assert len(devices) >= 2, 'Need at least two devices'
+    by_mac = dict((d['mac'], d) for d in devices)
+    configs = sweep.plan(devices, counts, sizes, fanouts, masters)
+    lock = threading.Lock()
+    results = {}
+
+    def measure(master, targets, count, size):
+        tag = '{0} -> {1} targets, {2} x {3} B'.format(
+            by_mac[master]['name'], len(targets), count, size)
+        print tag
+        rows = get_messages_report(by_mac[master],
+                                   [by_mac[m] for m in targets],
+                                   count, size, cache, port)
+        m = sweep.measure(analysis.load_messages(rows))
+        if m['rate'] is None:
+            print tag, 'FAILED, left out of the fit'
+        else:
+            print tag, 'DONE. {0} received, {1:.2f} msgs/s'.format(
+                m['received'], m['rate'])
+
+        with lock:
+            results[(master, targets, count, size)] = m
+            report_status('messages sweep', '{0} of {1} configurations'.format(
+                len(results), len(configs)))
+        return m
+
+    # configurations sharing no device (other masters) run together
+    scheduler.run_rounds(sweep.waves(configs), tracing.bind(measure),
+                         concurrency)
+
+    series = sweep.curves(results)
+    for s in series:
+        s['master'] = by_mac[s['master']]['name']
+        fit = s['fit']
+        if fit is None:
+            peak = 'not enough fan-outs to fit'
+        elif fit['peak'] is None:
+            peak = 'no saturation'
+        else:
+            peak = 'saturates at {0:.1f} targets ({1:.1f} msgs/s){2}'.format(
+                fit['peak'], fit['peak_rate'],
+                '' if fit['saturated'] else ', beyond the measured range')
+        if s['failed']:
+            peak += ', failed with {0} targets'.format(
+                ', '.join(map(str, s['failed'])))
+        print '{0}, {1} x {2} B: {3}'.format(s['master'], s['messages'],
+                                             s['size'], peak)
+
+    samples = dict(rtt=dict(
+        ('{0}-{1}x{2}-{3}'.format(by_mac[c[0]]['name'], c[2], c[3],
+                                  len(c[1])), m['rtts'])
+        for c, m in results.iteritems()))
+    return [resultstore.make_job('messages_sweep', dest_path,
+                                 dict(series=series), samples)]
@@ -0,0 +1,150 @@
+import itertools
+import threading
+import time
+import traceback
+
+
+def split_rings(devices, ring_size):
+    # disjoint rings of ring_size devices, leftovers join the last ring
+    if ring_size is None or ring_size >= len(devices):
+        return [list(devices)]
+    rings = [list(devices[i:i + ring_size])
+             for i in xrange(0, len(devices), ring_size)]
+    if len(rings) > 1 and len(rings[-1]) < 2:
+        rings[-2].extend(rings.pop())
+    return rings
+
+
+def ordering_name(devices):
+    return '_'.join([d['name'].replace('/', '_').replace(' ', '')
+                     for d in devices])
+
+
+def unit_id(devices, payload_length):
+    return '{0}/{1}'.format(ordering_name(devices), payload_length)
+
+
+def ring_tests(ring, payload_lengths):
+    # every ordering of the ring with every payload length
+    permutations = list(itertools.permutations(ring))
+    return [(ds, pl) for pl in payload_lengths for ds in permutations]
+
+
+class DeviceLocks(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.locks = {}
+
+    def _get(self, mac):
+        with self.lock:
+            return self.locks.setdefault(mac, threading.Lock())
+
+    def acquire(self, devices):
+        # always in the same order, so overlapping rings can't deadlock
+        for mac in sorted(set(d['mac'] for d in devices)):
+            self._get(mac).acquire()
+
+    def release(self, devices):
+        for mac in sorted(set(d['mac'] for d in devices), reverse=True):
+            self._get(mac).release()
+
+
+class Progress(object):
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    def update(self, ok):
+        with self.lock:
+            self.done += 1
+            if not ok:
+                self.failed += 1
+            return self.done, self.failed, self.eta()
+
+    def eta(self):
+        if not self.done:
+            return None
+        elapsed = time.time() - self.started
+        return elapsed / self.done * (self.total - self.done)
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return '?'
+    m, s = divmod(int(seconds), 60)
+    h, m = divmod(m, 60)
+    return '{0}:{1:02d}:{2:02d}'.format(h, m, s)
+
+
+class CampaignRunner(object):
+    def __init__(self, rings, payload_lengths, run_test, manifest,
+                 on_progress=None, units=None, keep_manifest=False):
+        # run_test(ring_id, devices, payload_length, previous_result) ->
+        # (ok, result); units already done in the manifest are skipped.
+        # on_progress(ring_id, done, failed, eta) follows every test.
+        # units restricts the tests of the rings to these unit ids (a
+        # shard's part of the campaign); keep_manifest keeps a finished
+        # manifest around, e.g. for shard.py merge
+        self.rings = rings
+        self.payload_lengths = payload_lengths
+        self.run_test = run_test
+        self.manifest = manifest
+        self.on_progress = on_progress
+        self.keep_manifest = keep_manifest
+        self.locks = DeviceLocks()
+
+        tests = [[(ds, pl) for ds, pl in ring_tests(ring, payload_lengths)
+                  if units is None or unit_id(ds, pl) in units]
+                 for ring in rings]
+        self.unit_ids = [unit_id(ds, pl) for t in tests for ds, pl in t]
+        manifest.plan([(unit_id(ds, pl), dict(
+            ordering=[d['mac'] for d in ds], payload_length=pl))
+            for t in tests for ds, pl in t])
+
+        self.tests = [[(ds, pl) for ds, pl in t
+                       if manifest.todo([unit_id(ds, pl)])] for t in tests]
+        self.progress = Progress(sum(len(t) for t in self.tests))
+
+    def _run_ring(self, ring_id):
+        for ds, pl in self.tests[ring_id]:
+            uid = unit_id(ds, pl)
+            self.locks.acquire(ds)
+            try:
+                self.manifest.start(uid)
+                previous = self.manifest.result(uid)
+                try:
+                    ok, result = self.run_test(ring_id, ds, pl, previous)
+                except Exception:
+                    # a test that blew up failed, the ring goes on
+                    print '[ring {0}] {1} failed with an error:'.format(
+                        ring_id, uid)
+                    traceback.print_exc()
+                    ok, result = False, previous
+                self.manifest.finish(uid, ok, result)
+            finally:
+                self.locks.release(ds)
+
+            done, failed, eta = self.progress.update(ok)
+            print '[ring {0}] {1} of {2} done, {3} failed, ETA {4}'.format(
+                ring_id, done, self.progress.total, failed, format_eta(eta))
+            if self.on_progress is not None:
+                self.on_progress(ring_id, done, failed, eta)
+
+    def run(self):
+        threads = [threading.Thread(target=self._run_ring, args=(i,))
+                   for i in xrange(len(self.rings))]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        # join with a timeout so ^C still reaches the main thread
+        while any(t.is_alive() for t in threads):
+            for t in threads:
+                t.join(1)
+
+        if self.manifest.complete(self.unit_ids) and not self.keep_manifest:
+            # nothing left to resume, the next run is a new campaign
+            self.manifest.remove()
+        return self.progress
@@ -0,0 +1,200 @@
+import random
+import threading
+import time
+import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import tracing
+
+CONNECT_TIMEOUT = 3.0  # s
+# reports are streamed as the device writes them, but a benchmark can keep
+# a device busy for minutes before the first byte
+READ_TIMEOUT = 600.0  # s
+RETRIES = 3
+BACKOFF_BASE = 0.5  # s
+BACKOFF_MAX = 30.0  # s
+POOL_SIZE = 8  # connections kept alive per device
+# consecutive failures after which a device is given up on for a while
+FAILURE_THRESHOLD = 3
+RESET_TIMEOUT = 60.0  # s, before a given up device is tried again
+
+# only these can be sent again whatever happened to the first request
+IDEMPOTENT = ('mac', 'tokres', 'time')
+# the others start a benchmark: sent twice it runs twice, so they are only
+# retried when the connection failed. They answer when the benchmark is
+# over, so their read timeout is scaled to the bytes it moves, see
+# launch_timeout; /token answers with its uuid right away
+MESSAGE_SIZE = 2 * 1000 * 1024  # bytes, of /throughput and /messages
+THROUGHPUT_ITERATIONS = 10  # BenchService's default
+MIN_LINK_RATE = 250.0  # kbit/s, slower than any working link
+LAUNCH_SLACK = 60.0  # s, connecting and setting up, on top of the transfer
+
+
+def launch_timeout(total_bytes):
+    # read timeout of a benchmark moving total_bytes over bluetooth
+    return LAUNCH_SLACK + total_bytes * 8 / 1000.0 / MIN_LINK_RATE
+
+
+# for a request that leaves everything to BenchService's defaults
+LAUNCH_READ_TIMEOUTS = dict(
+    throughput=launch_timeout(THROUGHPUT_ITERATIONS * MESSAGE_SIZE),
+    messages=launch_timeout(MESSAGE_SIZE),
+    token=60.0,
+)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class DeviceUnavailable(requests.ConnectionError):
+    # the device's circuit is open, nothing was sent
+    pass
+
+
+def backoff(attempt, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    # full jitter: anywhere up to the exponential delay, so devices that
+    # failed together don't come back in lockstep
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class CircuitBreaker(object):
+    # closed: requests go through. After threshold consecutive failures
+    # it opens and requests fail at once; reset_timeout later a single
+    # request is let through (half-open) and decides which way it goes
+
+    def __init__(self, threshold=FAILURE_THRESHOLD,
+                 reset_timeout=RESET_TIMEOUT):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = None
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.state == OPEN and \
+                    time.time() - self.opened >= self.reset_timeout:
+                self.state = HALF_OPEN
+                return True
+            return self.state == CLOSED
+
+    def success(self):
+        with self.lock:
+            self.state = CLOSED
+            self.failures = 0
+
+    def failure(self):
+        # True when this failure opened the circuit
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and
+                                           self.failures >= self.threshold):
+                self.state = OPEN
+                self.opened = time.time()
+                return True
+            return False
+
+    @property
+    def healthy(self):
+        return self.state != OPEN
+
+
+class Client(object):
+    # one keep-alive session per device, timeouts on every request,
+    # retries with backoff and a circuit breaker per device; devices are
+    # told apart by host, whatever the port
+
+    def __init__(self, connect_timeout=CONNECT_TIMEOUT,
+                 read_timeout=READ_TIMEOUT, retries=RETRIES,
+                 threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.sessions = {}
+        self.breakers = {}
+        self.lock = threading.Lock()
+
+    def session(self, host):
+        with self.lock:
+            session = self.sessions.get(host)
+            if session is None:
+                session = self.sessions[host] = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1,
+                                      pool_maxsize=POOL_SIZE, max_retries=0)
+                session.mount('http://', adapter)
+            return session
+
+    def breaker(self, host):
+        with self.lock:
+            breaker = self.breakers.get(host)
+            if breaker is None:
+                breaker = self.breakers[host] = CircuitBreaker(
+                    self.threshold, self.reset_timeout)
+            return breaker
+
+    def healthy(self, host):
+        with self.lock:
+            breaker = self.breakers.get(host)
+        return breaker is None or breaker.healthy
+
+    def unhealthy(self):
+        with self.lock:
+            return sorted(h for h, b in self.breakers.iteritems()
+                          if not b.healthy)
+
+    def get(self, url, params=None, stream=False, timeout=None, retries=None):
+        # the response, whatever its status; network errors are retried
+        # (for a benchmark only when it never reached the device), the last
+        # one is raised (DeviceUnavailable when the circuit is open)
+        parsed = urlparse.urlparse(url)
+        host = parsed.hostname
+        endpoint = parsed.path.strip('/')
+        breaker = self.breaker(host)
+        session = self.session(host)
+        retries = self.retries if retries is None else retries
+        idempotent = endpoint in IDEMPOTENT
+        if timeout is None and endpoint in LAUNCH_READ_TIMEOUTS:
+            timeout = (self.timeout[0], LAUNCH_READ_TIMEOUTS[endpoint])
+        elif timeout is not None and not isinstance(timeout, tuple):
+            timeout = (min(self.timeout[0], timeout), timeout)
+
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                raise DeviceUnavailable('{0} is unhealthy'.format(host))
+            try:
+                r = session.get(url, params=params, stream=stream,
+                                timeout=timeout or self.timeout)
+            except requests.RequestException as e:
+                tracing.count('device_failures_total', device=host)
+                if breaker.failure():
+                    print host, 'is not responding, giving up on it for', \
+                        '{0:.0f} s'.format(breaker.reset_timeout)
+                    tracing.count('circuit_open_total', device=host)
+                # a ConnectTimeout is a ConnectionError, a ReadTimeout is not
+                if attempt >= retries or not breaker.healthy or not (
+                        idempotent or isinstance(e, requests.ConnectionError)):
+                    raise
+                tracing.count('retries_total', operation=endpoint)
+                time.sleep(backoff(attempt))
+                attempt += 1
+                continue
+            breaker.success()
+            return r
+
+    def close(self):
+        with self.lock:
+            for session in self.sessions.itervalues():
+                session.close()
+            self.sessions = {}
+
+
+client = Client()
+get = client.get
+healthy = client.healthy
+unhealthy = client.unhealthy
@@ -0,0 +1,168 @@
+import json
+import os
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+import numpy
+import requests
+
+import client
+import tracing
+
+CLOCKS_PATH = 'clocks.json'
+EXCHANGES = 8  # per estimate, the one with the shortest round trip wins
+TIMEOUT = 2  # s
+MAX_WORKERS = 32
+
+
+def now_ms():
+    return time.time() * 1000.0
+
+
+def exchange(ip, port=38080, timeout=TIMEOUT):
+    # (sent, device clock, back) with sent and back on the controller's
+    # clock; None when the device has no /time (an older app)
+    url = 'http://{0}:{1}/time'.format(ip, port)
+    sent = now_ms()
+    r = client.get(url, timeout=timeout, retries=0)
+    back = now_ms()
+    if r.status_code != 200:
+        return None
+    return sent, float(r.content.strip()), back
+
+
+def estimate(ip, port=38080, exchanges=EXCHANGES):
+    # NTP-style: the device read its clock somewhere during the round
+    # trip, at its middle give or take delay / 2; the shortest round trip
+    # bounds the error best
+    samples = []
+    for _ in xrange(exchanges):
+        tracing.count('requests_total', endpoint='time')
+        try:
+            sample = exchange(ip, port)
+        except (requests.RequestException, ValueError):
+            continue
+        if sample is None:
+            return None
+        samples.append(sample)
+    if not samples:
+        return None
+
+    sent, device_time, back = min(samples, key=lambda s: s[2] - s[0])
+    return dict(at=(sent + back) / 2, offset=device_time - (sent + back) / 2,
+                delay=back - sent)
+
+
+class ClockTable(object):
+    # offsets of the device clocks against the controller's one, estimated
+    # now and then during a run; in between the offset is interpolated, so
+    # two estimates also correct the drift, once they are far enough apart
+    # for it to stand out of their errors. Devices are found by mac or
+    # name, the reports use both
+
+    def __init__(self):
+        self.estimates = {}  # mac: [estimate, ...] by time
+        self.macs = {}
+        self.lock = threading.Lock()
+
+    def add(self, device, e):
+        with self.lock:
+            self.macs[device['name']] = device['mac']
+            self.macs[device['mac']] = device['mac']
+            self.estimates.setdefault(device['mac'], []).append(e)
+            self.estimates[device['mac']].sort(key=lambda x: x['at'])
+
+    def sync(self, devices, port=38080, quiet=False):
+        # devices that don't answer keep their previous estimates, if any
+        if not devices:
+            return
+        pool = ThreadPool(min(MAX_WORKERS, len(devices)))
+        try:
+            with tracing.span('clock_sync', devices=len(devices)):
+                found = pool.map(tracing.bind(
+                    lambda d: estimate(d['ip'], port)), devices)
+        finally:
+            pool.close()
+            pool.join()
+
+        for device, e in zip(devices, found):
+            if e is None:
+                print device['name'], 'did not tell its time, its ' \
+                                      'timestamps are not corrected'
+                continue
+            self.add(device, e)
+            if not quiet:
+                print '{0}: clock offset {1:+.1f} ms (+-{2:.1f}), ' \
+                      'drift {3}'.format(device['name'], e['offset'],
+                                         e['delay'] / 2,
+                                         self.format_drift(device['mac']))
+
+    def snapshot(self, devices):
+        # the estimates of devices, to correct their reports with later
+        with self.lock:
+            return dict((d['mac'], dict(
+                name=d['name'], estimates=list(self.estimates[d['mac']])))
+                        for d in devices if d['mac'] in self.estimates)
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        table = cls()
+        for mac, entry in snapshot.iteritems():
+            for e in entry['estimates']:
+                table.add(dict(name=entry['name'], mac=mac), e)
+        return table
+
+    def offset(self, device, t):
+        # offset of device's clock when it read t, 0 if it was never
+        # estimated. Without a measurable drift it is the offset of the
+        # most accurate estimate, otherwise it is interpolated (constant
+        # before the first and after the last estimate)
+        mac = self.macs.get(device)
+        with self.lock:
+            estimates = list(self.estimates.get(mac, []))
+        if not estimates:
+            return numpy.zeros_like(t, dtype=numpy.float64)
+        if self.drift(mac) is None:
+            best = min(estimates, key=lambda e: e['delay'])
+            return numpy.full_like(t, best['offset'], dtype=numpy.float64)
+        ats = [e['at'] + e['offset'] for e in estimates]
+        return numpy.interp(t, ats, [e['offset'] for e in estimates])
+
+    def to_controller(self, device, t):
+        t = numpy.asarray(t, dtype=numpy.float64)
+        return t - self.offset(device, t)
+
+    def drift(self, mac):
+        # ppm between the first and the last estimate; None when the two
+        # offsets are too close in time to tell a drift from their errors
+        # (+- delay / 2 each), e.g. over a short run
+        with self.lock:
+            estimates = self.estimates.get(mac, [])
+            if len(estimates) < 2:
+                return None
+            first, last = estimates[0], estimates[-1]
+        window = last['at'] - first['at']
+        if window <= 0:
+            return None
+        drift = (last['offset'] - first['offset']) / window
+        if abs(drift) <= (first['delay'] + last['delay']) / 2 / window:
+            return None
+        return drift * 10 ** 6
+
+    def format_drift(self, mac):
+        drift = self.drift(mac)
+        return 'not measurable yet' if drift is None else \
+            '{0:+.1f} ppm'.format(drift)
+
+    def save(self, path=CLOCKS_PATH):
+        with self.lock:
+            data = dict((mac, dict(estimates=estimates))
+                        for mac, estimates in self.estimates.iteritems())
+        for mac in data:
+            data[mac]['drift'] = self.drift(mac)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.rename(tmp_path, path)
+        return path
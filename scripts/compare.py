@@ -0,0 +1,150 @@
+import argparse
+import json
+import sys
+
+import numpy
+from scipy.stats import mannwhitneyu
+
+import resultstore
+
+ALPHA = 0.05
+# |Cliff's delta| below this is a negligible or small difference
+MIN_EFFECT = 0.33
+MIN_SAMPLES = 3
+
+# +1: higher is better, -1: lower is better
+DIRECTIONS = {
+    'throughput': 1,
+    'rtt': -1,
+    'connection': -1,
+    'conn_cost_approx': -1,
+    'connect': -1,
+    'transfer': -1,
+    'response': -1,
+}
+
+
+def load_samples(results_dir):
+    # {(figure, metric, key): values} of every result in results_dir
+    samples = {}
+    for path in resultstore.job_paths(results_dir):
+        job = resultstore.load_job(path)
+        figure = resultstore.job_name(path)
+        for metric, values in job.get('samples', {}).iteritems():
+            for key, v in values.iteritems():
+                samples[(figure, metric, key)] = numpy.asarray(
+                    v, dtype=numpy.float64)
+    return samples
+
+
+def cliffs_delta(current, baseline):
+    # P(current > baseline) - P(current < baseline), in O(n log n)
+    baseline = numpy.sort(baseline)
+    below = numpy.searchsorted(baseline, current, 'left').sum()
+    above = (len(baseline) -
+             numpy.searchsorted(baseline, current, 'right')).sum()
+    return float(below - above) / (len(current) * len(baseline))
+
+
+def compare_samples(current, baseline, direction, alpha=ALPHA,
+                    min_effect=MIN_EFFECT):
+    # dict(p, delta, change, verdict) with verdict one of 'regression',
+    # 'improvement', 'same' or 'n/a' (too few samples to say)
+    result = dict(n=len(current), n_baseline=len(baseline), p=None,
+                  delta=None, change=None, verdict='n/a')
+    if len(current) < MIN_SAMPLES or len(baseline) < MIN_SAMPLES:
+        return result
+
+    result['delta'] = cliffs_delta(current, baseline)
+    median = numpy.median(baseline)
+    if median:
+        result['change'] = numpy.median(current) / median - 1
+    try:
+        _, result['p'] = mannwhitneyu(current, baseline,
+                                      alternative='two-sided')
+    except ValueError:
+        # every value identical in both samples
+        result['p'] = 1.0
+
+    result['verdict'] = 'same'
+    if result['p'] < alpha and abs(result['delta']) >= min_effect:
+        better = result['delta'] * direction > 0
+        result['verdict'] = 'improvement' if better else 'regression'
+    return result
+
+
+def compare(current, baseline, alpha=ALPHA, min_effect=MIN_EFFECT):
+    results = []
+    for name in sorted(set(current) & set(baseline)):
+        figure, metric, key = name
+        direction = DIRECTIONS.get(metric, 1)
+        result = compare_samples(current[name], baseline[name], direction,
+                                 alpha, min_effect)
+        results.append(dict(result, figure=figure, metric=metric, key=key))
+    return results
+
+
+def format_result(r):
+    if r['verdict'] == 'n/a':
+        return '{figure} {metric} {key}: not enough samples ' \
+               '({n} vs {n_baseline})'.format(**r)
+    change = '?' if r['change'] is None else \
+        '{0:+.1%}'.format(r['change'])
+    return '{figure} {metric} {key}: {0} median, delta {delta:+.2f}, ' \
+           'p {p:.3g} -> {1}'.format(change, r['verdict'].upper()
+                                     if r['verdict'] == 'regression'
+                                     else r['verdict'], **r)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Compare results with a baseline and fail on '
+                    'regressions.')
+
+    parser.add_argument('baseline', metavar='BASELINE',
+                        help='Results directory of the baseline')
+
+    parser.add_argument('current', metavar='CURRENT', nargs='?',
+                        default=resultstore.RESULTS_DIR,
+                        help='Results directory to check (default: ' +
+                             resultstore.RESULTS_DIR + ')')
+
+    parser.add_argument('--alpha', type=float, default=ALPHA,
+                        help='Significance level of the Mann-Whitney U test')
+
+    parser.add_argument('--min-effect', dest='min_effect', type=float,
+                        default=MIN_EFFECT,
+                        help="Smallest |Cliff's delta| that counts")
+
+    parser.add_argument('--json', dest='json_path', type=str, metavar='PATH',
+                        default=None, help='Also write the comparison here')
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    baseline = load_samples(args.baseline)
+    current = load_samples(args.current)
+    results = compare(current, baseline, args.alpha, args.min_effect)
+
+    for r in results:
+        print format_result(r)
+    missing = sorted(set(baseline) - set(current))
+    for figure, metric, key in missing:
+        print figure, metric, key + ': missing from', args.current
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+
+    regressions = [r for r in results if r['verdict'] == 'regression']
+    print '{0} compared, {1} regressions'.format(len(results),
+                                                  len(regressions))
+    if not results:
+        print 'Nothing to compare: no samples in common'
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+import cgi
+import copy
+import os
+import SimpleHTTPServer
+import SocketServer
+import threading
+import time
+
+DASHBOARD_DIR = 'dashboard'
+DASHBOARD_PORT = 8000
+REFRESH = 5  # s, how often the page reloads itself
+RETRY = 10  # s, before a figure that failed to render is tried again
+
+PAGE = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<meta http-equiv="refresh" content="{refresh}">
+<title>btbench</title>
+<style>
+body {{ font-family: sans-serif; margin: 1em 2em; }}
+td {{ padding: 0.2em 1em 0.2em 0; }}
+figure {{ display: inline-block; margin: 0 1em 1em 0; }}
+</style>
+</head>
+<body>
+<h1>btbench</h1>
+<p>Updated {updated}</p>
+<table>
+{status}
+</table>
+{figures}
+</body>
+</html>
+'''
+
+
+class Handler(SimpleHTTPServer.SimpleHTTPRequestHandler):
+    def translate_path(self, path):
+        # serve the dashboard directory instead of the working directory
+        path = SimpleHTTPServer.SimpleHTTPRequestHandler.translate_path(
+            self, path)
+        return os.path.join(self.server.root, os.path.relpath(path,
+                                                              os.getcwd()))
+
+    def end_headers(self):
+        self.send_header('Cache-Control', 'no-cache')
+        SimpleHTTPServer.SimpleHTTPRequestHandler.end_headers(self)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Server(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class Dashboard(object):
+    # an auto-refreshing page with one figure per series; updating a
+    # series only marks it dirty, a single thread re-renders the dirty
+    # ones (and nothing else) in the background
+
+    def __init__(self, root=DASHBOARD_DIR, port=DASHBOARD_PORT,
+                 host='127.0.0.1', refresh=REFRESH):
+        self.root = root
+        self.port = port
+        self.host = host
+        self.refresh = refresh
+        self.series = {}
+        self.status = {}
+        self.order = []
+        self.cond = threading.Condition()
+        self.closed = False
+        self.status_changed = False
+        self.server = None
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://{0}:{1}/'.format(self.host, self.port)
+
+    def start(self):
+        if not os.path.exists(self.root):
+            os.makedirs(self.root)
+        self._write_page()
+
+        self.server = Server((self.host, self.port), Handler)
+        self.server.root = os.path.abspath(self.root)
+        server_thread = threading.Thread(target=self.server.serve_forever)
+        server_thread.daemon = True
+        server_thread.start()
+
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def update(self, name, kind, data):
+        # data is copied, callers can keep mutating theirs
+        data = copy.deepcopy(data)
+        with self.cond:
+            series = self.series.get(name)
+            if series is None:
+                series = self.series[name] = dict(version=0, rendered=0,
+                                                  failed=(0, 0))
+                self.order.append(name)
+            series.update(kind=kind, data=data)
+            series['version'] += 1
+            self.cond.notify()
+
+    def set_status(self, key, text):
+        with self.cond:
+            self.status[key] = text
+            self.status_changed = True
+            self.cond.notify()
+
+    def _dirty(self):
+        # a version that failed to render waits RETRY before another try
+        now = time.time()
+        return [(name, s['kind'], s['data'], s['version'])
+                for name, s in self.series.iteritems()
+                if s['version'] != s['rendered'] and
+                (s['failed'][0] != s['version'] or
+                 now - s['failed'][1] >= RETRY)]
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.closed and not self._dirty() \
+                        and not self.status_changed:
+                    self.cond.wait(1)
+                dirty = self._dirty()
+                self.status_changed = False
+                if self.closed and not dirty:
+                    return
+
+            for name, kind, data, version in dirty:
+                ok = self._render(name, kind, data)
+                with self.cond:
+                    if ok:
+                        self.series[name]['rendered'] = version
+                    else:
+                        self.series[name]['failed'] = (version, time.time())
+            self._write_page()
+
+    def _render(self, name, kind, data):
+        # render next to the old figure and swap, a reload never sees a
+        # half written png; matplotlib is loaded with the first figure.
+        # False when there is no new figure, the page keeps the old one
+        import render
+
+        dest = os.path.join(self.root, name + '.png')
+        tmp_dest = os.path.join(self.root, name + '.tmp.png')
+        try:
+            rendered = render.render_job(
+                dict(kind=kind, dest=tmp_dest, data=data))
+        except Exception as e:
+            # partial data can be too little to plot, the next update may
+            # do better; the campaign must not stop for a figure
+            print 'dashboard: could not render', name, '-', e
+            return False
+        if rendered is None:
+            return False
+        os.rename(tmp_dest, dest)
+        return True
+
+    def _write_page(self):
+        with self.cond:
+            status = sorted(self.status.items())
+            figures = [(name, self.series[name]['rendered'])
+                       for name in self.order]
+
+        page = PAGE.format(
+            refresh=self.refresh,
+            updated=time.strftime('%Y-%m-%d %H:%M:%S'),
+            status='\n'.join('<tr><td>{0}</td><td>{1}</td></tr>'.format(
+                cgi.escape(k), cgi.escape(v)) for k, v in status),
+            figures='\n'.join(
+                '<figure><img src="{0}.png?v={1}" alt="{0}">'
+                '<figcaption>{0}</figcaption></figure>'.format(
+                    cgi.escape(name, True), version)
+                for name, version in figures if version),
+        )
+        path = os.path.join(self.root, 'index.html')
+        with open(path + '.tmp', 'w') as f:
+            f.write(page)
+        os.rename(path + '.tmp', path)
+
+    def close(self):
+        # renders what is still dirty, then stops serving
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        if self.thread is not None:
+            while self.thread.is_alive():
+                self.thread.join(1)
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
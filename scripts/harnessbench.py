@@ -0,0 +1,410 @@
+import argparse
+import BaseHTTPServer
+import csv
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing import Pool
+
+import numpy
+import requests
+
+import analysis
+import ingest
+import render
+import scheduler
+import timeseries
+
+BASELINE_PATH = 'harness_baseline.json'
+
+ROWS = [10 ** k for k in xrange(1, 7)]
+DEVICES = [2, 5, 10, 20, 50, 100]
+ROWS_DEVICES = 10  # devices in the reports of the row-scaled stages
+ITERATIONS = 10  # rows per pair in the reports of the device-scaled stages
+REPEAT = 3
+TOLERANCE = 1.5  # slowdown (or memory growth) that counts as a regression
+NOISE_FLOOR = 0.01  # s, faster stages are too noisy to compare
+
+THROUGHPUT_BYTES = 2 * 1000 * 1024
+PAYLOAD_SIZE = 1024
+ROUNDS = 5
+
+
+def device_names(n):
+    return ['dev-{0:03d}'.format(i + 1) for i in xrange(n)]
+
+
+def device_macs(n):
+    return ['02:00:00:00:{0:02X}:{1:02X}'.format((i + 1) >> 8, (i + 1) & 0xff)
+            for i in xrange(n)]
+
+
+def throughput_rows(nrows, ndevices, rng):
+    names = device_names(ndevices)
+    pairs = [(s, r) for r in names for s in names if s != r]
+    nanotime = rng.normal(11 * 10 ** 9, 10 ** 9, nrows).astype(numpy.int64)
+    for i in xrange(nrows):
+        s, r = pairs[i % len(pairs)]
+        yield s, r, THROUGHPUT_BYTES, nanotime[i]
+
+
+def token_rows(nrows, ndevices, rng):
+    macs = device_macs(ndevices)
+    t = 1500000000000
+    for i in xrange(nrows):
+        sleep, connect, transfer, response = rng.randint(1, 2000, 4)
+        started = t + sleep
+        connected = started + connect / 10
+        received = connected + transfer / 10
+        finished = received + response / 10
+        t = finished
+        yield (macs[i % ndevices], macs[(i + 1) % ndevices], PAYLOAD_SIZE,
+               ROUNDS, started, connected, received, finished, sleep)
+
+
+def messages_rows(nrows, ndevices, rng):
+    names = device_names(ndevices)
+    started = 1500000000000
+    for i in xrange(nrows):
+        received = started + rng.randint(50, 500)
+        finished = received + rng.randint(500, 5000)
+        yield (names[0], names[1 + i % (ndevices - 1)], THROUGHPUT_BYTES,
+               started, received, finished)
+
+
+REPORTS = {
+    'throughput': (analysis.THROUGHPUT_DTYPE.names, throughput_rows),
+    'token': (analysis.TOKEN_DTYPE.names, token_rows),
+    'messages': (analysis.MESSAGES_DTYPE.names, messages_rows),
+}
+
+
+def write_report(path, kind, nrows, ndevices, seed=0):
+    header, gen = REPORTS[kind]
+    with open(path, 'wb') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(header)
+        writer.writerows(gen(nrows, ndevices, numpy.random.RandomState(seed)))
+
+
+def throughput_matrix(arr):
+    # the nested dict bench_throughput hands to the throughput figure
+    results = {}
+    for (s, r), st in analysis.throughput_summary(arr).iteritems():
+        results.setdefault(r, {})[s] = (st['mean'], st['min'], st['max'])
+    return results
+
+
+class FileHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/csv')
+        self.send_header('Content-Length',
+                         str(os.path.getsize(self.server.path)))
+        self.end_headers()
+        with open(self.server.path, 'rb') as f:
+            shutil.copyfileobj(f, self.wfile)
+
+
+def serve_file(path):
+    # the server shares the process (and the GIL) with the client, so the
+    # http stage is an upper bound of the client side cost
+    server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), FileHandler)
+    server.path = path
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return 'http://127.0.0.1:{0}/throughput'.format(server.server_port)
+
+
+# every stage does its untimed setup from a synthetic report and returns
+# the work to time
+
+def stage_http_fetch(path):
+    url = serve_file(path)
+
+    def work():
+        response = requests.get(url, stream=True)
+        return analysis.load_throughput(
+            ingest.iter_response(response, path + '.fetched'))
+    return work
+
+
+def stage_csv_parse(path):
+    return lambda: analysis.load(path, analysis.THROUGHPUT_DTYPE)
+
+
+def stage_throughput_summary(path):
+    arr = analysis.load(path, analysis.THROUGHPUT_DTYPE)
+    return lambda: analysis.throughput_summary(arr)
+
+
+def stage_token_parse(path):
+    return lambda: analysis.load(path, analysis.TOKEN_DTYPE)
+
+
+def stage_token_summary(path):
+    arr = analysis.load(path, analysis.TOKEN_DTYPE)
+    return lambda: analysis.token_summary(arr, PAYLOAD_SIZE)
+
+
+def stage_messages_summary(path):
+    arr = analysis.load(path, analysis.MESSAGES_DTYPE)
+    return lambda: (analysis.messages_summary(arr),
+                    analysis.messages_by_target(arr))
+
+
+def stage_over_time_plot(path):
+    arr = analysis.load(path, analysis.THROUGHPUT_DTYPE)
+
+    def run():
+        # windowing and smoothing are part of the stage, like in a run
+        data = dict(timeseries.throughput_series(arr), receiver='r',
+                    sender='s')
+        return render.render_job(dict(kind='throughput_over_time',
+                                      dest=path + '.png', data=data))
+    return run
+
+
+def stage_schedule(path):
+    n = len(numpy.unique(analysis.load(path, analysis.THROUGHPUT_DTYPE)['to']))
+    return lambda: scheduler.directed_rounds(n)
+
+
+def stage_matrix(path):
+    arr = analysis.load(path, analysis.THROUGHPUT_DTYPE)
+    return lambda: throughput_matrix(arr)
+
+
+def stage_mk_groups(path):
+    results = throughput_matrix(analysis.load(path, analysis.THROUGHPUT_DTYPE))
+    return lambda: render.mk_groups(results)
+
+
+def stage_throughput_plot(path):
+    results = throughput_matrix(analysis.load(path, analysis.THROUGHPUT_DTYPE))
+    job = dict(kind='throughput', dest=path + '.png', data=results)
+    return lambda: render.render_job(job)
+
+
+# name: (scaled by 'rows' or 'devices', synthetic report, setup)
+STAGES = [
+    ('http_fetch', 'rows', 'throughput', stage_http_fetch),
+    ('csv_parse', 'rows', 'throughput', stage_csv_parse),
+    ('throughput_summary', 'rows', 'throughput', stage_throughput_summary),
+    ('token_parse', 'rows', 'token', stage_token_parse),
+    ('token_summary', 'rows', 'token', stage_token_summary),
+    ('messages_summary', 'rows', 'messages', stage_messages_summary),
+    ('over_time_plot', 'rows', 'throughput', stage_over_time_plot),
+    ('schedule', 'devices', 'throughput', stage_schedule),
+    ('matrix', 'devices', 'throughput', stage_matrix),
+    ('mk_groups', 'devices', 'throughput', stage_mk_groups),
+    ('throughput_plot', 'devices', 'throughput', stage_throughput_plot),
+]
+
+STAGE_NAMES = [s[0] for s in STAGES]
+
+
+def memory():
+    # (current, peak) resident memory in kB
+    try:
+        with open('/proc/self/status', 'r') as f:
+            status = dict(line.split(':', 1) for line in f)
+        return (int(status['VmRSS'].split()[0]),
+                int(status['VmHWM'].split()[0]))
+    except (IOError, KeyError):
+        # ru_maxrss is in kB on Linux and in bytes on OS X
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin':
+            peak /= 1024
+        return peak, peak
+
+
+def reset_peak():
+    # Linux can reset the high-water mark, otherwise a setup hungrier than
+    # its stage hides the stage's peak
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except IOError:
+        pass
+
+
+def run_case(case):
+    # runs in a fresh worker, so the peak memory is this stage's alone
+    setup = dict((s[0], s[3]) for s in STAGES)[case['stage']]
+    work = setup(case['path'])
+    reset_peak()
+    before, _ = memory()
+
+    times = []
+    for _ in xrange(case['repeat']):
+        started = time.time()
+        work()
+        times.append(time.time() - started)
+
+    _, peak = memory()
+    return dict(case, seconds=min(times), median=float(numpy.median(times)),
+                peak_kb=max(peak - before, 0), rss_kb=peak)
+
+
+def plan(stages, rows, devices, workdir, repeat):
+    cases = []
+    reports = {}
+    for name, axis, kind, _ in STAGES:
+        if name not in stages:
+            continue
+        for size in (rows if axis == 'rows' else devices):
+            if axis == 'rows':
+                nrows, ndevices = size, ROWS_DEVICES
+            else:
+                nrows, ndevices = size * (size - 1) * ITERATIONS, size
+            path = os.path.join(workdir, '{0}_{1}_{2}.csv'.format(
+                kind, nrows, ndevices))
+            if path not in reports:
+                write_report(path, kind, nrows, ndevices)
+                reports[path] = True
+            cases.append(dict(stage=name, axis=axis, size=size, rows=nrows,
+                              devices=ndevices, path=path, repeat=repeat))
+    return cases
+
+
+def run(cases):
+    results = []
+    # one task per worker: memory is never shared between two stages
+    pool = Pool(1, maxtasksperchild=1)
+    try:
+        for result in pool.imap(run_case, cases):
+            print '{stage:<20} {axis:>7}={size:<8} {seconds:9.4f} s ' \
+                  '{peak_kb:9d} kB'.format(**result)
+            results.append(result)
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
+
+def to_baseline(results):
+    stages = {}
+    for r in results:
+        stages.setdefault(r['stage'], {})[str(r['size'])] = dict(
+            (k, r[k]) for k in ('axis', 'rows', 'devices', 'seconds',
+                                'median', 'peak_kb'))
+    return dict(
+        created=time.time(),
+        python=platform.python_version(),
+        numpy=numpy.__version__,
+        platform=platform.platform(),
+        repeat=results[0]['repeat'] if results else REPEAT,
+        stages=stages,
+    )
+
+
+def save_baseline(baseline, path):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(baseline, f, indent=1, sort_keys=True)
+    os.rename(tmp_path, path)
+
+
+def compare(baseline, results, tolerance=TOLERANCE):
+    regressions = []
+    for r in results:
+        old = baseline['stages'].get(r['stage'], {}).get(str(r['size']))
+        if old is None:
+            continue
+        if r['seconds'] > NOISE_FLOOR and \
+                r['seconds'] > tolerance * max(old['seconds'], NOISE_FLOOR):
+            regressions.append((r['stage'], r['size'], 'time',
+                                old['seconds'], r['seconds']))
+        if r['peak_kb'] > tolerance * max(old['peak_kb'], 1024):
+            regressions.append((r['stage'], r['size'], 'memory',
+                                old['peak_kb'], r['peak_kb']))
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the harness itself against synthetic reports.')
+
+    parser.add_argument('--stages', '-s', nargs='+', choices=STAGE_NAMES,
+                        default=STAGE_NAMES, metavar='STAGE',
+                        help='Stages to run (default: all of ' +
+                             ', '.join(STAGE_NAMES) + ')')
+
+    parser.add_argument('--rows', '-r', nargs='+', type=int, default=ROWS,
+                        metavar='N', help='Report sizes of the row-scaled '
+                                          'stages')
+
+    parser.add_argument('--devices', '-d', nargs='+', type=int,
+                        default=DEVICES, metavar='N',
+                        help='Device counts of the device-scaled stages')
+
+    parser.add_argument('--repeat', type=int, default=REPEAT, metavar='N',
+                        help='Runs of every stage, the fastest is kept')
+
+    parser.add_argument('--baseline', '-b', type=str, default=BASELINE_PATH,
+                        metavar='PATH', help='Baseline file')
+
+    parser.add_argument('--save', dest='save', action='store_const',
+                        const=True, default=False,
+                        help='Save the results as the new baseline')
+
+    parser.add_argument('--check', dest='check', action='store_const',
+                        const=True, default=False,
+                        help='Compare with the baseline and exit with an '
+                             'error on regressions')
+
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        metavar='FACTOR',
+                        help='Slowdown or memory growth that counts as a '
+                             'regression')
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix='harnessbench')
+    try:
+        print 'Writing synthetic reports to', workdir
+        cases = plan(args.stages, args.rows, args.devices, workdir,
+                     args.repeat)
+        results = run(cases)
+    finally:
+        shutil.rmtree(workdir)
+
+    status = 0
+    if args.check:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.tolerance)
+        for stage, size, what, old, new in regressions:
+            print 'REGRESSION {0} ({1}) {2}: {3} -> {4}'.format(
+                stage, size, what, old, new)
+        if regressions:
+            status = 1
+        else:
+            print 'No regressions against', args.baseline
+
+    if args.save:
+        save_baseline(to_baseline(results), args.baseline)
+        print 'Baseline saved as', args.baseline
+
+    sys.exit(status)
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,199 @@
+import argparse
+import math
+
+import numpy
+
+import resultstore
+
+DIGITS = 3  # significant decimal digits kept for every value
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+class Histogram(object):
+    # HDR-style log-linear histogram: values up to 2 * 10^digits units are
+    # counted exactly, above that every power of two is split in the same
+    # number of buckets, so a bucket is never wider than 10^-digits of its
+    # values. Memory grows with the log of the largest value, not with the
+    # number of samples, and two histograms merge by adding their counts.
+
+    def __init__(self, digits=DIGITS, resolution=1.0):
+        self.digits = digits
+        self.resolution = resolution  # smallest distinguishable value
+        self.bits = int(math.ceil(math.log(2 * 10 ** digits, 2)))
+        self.half = 1 << (self.bits - 1)
+        self.counts = numpy.zeros(2 * self.half, dtype=numpy.int64)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def _index(self, units):
+        # the top bits of every value are its sub-bucket, the rest
+        # (shift) says which power of two it is in
+        exp = numpy.frexp(units.astype(numpy.float64))[1]
+        shift = numpy.maximum(exp - self.bits, 0)
+        return numpy.right_shift(units, shift) + shift * self.half
+
+    def _bounds(self, index):
+        # [lo, hi) in units of every bucket
+        shift = numpy.maximum(index // self.half - 1, 0)
+        sub = index - shift * self.half
+        return numpy.left_shift(sub, shift), numpy.left_shift(sub + 1, shift)
+
+    def _grow(self, size):
+        if size > len(self.counts):
+            self.counts = numpy.concatenate(
+                (self.counts, numpy.zeros(size - len(self.counts),
+                                          dtype=numpy.int64)))
+
+    def record(self, values):
+        values = numpy.atleast_1d(numpy.asarray(values, dtype=numpy.float64))
+        values = values[numpy.isfinite(values)]
+        if not len(values):
+            return self
+        if values.min() < 0:
+            raise ValueError('histograms only hold non-negative values')
+
+        units = numpy.round(values / self.resolution).astype(numpy.int64)
+        index = self._index(units)
+        self._grow(index.max() + 1)
+        self.counts += numpy.bincount(index, minlength=len(self.counts))
+        self._add_stats(len(values), values.sum(), values.min(), values.max())
+        return self
+
+    def _add_stats(self, count, total, lo, hi):
+        self.count += int(count)
+        self.total += float(total)
+        self.min = float(lo) if self.min is None else min(self.min, lo)
+        self.max = float(hi) if self.max is None else max(self.max, hi)
+
+    def merge(self, other):
+        if (other.digits, other.resolution) != (self.digits,
+                                                self.resolution):
+            raise ValueError('cannot merge histograms of different precision')
+        if other.count:
+            self._grow(len(other.counts))
+            self.counts[:len(other.counts)] += other.counts
+            self._add_stats(other.count, other.total, other.min, other.max)
+        return self
+
+    __iadd__ = merge
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def percentiles(self, qs=PERCENTILES):
+        # the highest value equivalent to the sample at every percentile,
+        # within the recorded range
+        if not self.count:
+            return [None] * len(qs)
+        ranks = numpy.maximum(numpy.ceil(numpy.asarray(qs, dtype=numpy.float64)
+                                         / 100 * self.count), 1)
+        index = numpy.searchsorted(numpy.cumsum(self.counts), ranks)
+        _, hi = self._bounds(index)
+        values = (hi - 1) * self.resolution
+        return numpy.clip(values, self.min, self.max).tolist()
+
+    def percentile(self, q):
+        return self.percentiles((q,))[0]
+
+    def summary(self, qs=PERCENTILES):
+        s = dict(count=self.count, mean=self.mean, min=self.min, max=self.max)
+        s.update(('p{0:g}'.format(q), v)
+                 for q, v in zip(qs, self.percentiles(qs)))
+        return s
+
+    def to_dict(self):
+        # sparse: only the buckets that were hit
+        index = numpy.flatnonzero(self.counts)
+        return dict(digits=self.digits, resolution=self.resolution,
+                    count=self.count, total=self.total, min=self.min,
+                    max=self.max, index=index.tolist(),
+                    counts=self.counts[index].tolist())
+
+    @classmethod
+    def from_dict(cls, d):
+        h = cls(d['digits'], d['resolution'])
+        if d['count']:
+            index = numpy.asarray(d['index'], dtype=numpy.int64)
+            h._grow(index.max() + 1)
+            h.counts[index] = d['counts']
+            h._add_stats(d['count'], d['total'], d['min'], d['max'])
+        return h
+
+
+def of(values, digits=DIGITS, resolution=1.0):
+    return Histogram(digits, resolution).record(values)
+
+
+def merged(histograms):
+    histograms = list(histograms)
+    if not histograms:
+        return None
+    out = Histogram(histograms[0].digits, histograms[0].resolution)
+    for h in histograms:
+        out.merge(h)
+    return out
+
+
+def format_summary(h, unit=''):
+    s = h.summary()
+    if not s['count']:
+        return 'no samples'
+    return '{0} samples, '.format(s['count']) + ', '.join(
+        '{0} {1:.1f}{2}'.format(k, s[k], unit)
+        for k in ['p{0:g}'.format(q) for q in PERCENTILES] + ['max'])
+
+
+def load_histograms(results_dir):
+    # {(figure, metric, key): Histogram} of every result in results_dir
+    histograms = {}
+    for path in resultstore.job_paths(results_dir):
+        job = resultstore.load_job(path)
+        figure = resultstore.job_name(path)
+        for metric, hs in job.get('histograms', {}).iteritems():
+            for key, d in hs.iteritems():
+                histograms[(figure, metric, key)] = Histogram.from_dict(d)
+    return histograms
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Merge the latency and throughput histograms of one or '
+                    'more runs and print their percentiles.')
+
+    parser.add_argument('results', metavar='RESULTS', nargs='*',
+                        default=[resultstore.RESULTS_DIR],
+                        help='Results directories (default: ' +
+                             resultstore.RESULTS_DIR + ')')
+
+    parser.add_argument('--by-metric', dest='by_metric', action='store_const',
+                        const=True, default=False,
+                        help='Also merge every device, link and size of a '
+                             'metric together')
+
+    return parser.parse_args()
+
+
+def report(results_dirs, by_metric=False):
+    groups = {}
+    for results_dir in results_dirs:
+        for (figure, metric, key), h in \
+                load_histograms(results_dir).iteritems():
+            if by_metric:
+                key = 'all'
+            groups.setdefault((figure, metric, key), []).append(h)
+
+    for (figure, metric, key), hs in sorted(groups.iteritems()):
+        print '{0} {1} {2}: {3}'.format(figure, metric, key,
+                                        format_summary(merged(hs)))
+
+
+def main():
+    args = parse_args()
+    report(args.results, args.by_metric)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+import csv
+import os
+
+
+def _tee(lines, f):
+    for line in lines:
+        f.write(line + '\n')
+        yield line
+
+
+def iter_response(response, path):
+    # parse the csv rows while the body is still coming in, copying it to
+    # path; the copy only replaces path once the whole body has been read
+    tmp_path = path + '.part'
+    try:
+        with open(tmp_path, 'w') as f:
+            for row in csv.DictReader(_tee(response.iter_lines(), f)):
+                yield row
+    finally:
+        response.close()
+    os.rename(tmp_path, path)
+
+
+def read_report(path):
+    with open(path, 'r') as f:
+        for row in csv.DictReader(f):
+            yield row
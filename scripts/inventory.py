@@ -0,0 +1,81 @@
+import json
+import os
+import time
+from multiprocessing.pool import ThreadPool
+
+import requests
+
+import client
+import tracing
+
+INVENTORY_PATH = 'devices.json'
+DEFAULT_TTL = 6 * 60 * 60  # s
+DEFAULT_TIMEOUT = 3  # s
+MAX_WORKERS = 32
+
+
+def load_inventory(path=INVENTORY_PATH):
+    if not os.path.exists(path):
+        return {}
+
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except ValueError:
+        # a truncated inventory is just a cold cache
+        return {}
+
+
+def save_inventory(inventory, path=INVENTORY_PATH):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(inventory, f, indent=2, sort_keys=True)
+    os.rename(tmp_path, path)
+
+
+def is_fresh(device, ttl, now=None):
+    if now is None:
+        now = time.time()
+    return now - device.get('last_seen', 0) <= ttl
+
+
+def query_device(ip, port=38080, timeout=DEFAULT_TIMEOUT):
+    url = 'http://{0}:{1}/mac'.format(ip, port)
+    tracing.count('requests_total', endpoint='mac')
+    try:
+        with tracing.span('query_device', ip=ip):
+            content = client.get(url, timeout=timeout, retries=0).content
+            name, mac = content.strip().split('\n')
+    except (requests.RequestException, ValueError):
+        return None
+
+    return dict(name=name, ip=ip, mac=mac, last_seen=time.time())
+
+
+def discover(addresses, port=38080, ttl=DEFAULT_TTL, timeout=DEFAULT_TIMEOUT,
+             path=INVENTORY_PATH):
+    inventory = load_inventory(path)
+    now = time.time()
+
+    stale = [ip for ip in addresses
+             if ip not in inventory or not is_fresh(inventory[ip], ttl, now)]
+
+    if stale:
+        pool = ThreadPool(min(MAX_WORKERS, len(stale)))
+        try:
+            found = pool.map(
+                tracing.bind(lambda ip: query_device(ip, port, timeout)), stale)
+        finally:
+            pool.close()
+            pool.join()
+
+        for ip, device in zip(stale, found):
+            if device is None:
+                print ip, 'is not responding, skipping it'
+                inventory.pop(ip, None)
+                continue
+            inventory[ip] = device
+
+        save_inventory(inventory, path)
+
+    return [inventory[ip] for ip in addresses if ip in inventory]
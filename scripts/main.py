@@ -1,36 +1,17 @@
-from cStringIO import StringIO
 import argparse
-import os
-import numpy
-import requests
-import csv
-import matplotlib.pyplot as plt
 import sys
-from scipy.interpolate import interp1d
 
-# todo: remove me!!
-import time
+import client
+import dashboard
+import inventory
+import plugins
+import resultstore
+import tracing
 
-HARDCODED_DEVICES = [
-    # {'name': 'Nexus 5', 'ip': '192.168.1.107', 'mac': 'BC:F5:AC:5C:50:87'},
-    # {'name': 'Galaxy tab', 'ip': '192.168.1.102', 'mac': '18:22:7E:FC:83:09'},
-    # {'name': 'Redmi', 'ip': '192.168.1.116', 'mac': '74:51:BA:46:90:A2'},
-    # {'name': 'GalaxyS3', 'ip': '192.168.1.100', 'mac': '9C:65:B0:88:03:28'},
-    # {'name': 'Nexus 7', 'ip': '192.168.1.111', 'mac': '50:46:5D:CC:65:4E'},
+COMMANDS = ('discover', 'collect', 'analyse', 'plot')
 
-    # # spaziodati
-    {'name': 'Nexus 5', 'ip': '10.0.1.49', 'mac': '34:FC:EF:34:30:2E'},
-    {'name': 'Nexus 7', 'ip': '10.0.1.50', 'mac': '50:46:5D:CC:65:4E'},
-    {'name': 'Galaxy tab', 'ip': '10.0.1.51', 'mac': '18:22:7E:FC:83:09'},
-    {'name': 'Redmi', 'ip': '10.0.1.52', 'mac': '74:51:BA:46:90:A2'},
-    {'name': 'HTC One M8', 'ip': '10.0.1.54', 'mac': '2C:8A:72:25:CB:4C'},
-    # {'name': 'OnePlus One', 'ip': '10.0.1.55', 'mac': ''}
-]
-
-
-def parse_args():
-    parser = argparse.ArgumentParser(description='Do some benchmarks.')
 
+def add_device_arguments(parser):
     parser.add_argument('--net_prefix', '-n', type=str, metavar='NET_PREFIX',
                         help='Prefix of the network (e.g. 192.168.1. )',
                         nargs='?', default='')
@@ -43,545 +24,212 @@ def parse_args():
                         help='Port of the HTTP server in devices',
                         default=38080)
 
-    parser.add_argument('--cache', '-c', dest='cache', action='store_const',
-                        const=True, default=False,
-                        help='Port of the HTTP server in devices')
+    parser.add_argument('--ttl', type=int, metavar='SECONDS',
+                        help='Seconds before a device in the inventory has '
+                             'to be queried again (0 forces discovery)',
+                        default=inventory.DEFAULT_TTL)
 
-    parser.add_argument('--throughput', '-t', dest='throughput',
-                        action='store_const', const=True, default=False,
-                        help='Throughput test.')
+    parser.add_argument('--discovery-timeout', type=float, metavar='SECONDS',
+                        dest='discovery_timeout',
+                        help='Timeout for each device during discovery',
+                        default=inventory.DEFAULT_TIMEOUT)
 
-    parser.add_argument('--throughput-over-time', '-T',
-                        dest='throughput_over_time',
-                        action='store_const', const=True, default=False,
-                        help='Throughput over time test.')
 
-    parser.add_argument('--messages', '-m', dest='messages',
-                        action='store_const', const=True, default=False,
-                        help='Messages per second test.')
+def add_render_arguments(parser):
+    parser.add_argument('--render-workers', type=int, metavar='N',
+                        dest='render_workers', default=None,
+                        help='Processes used to render the figures '
+                             '(default: one per CPU)')
 
-    parser.add_argument('--token', '-k', dest='token',
-                        action='store_const', const=True, default=False,
-                        help='Token RTT test.')
 
-    args = parser.parse_args()
-    if not args.throughput and not args.messages \
-            and not args.throughput_over_time and not args.token:
-        print 'ERROR. You must specify at least an action!'
-        print
+def add_collect_arguments(parser):
+    add_device_arguments(parser)
+
+    parser.add_argument('--cache', '-c', dest='cache', action='store_const',
+                        const=True, default=False,
+                        help='Serve reports from the result cache when '
+                             'possible')
+
+    parser.add_argument('--concurrency', type=int, metavar='N',
+                        help='Maximum number of device pairs (or sweep '
+                             'groups) measured at the same time (default: '
+                             'as many as the schedule allows)',
+                        default=None)
+
+    parser.add_argument('--dashboard', type=int, metavar='PORT',
+                        nargs='?', const=dashboard.DASHBOARD_PORT,
+                        default=None,
+                        help='Serve a live dashboard of the partial results '
+                             'on localhost (default port: {0})'.format(
+                            dashboard.DASHBOARD_PORT))
+
+    parser.add_argument('--trace-dir', type=str, metavar='DIR',
+                        dest='trace_dir', default=tracing.TRACE_DIR,
+                        help='Where the timing trace and the metrics of the '
+                             'run are written')
+
+    parser.add_argument('--no-clock-sync', dest='clock_sync',
+                        action='store_const', const=False, default=True,
+                        help='Do not estimate the clock offsets of the '
+                             'devices, cross-device latencies are then '
+                             'taken as the devices report them')
+
+    parser.add_argument('--plot', dest='plot', action='store_const',
+                        const=True, default=False,
+                        help='Render the figures once everything is '
+                             'collected (see also the plot command)')
+    add_render_arguments(parser)
+
+    for plugin in plugins.PLUGINS:
+        group = parser.add_argument_group(plugin.name.replace('_', ' '))
+        group.add_argument(*plugin.flags, dest=plugin.name,
+                           action='store_const', const=True, default=False,
+                           help=plugin.help)
+        if plugin.add_arguments is not None:
+            plugin.add_arguments(group)
 
-        parser.print_help()
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Do some benchmarks.')
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+
+    discover_parser = commands.add_parser(
+        'discover', help='Find the devices and update the inventory')
+    add_device_arguments(discover_parser)
+
+    collect_parser = commands.add_parser(
+        'collect', help='Run benchmarks and save their results')
+    add_collect_arguments(collect_parser)
+
+    analyse_parser = commands.add_parser(
+        'analyse', help='Print the percentiles of saved results')
+    analyse_parser.add_argument(
+        'results', metavar='RESULTS', nargs='*',
+        default=[resultstore.RESULTS_DIR],
+        help='Results directories, merged together (default: ' +
+             resultstore.RESULTS_DIR + ')')
+    analyse_parser.add_argument(
+        '--by-metric', dest='by_metric', action='store_const', const=True,
+        default=False,
+        help='Also merge every device, link and size of a metric together')
+
+    plot_parser = commands.add_parser(
+        'plot', help='Render the figures of saved results')
+    plot_parser.add_argument(
+        'names', metavar='NAME', nargs='*',
+        help='Figures to render, e.g. throughput (default: all of them)')
+    plot_parser.add_argument(
+        '--results', dest='results_dir', type=str, metavar='DIR',
+        default=resultstore.RESULTS_DIR,
+        help='Results directory (default: ' + resultstore.RESULTS_DIR + ')')
+    add_render_arguments(plot_parser)
+
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] not in COMMANDS and argv[0] not in ('-h', '--help'):
+        # the old command line: benchmark flags and devices, collected
+        # and plotted in one go
+        argv = ['collect', '--plot'] + argv
+
+    args = parser.parse_args(argv)
+    if args.command == 'collect' and not plugins.selected(args):
+        collect_parser.error('you must specify at least one benchmark')
     return args
 
 
-def mk_groups(data):
-    try:
-        newdata = data.items()
-    except AttributeError:
-        return
-
-    thisgroup = []
-    groups = []
-    for key, value in newdata:
-        newgroups = mk_groups(value)
-        if newgroups is None:
-            thisgroup.append((key, value))
-        else:
-            thisgroup.append((key, len(newgroups[-1])))
-            if groups:
-                groups = [g + n for n, g in zip(newgroups, groups)]
-            else:
-                groups = newgroups
-    return [thisgroup] + groups
-
-
-def add_line(ax, xpos, ypos):
-    line = plt.Line2D([xpos, xpos], [ypos + .1, ypos],
-                      transform=ax.transAxes, color='black')
-    line.set_clip_on(False)
-    ax.add_line(line)
-
-
-def label_group_bar(fig, ax, data, ylabel):
-    groups = mk_groups(data)
-    xy = groups.pop()
-    x, y = zip(*xy)
-    ly = len(y)
-    xticks = range(1, ly + 1)
-
-    ax.bar(xticks, y, align='center')
-    ax.set_xticks(xticks)
-    ax.set_xticklabels(x, rotation='vertical')
-    ax.set_xlim(.5, ly + .5)
-    ax.yaxis.grid(True)
-
-    plt.ylabel(ylabel)
-
-    scale = 1. / ly
-    for pos in xrange(ly + 1):
-        add_line(ax, pos * scale, -.1)
-    ypos = 1.02
-    while groups:
-        group = groups.pop()
-        pos = 0
-        for label, rpos in group:
-            lxpos = (pos + .5 * rpos) * scale
-            ax.text(lxpos, ypos, label, ha='center', transform=ax.transAxes)
-            add_line(ax, pos * scale, 1)
-            pos += rpos
-        add_line(ax, pos * scale, 1)
-        ypos -= .1
-
-
-def label_group_bar_with_err(fig, ax, data, ylabel):
-    groups = mk_groups(data)
-    xy = groups.pop()
-    x, y = zip(*xy)
-    ly = len(y)
-    xticks = range(1, ly + 1)
-
-    yerr=\
-        [map(lambda _y: _y[1], y), map(lambda _y: _y[2], y)] if len(y[0]) == 3 else map(lambda _y: _y[1], y)
-
-    ax.errorbar(xticks,
-           map(lambda _y: _y[0], y),
-           yerr=yerr,
-           fmt='o')
-    ax.set_xticks(xticks)
-    ax.set_xticklabels(x, rotation='vertical')
-    ax.set_xlim(.5, ly + .5)
-    ax.yaxis.grid(True)
-
-    plt.ylabel(ylabel)
-
-    scale = 1. / ly
-    for pos in xrange(ly + 1):
-        add_line(ax, pos * scale, -.1)
-    ypos = 1.02
-    while groups:
-        group = groups.pop()
-        pos = 0
-        for label, rpos in group:
-            lxpos = (pos + .5 * rpos) * scale
-            ax.text(lxpos, ypos, label, ha='center', transform=ax.transAxes)
-            add_line(ax, pos * scale, 1)
-            pos += rpos
-        add_line(ax, pos * scale, 1)
-        ypos -= .1
-
-
-def double_bar_plot(data1, data2, ylabel, xlabel, xlabels, data1_label, data2_label):
-    assert len(data1) == len(data2), 'data1 and data2 must have same length'
-
-    fig, ax = plt.subplots()
-    ind = range(1, len(data1) + 1)
-    width = 0.35
-
-    rects1 = ax.bar(ind, data1, width, color='b')
-    rects2 = ax.bar(map(lambda x: x+width, ind), data2, width, color='r')
-    ax.set_ylabel(ylabel)
-    ax.set_xlabel(xlabel)
-    ax.set_xticks(map(lambda x: x+width, ind))
-
-    ax.set_xticklabels(xlabels)
-    ax.legend((rects1[0], rects2[0]), (data1_label, data2_label))
-    fig.subplots_adjust(bottom=0.3)
-    return fig
-
-
-def simple_hist(data, xlabel, xlabels, ylabel):
-    fig, ax = plt.subplots()
-    width = 0.8
-    left_margins = [i + (1 - width)/2 for i in range(len(data))]
-
-    rects1 = ax.bar(left_margins, data, width, color='b')
-    ax.set_ylabel(ylabel)
-    ax.set_xticks([x + width / 2 for x in left_margins])
-    ax.set_xlabel(xlabel)
-    ax.set_xticklabels(xlabels)
-    fig.subplots_adjust(bottom=0.3)
-    return fig
-
-
-def hist_with_line(xlabel, ylabel_sx, ylabel_dx, data_bars, data_line, xlabels):
-    assert len(data_line) == len(data_bars), "datasets mush be the same length"
-
-    fig, ax = plt.subplots()
-    width = 0.7
-    left_margins = [i + (1 - width)/2 for i in range(len(data_bars))]
-
-    rects1 = ax.bar(left_margins, data_bars, width, color='b')
-    ax.set_ylabel(ylabel_sx, color='b')
-    ax.set_xticks([x + width / 2 for x in left_margins])
-    ax.set_xlabel(xlabel)
-    ax.set_xticklabels(xlabels)
-    ax.yaxis.grid(True)
-    ax.xaxis.grid(True)
-
-    for tl in ax.get_yticklabels():
-        tl.set_color('b')
-
-    ax2 = ax.twinx()
-    ax2.set_ylabel(ylabel_dx, color='r')
-    ax2.plot(
-        [m + width / 2 for m in left_margins],
-        data_line,
-        color='r',
-        marker='o'
-    )
-    ax2.margins(0.1, 0.1)
-    ax2.set_ylim([0, None])
-
-    fig.subplots_adjust(bottom=0.3)
-    for tl in ax2.get_yticklabels():
-        tl.set_color('r')
-    return fig
-
-
-def stacked_bars(data1, data2, xlabel, xlabels, ylabel, legend1, legend2):
-    assert len(data1) == len(data2)
-
-    fig, ax = plt.subplots()
-    width = 0.8
-    left_margins = [i + (1 - width)/2 for i in range(len(data1))]
-
-    rects1 = ax.bar(left_margins, data1, width, color='b')
-    rects2 = ax.bar(left_margins, data2, width, bottom=data1, color='r')
-    ax.set_ylabel(ylabel)
-    ax.set_xticks([x + width / 2 for x in left_margins])
-    ax.set_xlabel(xlabel)
-    ax.set_xticklabels(xlabels)
-    fig.subplots_adjust(bottom=0.3)
-    ax.legend((rects1[0], rects2[0]), (legend1, legend2))
-    return fig
-
-
-def get_throughput_report(d_addr, t_mac, cached=False):
-    path = 'csv/throughput-{0}-{1}'.format(d_addr, t_mac)
-    if cached:
-        if os.path.exists(path):
-            return csv.DictReader(open(path, 'r'))
-
-    url = 'http://{0}:38080/throughput?target={1}'.format(d_addr, t_mac)
+def discover_devices(args):
+    addresses = [args.net_prefix + t_addr
+                 for t_addr in args.devices_ip_addresses]
 
-    try:
-        csv_file = requests.get(url).content
-    except requests.ConnectionError:
-        return []
-
-    with open(path, 'w') as f:
-        f.write(csv_file)
-
-    reader = csv.DictReader(StringIO(csv_file))
-    return list(reader)
-
-
-def avg(l):
-    if len(l) == 0:
-        return None
-    return sum(l) / len(l)
-
-
-def trymin(l):
-    if len(l) == 0:
-        return None
-    return min(l)
-
-
-def trymax(l):
-    if len(l) == 0:
-        return None
-    return max(l)
-
-
-def bench_token(devices, payload_size=512, num_rounds=5,
-                dest_path='token.png', cache=False):
-    print 'Running token benchmark:'
-    results = {}
-    url = 'http://{0}:38080/token'.format(devices[0]['ip'])
-    res_url = 'http://{0}:38080/tokres'.format(devices[0]['ip'])
-    targets = map(lambda x: x['mac'], devices[1:])
-
-    path = 'csv/pl' + str(payload_size) + '_nr' + str(num_rounds) + '_' + '_'.join([d['mac'] for d in devices])
-
-    if cache and os.path.exists(path):
-        csv_file = open(path, 'r').read()
-    else:
-        r = requests.get(url, params=dict(devices=targets,
-                                          payloadLength=payload_size,
-                                          rounds=num_rounds))
-        uuid = r.content.strip()
-        print 'uuid: ', uuid
-
-        csv_file = None
-        while True:
-            time.sleep(1)
-            r = requests.get(res_url, params=dict(uuid=uuid))
-            if r.status_code == 200:
-                csv_file = r.content
-                break
-
-    with open(path, 'w') as f:
-        f.write(csv_file)
-
-    reader = csv.DictReader(StringIO(csv_file))
-    l_reader = list(reader)
-
-    for v in l_reader:
-        key = v['sender'] + '->' + v['receiver']
-        if key not in results:
-            results[key] = dict(rtt=[], connection=[], throughput=[],
-                                  sleep_time=[])
-        results[key]['rtt'].append(int(v['finished']) - int(v['started']))
-        results[key]['connection'].append(int(v['connected']) - int(v['started']))
-        results[key]['sleep_time'].append(int(v['sleep']))
-        results[key]['throughput'].append(
-            (payload_size / 1000.0) /  # KBytes
-            ((int(v['finished']) - int(v['started'])) * 1000.0)  # s
-        )
-
-    # compute the averages
-    for r in results:
-        item = results[r]
-        item['rtt'] = avg(item['rtt'])
-        item['connection'] = avg(item['connection'])
-        item['throughput'] = avg(item['throughput'])
-    return results
-
-
-def token_plot(devices, cache=True):
-    conns = []
-    rtts = []
-    sizes = (512, 1024, 2048, 4096)
-    for l in sizes:
-        print 'testing with payload=', l
-        res = bench_token(devices, l, 5, '', cache)
-        conn_cost = avg([item['connection'] for item in res.itervalues()])
-        rtt = avg([item['rtt'] - item['connection'] for item in res.itervalues()])
-        conns.append(conn_cost)
-        rtts.append(rtt)
-
-    print 'Plotting token rtt benchmark...'
-    fig = plt.figure()
-    ax = fig.add_subplot(1, 1, 1)
-    fig = stacked_bars(conns, rtts, 'Size of payload (KB)', map(str, sizes), 'Time (ms)', 'Connection cost', 'RTT')
-    fig.subplots_adjust(bottom=0.3)
-    fig.savefig('token.png')
-
-
-def bench_throughput(devices, dest_path, cache=False):
-    print 'Running throughput benchmark:'
-    results = {}
-    results_stddev = {}
-    for receiver in devices:
-        for sender in devices:
-            if receiver == sender:
-                continue
-
-            r_name = receiver['name']
-            s_name = sender['name']
-
-            if r_name not in results:
-                results[r_name] = {}
-                results_stddev[r_name] = {}
-
-            results[r_name][s_name] = (None,)
-            while None in results[r_name][s_name]:
-                print r_name, ' <- ', sender['name']
-
-                # get_throughput_report(receiver['ip'], sender['mac'], cache)  # warmup
-                report = get_throughput_report(receiver['ip'], sender['mac'], cache)
-
-                _res = map(
-                    lambda x:
-                    ((float(x['bytes']) * 8) / 10 ** 3) /  # kBits
-                    (float(x['nanotime']) / 10 ** 9),      # / s
-                    report)
-
-                results[r_name][s_name] = (
-                    avg(_res),
-                    trymin(_res),
-                    trymax(_res)
-                )
-
-                results_stddev[r_name][s_name] = (
-                    numpy.mean(_res),
-                    numpy.std(_res)
-                )
-
-                if None in results[r_name][s_name]:
-                    print 'FAILED. Retrying'
-
-            print 'DONE.'
-
-    print 'Plotting throughput...'
-    fig = plt.figure()
-    ax = fig.add_subplot(1, 1, 1)
-    label_group_bar_with_err(fig, ax, results, 'Throughput (kbits / s)')
-    fig.subplots_adjust(bottom=0.3)
-    fig.savefig(dest_path)
-
-
-    fig = plt.figure()
-    ax = fig.add_subplot(1, 1, 1)
-    label_group_bar_with_err(fig, ax, results_stddev, 'Throughput (kbits / s)')
-    fig.subplots_adjust(bottom=0.3)
-    fig.savefig('throughput-stdvar.png')
-
-
-def plot_throughput_over_time(device1, device2, cache=False):
-    for sender, receiver in ((device1, device2), (device2, device1)):
-        print receiver['name'], ' <- ', sender['name']
-
-        report = get_throughput_report(receiver['ip'], sender['mac'], cache)
-        report = list(report)
-
-        print 'Plotting...'
-
-        result = []
-
-        # for i in range((len(report)/20) + 1):
-        #     result.append(avg([
-        #         ((float(x['bytes']) * 8) / 10 ** 3) /  # kBits
-        #         (float(x['nanotime']) / 10 ** 9)  # sec
-        #         for x in report[i:i+len(report)/20]]
-        #     ))
-        for x in report:
-            result.append(
-                ((float(x['bytes']) * 8) / 10 ** 3) /  # kBits
-                (float(x['nanotime']) / 10 ** 9)  # sec
-            )
-
-        x = numpy.linspace(0, len(result), len(result))
-        xnew = numpy.linspace(0, len(result), 100)
-        y = result
-        # f2 = interp1d(x, y)
-        f = numpy.poly1d(numpy.polyfit(x, y, 4))
-        plt.plot(x, y, 'o', xnew, f(xnew), '-')
-        plt.show()
-
-
-def get_messages_per_sec_throughput(devices, dest_path, cache=False):
-    N_MESSAGES = 40
-
-    assert len(devices) >= 2, 'Need at least two devices'
-
-    master = devices[0]
-    others = devices[1:]
-    results = {}
-
-    for i in range(1, len(others) + 1):
-        targets = others[:i]
-        print targets
-
-        url = 'http://{0}:{1}/messages'.format(master['ip'], 38080)
-        f_name = lambda tt: 'csv/messages-{0}-{1}-{2}.csv'.format(
-            master['name'].replace(' ', '_'),
-            N_MESSAGES,
-            '-'.join([_d['name'].replace(' ', '_') for _d in tt])
-        )
-
-        if cache and os.path.exists(f_name(targets)):
-            print f_name(targets)
-            res_raw = open(f_name(targets), 'r')
-        else:
-            print url
-            print targets
-
-            vars = dict(
-                target=[d['mac'] for d in targets],
-                messages=N_MESSAGES
-            )
-
-            r = requests.get(url, params=vars)
-            print r.url
-
-            with open(f_name(targets), 'w') as f:
-                f.write(r.content)
-
-            res_raw = StringIO(r.content)
-
-        res = list(csv.DictReader(res_raw))
-
-        # from, to, message_size, started, received, finished
-        # % msg persi, RTT (finished-started), conn cost approx (rec - started)
-        if i not in results:
-            results[i] = {}
-        print 'first: ', min([int(t['finished']) for t in res]), ' , second: ', max([int(t['finished']) for t in res])
-        results[i]['timespan'] = ((max([int(t['finished']) for t in res]) - min([int(t['finished']) for t in res])) / 1000)
-        results[i]['rtts'] = [int(t['finished']) - int(t['started']) for t in res]
-        results[i]['conn_cost_approx'] = [int(t['received']) - int(t['started']) for t in res]
-        results[i]['received_msgs_rate'] = (len(res) * 100) / (N_MESSAGES * len(targets))
-        results[i]['received_msgs'] = len(res) / len(targets)
-
-    # print results
-
-
-    # fig = double_bar_plot(
-    #     [avg(results[i]['rtts']) for i in range(1, len(others) + 1)],
-    #     [avg(results[i]['conn_cost_approx']) for i in range(1, len(others) + 1)],
-    #     'Round trip time (ms)',
-    #     'Number of devices',
-    #     range(1, len(others) + 1),
-    #     'Average message round trip time',
-    #     'Cost of connection establishment (approx.)'
-    # )
-
-    fig = hist_with_line(
-        "Number of devices (excluding master)",
-        "Round trip time (ms)",
-        "Number of messages per second per device",
-        [avg(results[i]['rtts']) for i in range(1, len(others) + 1)],
-        [results[i]['received_msgs'] / results[i]['timespan'] for i in range(1, len(others) + 1)],
-        range(1, len(others) + 1)
-    )
-
-    fig.savefig('asd.png')
+    print 'Collecting info about devices'
+    with tracing.span('discover', addresses=len(addresses)):
+        devices = inventory.discover(addresses, args.port, args.ttl,
+                                     args.discovery_timeout)
+    for device in devices:
+        print '{0}... Hello, {1}!'.format(device['ip'], device['name'])
+    return devices
 
 
-def main():
-    args = parse_args()
+def discover(args):
+    devices = discover_devices(args)
+    print '{0} of {1} devices found, inventory saved in {2}'.format(
+        len(devices), len(args.devices_ip_addresses), inventory.INVENTORY_PATH)
 
-    mac_url = lambda s_ip: 'http://{0}:{1}/mac'.format(s_ip, args.port)
 
-    devices = []
+def plot_jobs(jobs, processes=None):
+    import render
 
-    print 'Collecting info about devices'
-    for t_addr in args.devices_ip_addresses:
-        t_addr = args.net_prefix + t_addr
+    for dest in render.render_all(jobs, processes):
+        print dest
 
-        sys.stdout.write(t_addr + '... ')
-        sys.stdout.flush()
 
-        if args.cache:
-            d = [x for x in HARDCODED_DEVICES if x['ip'] == t_addr]
+def sync_clocks(clocks, devices, port):
+    print 'Syncing clocks'
+    clocks.sync(devices, port)
 
-            if any(d):
-                device = d[0]
-                sys.stdout.write('Hello, {0}!\n'.format(device['name']))
-                sys.stdout.flush()
-                devices.append(device)
-                continue
 
-        t_name, t_mac = requests.get(mac_url(t_addr)).content.split('\n')
-        sys.stdout.write('Hello, {0}!\n'.format(t_name))
-        sys.stdout.flush()
-        devices.append(dict(name=t_name, mac=t_mac, ip=t_addr))
+def collect(args):
+    live = None
+    clocks = None
+    if args.dashboard is not None:
+        import benchmarks
 
-    print devices
+        live = benchmarks.live = dashboard.Dashboard(
+            port=args.dashboard).start()
+        print 'Live results at', live.url
+    if args.clock_sync:
+        import benchmarks
+        import clocksync
 
-    if args.throughput:
-        bench_throughput(devices, 'throughput.png', args.cache)
+        clocks = benchmarks.clocks = clocksync.ClockTable()
 
-    if args.throughput_over_time:
-        plot_throughput_over_time(devices[0], devices[1], args.cache)
+    try:
+        with tracing.span('run'):
+            devices = discover_devices(args)
+            print devices
+            if clocks is not None:
+                sync_clocks(clocks, devices, args.port)
+
+            # figures are only rendered once every benchmark has collected
+            # its data
+            jobs = []
+            for plugin in plugins.selected(args):
+                with tracing.span('plugin', plugin=plugin.name):
+                    jobs += plugin.run(devices, args)
+            if clocks is not None:
+                sync_clocks(clocks, devices, args.port)
+                print 'Clocks saved as', clocks.save()
+            print 'Results saved in', resultstore.RESULTS_DIR
+
+            if args.plot:
+                plot_jobs(jobs, args.render_workers)
+    finally:
+        # also when interrupted, a slow run is what we want to look at
+        print 'Trace saved as', tracing.export(args.trace_dir)
+        if client.unhealthy():
+            print 'Unhealthy devices:', ', '.join(client.unhealthy())
+        client.client.close()
+        if live is not None:
+            live.close()
+
+
+def analyse(args):
+    import histogram
+
+    histogram.report(args.results, args.by_metric)
+
+
+def plot(args):
+    paths = resultstore.job_paths(args.results_dir)
+    if args.names:
+        paths = [p for p in paths if resultstore.job_name(p) in args.names]
+    plot_jobs([resultstore.load_job(p) for p in paths], args.render_workers)
 
-    if args.messages:
-        get_messages_per_sec_throughput(devices, 'messages.png', args.cache)
 
-    if args.token:
-        token_plot(devices, args.cache)
+def main():
+    args = parse_args()
+    dict(discover=discover, collect=collect, analyse=analyse,
+         plot=plot)[args.command](args)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,80 @@
+import json
+import os
+import threading
+import time
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class Manifest(object):
+    # every planned unit of work of a campaign and how far it got, saved
+    # after each change so an interrupted campaign can pick up from there
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.units = {}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.units = json.load(f)['units']
+
+    def _save(self):
+        dirname = os.path.dirname(self.path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(dict(units=self.units), f, indent=1, sort_keys=True)
+        os.rename(tmp_path, self.path)
+
+    def plan(self, units):
+        # units: list of (unit_id, params); already known units keep their
+        # state, a unit that was running when we died goes back to pending
+        with self.lock:
+            for unit_id, params in units:
+                unit = self.units.setdefault(unit_id, dict(
+                    params=params, state=PENDING, attempts=0, result=None))
+                if unit['state'] == RUNNING:
+                    unit['state'] = PENDING
+            self._save()
+
+    def todo(self, unit_ids):
+        return [u for u in unit_ids if self.units[u]['state'] != DONE]
+
+    def get(self, unit_id):
+        return self.units[unit_id]
+
+    def result(self, unit_id):
+        return self.units[unit_id]['result']
+
+    def start(self, unit_id):
+        with self.lock:
+            unit = self.units[unit_id]
+            unit['state'] = RUNNING
+            unit['attempts'] += 1
+            unit['updated'] = time.time()
+            self._save()
+
+    def finish(self, unit_id, ok, result=None):
+        with self.lock:
+            unit = self.units[unit_id]
+            unit['state'] = DONE if ok else FAILED
+            unit['result'] = result
+            unit['updated'] = time.time()
+            self._save()
+
+    def complete(self, unit_ids):
+        return not self.todo(unit_ids)
+
+    def counts(self, unit_ids):
+        counts = dict((s, 0) for s in (PENDING, RUNNING, DONE, FAILED))
+        for u in unit_ids:
+            counts[self.units[u]['state']] += 1
+        return counts
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,83 @@
+import json
+import os
+import threading
+import time
+
+MATRIX_PATH = 'throughput_matrix.json'
+MAX_AGE = 7 * 24 * 60 * 60  # s
+MAX_CV = 0.2  # stddev / mean
+
+
+def pair_key(receiver, sender):
+    return '{0}<-{1}'.format(receiver['mac'], sender['mac'])
+
+
+def fingerprint(device):
+    # what a device looked like when a pair was measured; a phone that was
+    # swapped has another mac (so its pairs are new), one that comes back
+    # with another name was reset or updated
+    return dict(name=device['name'])
+
+
+def cv(stddev):
+    # stddev is (mean, std, ...) as returned by measure_pair
+    mean, std = stddev[0], stddev[1]
+    return std / mean if mean else None
+
+
+class ThroughputMatrix(object):
+    # the last result of every receiver <- sender pair ever measured, with
+    # when it was measured and how noisy it was; saved after each update,
+    # pairs of devices that are not around are kept for when they are back
+
+    def __init__(self, path=MATRIX_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.pairs = {}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.pairs = json.load(f)['pairs']
+
+    def _save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(dict(pairs=self.pairs), f, indent=1, sort_keys=True)
+        os.rename(tmp_path, self.path)
+
+    def get(self, receiver, sender):
+        return self.pairs.get(pair_key(receiver, sender))
+
+    def update(self, receiver, sender, result, now=None):
+        values, stddev, rates = result
+        with self.lock:
+            self.pairs[pair_key(receiver, sender)] = dict(
+                receiver=dict(fingerprint(receiver), mac=receiver['mac']),
+                sender=dict(fingerprint(sender), mac=sender['mac']),
+                values=list(values), stddev=list(stddev), rates=rates,
+                cv=cv(stddev), measured=time.time() if now is None else now)
+            self._save()
+
+    def result(self, receiver, sender):
+        entry = self.get(receiver, sender)
+        return tuple(entry['values']), tuple(entry['stddev']), entry['rates']
+
+    def why_stale(self, receiver, sender, max_age=MAX_AGE, max_cv=MAX_CV,
+                  changed=(), now=None):
+        # why the pair has to be measured again, None if it doesn't
+        entry = self.get(receiver, sender)
+        if entry is None:
+            return 'never measured'
+        for role, device in (('receiver', receiver), ('sender', sender)):
+            if device['mac'] in changed:
+                return '{0} changed'.format(device['name'])
+            if entry[role]['name'] != fingerprint(device)['name']:
+                return '{0} was {1}'.format(device['name'],
+                                            entry[role]['name'])
+        age = (time.time() if now is None else now) - entry['measured']
+        if max_age is not None and age > max_age:
+            return '{0:.1f} days old'.format(age / (24 * 60 * 60))
+        if max_cv is not None and (entry['cv'] is None or
+                                   entry['cv'] > max_cv):
+            return 'noisy, cv {0}'.format(
+                '?' if entry['cv'] is None else '{0:.3g}'.format(entry['cv']))
+        return None
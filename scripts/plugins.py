@@ -0,0 +1,202 @@
+# benchmarks `main.py collect` can run. Every plugin adds a flag that
+# selects it and its own options to the command line; run(devices, args)
+# returns the result jobs. Plugins import the benchmark code when they
+# run, so numpy and friends are not loaded by --help or discovery, and
+# scipy or matplotlib only by the benchmarks that use them
+
+import matrix
+
+PLUGINS = []
+DAY = 24 * 60 * 60  # s
+
+
+class Plugin(object):
+    def __init__(self, name, flags, help, run, add_arguments=None):
+        self.name = name
+        self.flags = flags
+        self.help = help
+        self.run = run
+        self.add_arguments = add_arguments
+
+
+def register(name, flags, help, add_arguments=None):
+    # plugins run in the order they were registered
+    def decorator(run):
+        PLUGINS.append(Plugin(name, flags, help, run, add_arguments))
+        return run
+    return decorator
+
+
+def selected(args):
+    return [p for p in PLUGINS if getattr(args, p.name)]
+
+
+def throughput_arguments(group):
+    group.add_argument('--adaptive', '-a', dest='adaptive',
+                       action='store_const', const=True, default=False,
+                       help='Measure each pair until the confidence '
+                            'interval of the mean is narrow enough')
+
+    group.add_argument('--ci-width', dest='ci_width', type=float,
+                       metavar='FRACTION', default=None,
+                       help='Target width of the confidence interval, as a '
+                            'fraction of the mean (adaptive mode)')
+
+    group.add_argument('--min-iterations', dest='min_iterations', type=int,
+                       metavar='N', default=None,
+                       help='Samples to take at least (adaptive mode)')
+
+    group.add_argument('--max-iterations', dest='max_iterations', type=int,
+                       metavar='N', default=None,
+                       help='Samples to take at most (adaptive mode)')
+
+    group.add_argument('--batch', dest='batch', type=int, metavar='N',
+                       default=None,
+                       help='Iterations per /throughput request (adaptive '
+                            'mode)')
+
+    group.add_argument('--manifest', type=str, metavar='PATH', default=None,
+                       help='Manifest of the throughput test; an '
+                            'interrupted test is resumed from it')
+
+    group.add_argument('--fresh', dest='fresh', action='store_const',
+                       const=True, default=False,
+                       help='Forget an interrupted throughput test and '
+                            'start over')
+
+    group.add_argument('--incremental', '-i', dest='incremental',
+                       action='store_const', const=True, default=False,
+                       help='Only measure the pairs that are new, involve a '
+                            'changed device, are too old or too noisy; the '
+                            'others come from the saved matrix')
+
+    group.add_argument('--max-age', dest='max_age', type=float,
+                       metavar='DAYS', default=matrix.MAX_AGE / DAY,
+                       help='Age after which a pair is measured again '
+                            '(incremental mode, default: %(default)g)')
+
+    group.add_argument('--max-cv', dest='max_cv', type=float,
+                       metavar='CV', default=matrix.MAX_CV,
+                       help='Coefficient of variation above which a pair is '
+                            'measured again (incremental mode, default: '
+                            '%(default)g)')
+
+    group.add_argument('--changed', dest='changed', action='append',
+                       metavar='DEVICE', default=[],
+                       help='Device (name, ip or mac) that was swapped or '
+                            'updated, all its pairs are measured again; '
+                            'repeat for more (incremental mode)')
+
+    group.add_argument('--matrix', type=str, metavar='PATH',
+                       default=matrix.MATRIX_PATH,
+                       help='Where the latest result of every pair is kept '
+                            '(default: %(default)s)')
+
+
+@register('throughput', ('--throughput', '-t'), 'Throughput test.',
+          throughput_arguments)
+def run_throughput(devices, args):
+    import benchmarks
+    import manifest
+
+    manifest_path = args.manifest or benchmarks.THROUGHPUT_MANIFEST
+    if args.fresh:
+        manifest.Manifest(manifest_path).remove()
+    adaptive = None
+    if args.adaptive:
+        # the defaults fill in what is not given
+        adaptive = dict((k, getattr(args, k)) for k in (
+            'batch', 'ci_width', 'min_iterations', 'max_iterations')
+            if getattr(args, k) is not None)
+    incremental = None
+    if args.incremental:
+        incremental = dict(
+            max_age=args.max_age * DAY, max_cv=args.max_cv,
+            changed=[d['mac'] for d in devices
+                     if set(args.changed) & set((d['name'], d['ip'],
+                                                 d['mac']))])
+    return benchmarks.bench_throughput(devices, 'throughput.png', args.cache,
+                                       args.concurrency, args.port,
+                                       manifest_path, adaptive,
+                                       args.matrix, incremental)
+
+
+def throughput_over_time_arguments(group):
+    group.add_argument('--iterations', type=int, metavar='N', default=None,
+                       help='Transfers per direction in the throughput over '
+                            'time test (default: the device default)')
+
+    group.add_argument('--window', type=int, metavar='N', default=None,
+                       help='Samples in the sliding window of the '
+                            'throughput over time test')
+
+
+@register('throughput_over_time', ('--throughput-over-time', '-T'),
+          'Throughput over time test.', throughput_over_time_arguments)
+def run_throughput_over_time(devices, args):
+    import benchmarks
+
+    return benchmarks.plot_throughput_over_time(
+        devices[0], devices[1], args.cache, args.port, args.iterations,
+        args.window)
+
+
+def messages_arguments(group):
+    group.add_argument('--n-messages', dest='n_messages', type=int,
+                       metavar='N', default=None,
+                       help='Messages per target in the messages test')
+
+    group.add_argument('--message-size', dest='message_size', type=int,
+                       metavar='BYTES', default=None,
+                       help='Size of every message in the messages test '
+                            '(default: the device default)')
+
+
+@register('messages', ('--messages', '-m'), 'Messages per second test.',
+          messages_arguments)
+def run_messages(devices, args):
+    import benchmarks
+
+    return benchmarks.get_messages_per_sec_throughput(
+        devices, 'messages.png', args.cache, args.port,
+        args.n_messages or benchmarks.N_MESSAGES, args.message_size)
+
+
+@register('token', ('--token', '-k'), 'Token RTT test.')
+def run_token(devices, args):
+    import benchmarks
+
+    return benchmarks.token_plot(devices, 'token.png', args.cache, args.port)
+
+
+def sweep_arguments(group):
+    group.add_argument('--sweep-counts', dest='sweep_counts', type=int,
+                       nargs='+', metavar='N', default=None,
+                       help='Messages per target of the sweep')
+
+    group.add_argument('--sweep-sizes', dest='sweep_sizes', type=int,
+                       nargs='+', metavar='BYTES', default=None,
+                       help='Message sizes of the sweep')
+
+    group.add_argument('--sweep-fanouts', dest='sweep_fanouts', type=int,
+                       nargs='+', metavar='N', default=None,
+                       help='Numbers of targets of the sweep (default: 1 '
+                            'up to every other device)')
+
+    group.add_argument('--sweep-masters', dest='sweep_masters', type=int,
+                       metavar='N', default=1,
+                       help='Split the devices in N disjoint groups, each '
+                            'with its own master, swept concurrently')
+
+
+@register('sweep', ('--sweep', '-w'),
+          'Messages sweep over message count, size and fan-out.',
+          sweep_arguments)
+def run_sweep(devices, args):
+    import benchmarks
+    import sweep
+
+    return benchmarks.bench_messages_sweep(
+        devices, 'messages-sweep.png', args.cache, args.port,
+        args.sweep_counts or sweep.COUNTS, args.sweep_sizes or sweep.SIZES,
+        args.sweep_fanouts, args.sweep_masters, args.concurrency)
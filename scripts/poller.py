@@ -0,0 +1,173 @@
+import heapq
+import itertools
+import Queue
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+import requests
+
+import client
+import tracing
+
+# rough cost of a single hop of the token: TokenRTTBenchmark sleeps a
+# random 0-2 s before every ping, then connects and sends the payload
+HOP_SLEEP = 1.0  # s, on average
+HOP_CONNECT = 1.0  # s
+SECONDS_PER_BYTE = 1.0 / (50 * 1024)
+
+FIRST_POLL = 0.8  # fraction of the expected duration
+MIN_INTERVAL = 0.5  # s
+MAX_INTERVAL = 10.0  # s
+DEADLINE_FACTOR = 3.0
+MIN_DEADLINE = 30.0  # s
+REQUEST_TIMEOUT = 5.0  # s
+# blocking calls without a timeout can't be interrupted with ^C on py2
+FOREVER = 365 * 24 * 60 * 60
+
+
+def expected_duration(payload_length, rounds, ring_size):
+    hop = HOP_SLEEP + HOP_CONNECT + payload_length * SECONDS_PER_BYTE
+    return hop * ring_size * rounds
+
+
+def count_rows(content):
+    lines = [l for l in content.strip().split('\n') if l]
+    return max(len(lines) - 1, 0)  # header
+
+
+class TokenJob(object):
+    def __init__(self, master_ip, uuid, ring_size, payload_length, rounds,
+                 deadline=None):
+        self.master_ip = master_ip
+        self.uuid = uuid
+        # the master stores results after every round, so /tokres answers
+        # 200 well before the whole run is over
+        self.min_rows = ring_size * rounds
+        self.expected = expected_duration(payload_length, rounds, ring_size)
+        self.started = time.time()
+        if deadline is None:
+            deadline = max(DEADLINE_FACTOR * self.expected, MIN_DEADLINE)
+        self.deadline = self.started + deadline
+
+        self.interval = min(max(MIN_INTERVAL, self.expected / 10), MAX_INTERVAL)
+        self.polls = 0
+        self.response = None
+        self.ok = False
+        self.finished = None
+        self._done = threading.Event()
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def next_poll(self, now):
+        if self.polls == 0:
+            at = self.started + max(FIRST_POLL * self.expected, MIN_INTERVAL)
+        else:
+            at = now + self.interval
+            self.interval = min(self.interval * 2, MAX_INTERVAL)
+        return min(at, self.deadline)
+
+    def _finish(self, ok):
+        with self._lock:
+            self.ok = ok
+            self.finished = time.time()
+            self._done.set()
+            listeners, self._listeners = self._listeners, []
+        for q in listeners:
+            q.put(self)
+
+    def _listen(self, q):
+        with self._lock:
+            if not self._done.is_set():
+                self._listeners.append(q)
+                return
+        q.put(self)
+
+    def wait(self, timeout=None):
+        # the last /tokres response (complete if self.ok), None if there
+        # never was a successful one
+        self._done.wait(FOREVER if timeout is None else timeout)
+        return self.response
+
+
+class TokenPoller(object):
+    def __init__(self, workers=8, port=38080):
+        self.port = port
+        self.pool = ThreadPool(workers)
+        self.queue = []
+        self.seq = itertools.count()
+        self.cond = threading.Condition()
+        self.closed = False
+
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _schedule(self, job, at):
+        with self.cond:
+            heapq.heappush(self.queue, (at, next(self.seq), job))
+            self.cond.notify()
+
+    def submit(self, master_ip, uuid, ring_size, payload_length, rounds,
+               deadline=None):
+        job = TokenJob(master_ip, uuid, ring_size, payload_length, rounds,
+                       deadline)
+        # its polls are spans of whatever submitted it
+        job.poll = tracing.bind(self._poll)
+        self._schedule(job, job.next_poll(time.time()))
+        return job
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.closed and (
+                        not self.queue or self.queue[0][0] > time.time()):
+                    timeout = self.queue[0][0] - time.time() if self.queue else None
+                    self.cond.wait(timeout)
+                if self.closed:
+                    return
+                _, _, job = heapq.heappop(self.queue)
+            self.pool.apply_async(job.poll, (job,))
+
+    def _poll(self, job):
+        url = 'http://{0}:{1}/tokres'.format(job.master_ip, self.port)
+        job.polls += 1
+        tracing.count('token_polls_total')
+        try:
+            # polling is its own retry, failures only feed the breaker
+            with tracing.span('poll_tokres', uuid=job.uuid, poll=job.polls):
+                r = client.get(url, params=dict(uuid=job.uuid),
+                               timeout=REQUEST_TIMEOUT, retries=0)
+            if r.status_code == 200:
+                job.response = r
+        except requests.RequestException:
+            pass
+
+        now = time.time()
+        if job.response is not None \
+                and count_rows(job.response.content) >= job.min_rows:
+            job._finish(True)
+        elif now >= job.deadline or not client.healthy(job.master_ip):
+            # a master given up on won't answer before the deadline either
+            job._finish(False)
+        else:
+            self._schedule(job, job.next_poll(now))
+
+    def as_completed(self, jobs):
+        q = Queue.Queue()
+        for job in jobs:
+            job._listen(q)
+        for _ in xrange(len(jobs)):
+            yield q.get(True, FOREVER)
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        self.thread.join()
+        self.pool.close()
+        self.pool.join()
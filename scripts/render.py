@@ -0,0 +1,408 @@
+import sys
+from multiprocessing import Pool
+
+import matplotlib
+# never pick an interactive backend, rendering runs headless in workers
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy
+
+import resultstore
+import tracing
+
+HOP_COLORS = dict(sleep='0.8', connect='r', transfer='b', response='g')
+
+
+def mk_groups(data):
+    try:
+        newdata = data.items()
+    except AttributeError:
+        return
+
+    thisgroup = []
+    groups = []
+    for key, value in newdata:
+        newgroups = mk_groups(value)
+        if newgroups is None:
+            thisgroup.append((key, value))
+        else:
+            thisgroup.append((key, len(newgroups[-1])))
+            if groups:
+                groups = [g + n for n, g in zip(newgroups, groups)]
+            else:
+                groups = newgroups
+    return [thisgroup] + groups
+
+
+def add_line(ax, xpos, ypos):
+    line = plt.Line2D([xpos, xpos], [ypos + .1, ypos],
+                      transform=ax.transAxes, color='black')
+    line.set_clip_on(False)
+    ax.add_line(line)
+
+
+def label_group_bar(fig, ax, data, ylabel):
+    groups = mk_groups(data)
+    xy = groups.pop()
+    x, y = zip(*xy)
+    ly = len(y)
+    xticks = range(1, ly + 1)
+
+    ax.bar(xticks, y, align='center')
+    ax.set_xticks(xticks)
+    ax.set_xticklabels(x, rotation='vertical')
+    ax.set_xlim(.5, ly + .5)
+    ax.yaxis.grid(True)
+
+    plt.ylabel(ylabel)
+
+    scale = 1. / ly
+    for pos in xrange(ly + 1):
+        add_line(ax, pos * scale, -.1)
+    ypos = 1.02
+    while groups:
+        group = groups.pop()
+        pos = 0
+        for label, rpos in group:
+            lxpos = (pos + .5 * rpos) * scale
+            ax.text(lxpos, ypos, label, ha='center', transform=ax.transAxes)
+            add_line(ax, pos * scale, 1)
+            pos += rpos
+        add_line(ax, pos * scale, 1)
+        ypos -= .1
+
+
+def label_group_bar_with_err(fig, ax, data, ylabel):
+    groups = mk_groups(data)
+    xy = groups.pop()
+    x, y = zip(*xy)
+    ly = len(y)
+    xticks = range(1, ly + 1)
+
+    yerr=\
+        [map(lambda _y: _y[1], y), map(lambda _y: _y[2], y)] if len(y[0]) == 3 else map(lambda _y: _y[1], y)
+
+    ax.errorbar(xticks,
+           map(lambda _y: _y[0], y),
+           yerr=yerr,
+           fmt='o')
+    ax.set_xticks(xticks)
+    ax.set_xticklabels(x, rotation='vertical')
+    ax.set_xlim(.5, ly + .5)
+    ax.yaxis.grid(True)
+
+    plt.ylabel(ylabel)
+
+    scale = 1. / ly
+    for pos in xrange(ly + 1):
+        add_line(ax, pos * scale, -.1)
+    ypos = 1.02
+    while groups:
+        group = groups.pop()
+        pos = 0
+        for label, rpos in group:
+            lxpos = (pos + .5 * rpos) * scale
+            ax.text(lxpos, ypos, label, ha='center', transform=ax.transAxes)
+            add_line(ax, pos * scale, 1)
+            pos += rpos
+        add_line(ax, pos * scale, 1)
+        ypos -= .1
+
+
+def double_bar_plot(data1, data2, ylabel, xlabel, xlabels, data1_label, data2_label):
+    assert len(data1) == len(data2), 'data1 and data2 must have same length'
+
+    fig, ax = plt.subplots()
+    ind = range(1, len(data1) + 1)
+    width = 0.35
+
+    rects1 = ax.bar(ind, data1, width, color='b')
+    rects2 = ax.bar(map(lambda x: x+width, ind), data2, width, color='r')
+    ax.set_ylabel(ylabel)
+    ax.set_xlabel(xlabel)
+    ax.set_xticks(map(lambda x: x+width, ind))
+
+    ax.set_xticklabels(xlabels)
+    ax.legend((rects1[0], rects2[0]), (data1_label, data2_label))
+    fig.subplots_adjust(bottom=0.3)
+    return fig
+
+
+def simple_hist(data, xlabel, xlabels, ylabel):
+    fig, ax = plt.subplots()
+    width = 0.8
+    left_margins = [i + (1 - width)/2 for i in range(len(data))]
+
+    rects1 = ax.bar(left_margins, data, width, color='b')
+    ax.set_ylabel(ylabel)
+    ax.set_xticks([x + width / 2 for x in left_margins])
+    ax.set_xlabel(xlabel)
+    ax.set_xticklabels(xlabels)
+    fig.subplots_adjust(bottom=0.3)
+    return fig
+
+
+def hist_with_line(xlabel, ylabel_sx, ylabel_dx, data_bars, data_line, xlabels):
+    assert len(data_line) == len(data_bars), "datasets mush be the same length"
+
+    fig, ax = plt.subplots()
+    width = 0.7
+    left_margins = [i + (1 - width)/2 for i in range(len(data_bars))]
+
+    rects1 = ax.bar(left_margins, data_bars, width, color='b')
+    ax.set_ylabel(ylabel_sx, color='b')
+    ax.set_xticks([x + width / 2 for x in left_margins])
+    ax.set_xlabel(xlabel)
+    ax.set_xticklabels(xlabels)
+    ax.yaxis.grid(True)
+    ax.xaxis.grid(True)
+
+    for tl in ax.get_yticklabels():
+        tl.set_color('b')
+
+    ax2 = ax.twinx()
+    ax2.set_ylabel(ylabel_dx, color='r')
+    ax2.plot(
+        [m + width / 2 for m in left_margins],
+        data_line,
+        color='r',
+        marker='o'
+    )
+    ax2.margins(0.1, 0.1)
+    ax2.set_ylim([0, None])
+
+    fig.subplots_adjust(bottom=0.3)
+    for tl in ax2.get_yticklabels():
+        tl.set_color('r')
+    return fig
+
+
+def stacked_bars(data1, data2, xlabel, xlabels, ylabel, legend1, legend2):
+    assert len(data1) == len(data2)
+
+    fig, ax = plt.subplots()
+    width = 0.8
+    left_margins = [i + (1 - width)/2 for i in range(len(data1))]
+
+    rects1 = ax.bar(left_margins, data1, width, color='b')
+    rects2 = ax.bar(left_margins, data2, width, bottom=data1, color='r')
+    ax.set_ylabel(ylabel)
+    ax.set_xticks([x + width / 2 for x in left_margins])
+    ax.set_xlabel(xlabel)
+    ax.set_xticklabels(xlabels)
+    fig.subplots_adjust(bottom=0.3)
+    ax.legend((rects1[0], rects2[0]), (legend1, legend2))
+    return fig
+
+
+def plot_throughput(data, dest_path):
+    # no link measured, nothing to draw
+    if not data:
+        return None
+    fig = plt.figure()
+    ax = fig.add_subplot(1, 1, 1)
+    label_group_bar_with_err(fig, ax, data, 'Throughput (kbits / s)')
+    fig.subplots_adjust(bottom=0.3)
+    return fig
+
+
+def plot_token(data, dest_path):
+    fig = stacked_bars(data['conns'], data['rtts'], 'Size of payload (KB)',
+                       map(str, data['sizes']), 'Time (ms)',
+                       'Connection cost', 'RTT')
+    fig.subplots_adjust(bottom=0.3)
+    return fig
+
+
+def plot_messages(data, dest_path):
+    return hist_with_line(
+        "Number of devices (excluding master)",
+        "Round trip time (ms)",
+        "Number of messages per second per device",
+        data['rtts'],
+        data['msgs_per_sec'],
+        data['devices']
+    )
+
+
+def plot_throughput_over_time(data, dest_path):
+    # data is already downsampled by timeseries.throughput_series
+    fig, ax = plt.subplots()
+    for start, end in data['stalls']:
+        ax.axvspan(start, end, color='r', alpha=0.2, lw=0)
+    pct = data['percentiles']
+    if pct:
+        ax.fill_between(data['band_t'], pct['10'], pct['90'], color='b',
+                        alpha=0.15, lw=0, label='p10-p90')
+    ax.plot(data['t'], data['kbps'], '.', color='0.6', markersize=3,
+            label='samples')
+    ax.plot(data['mean_t'], data['mean'], '-', color='b',
+            label='mean of {0}'.format(data['window']))
+    ax.plot(data['ewma_t'], data['ewma'], '-', color='g', label='EWMA')
+    ax.set_title('{0} <- {1}'.format(data['receiver'], data['sender']))
+    ax.set_xlabel('Time (s)')
+    ax.set_ylabel('Throughput (kbits / s)')
+    ax.set_ylim(0, None)
+    ax.legend(loc='lower right', fontsize='small')
+    return fig
+
+
+def plot_messages_sweep(data, dest_path):
+    # messages/s against fan-out, one line per master, count and size,
+    # with the fitted scalability curve and its peak
+    fig, ax = plt.subplots(figsize=(9, 6))
+    colors = plt.rcParams['axes.prop_cycle'].by_key()['color']
+    for i, s in enumerate(data['series']):
+        color = colors[i % len(colors)]
+        label = '{0}, {1} x {2} KB'.format(s['master'], s['messages'],
+                                           s['size'] / 1024)
+        ax.plot(s['fanouts'], s['rates'], 'o', color=color, label=label)
+        fit = s['fit']
+        if fit is None:
+            ax.plot(s['fanouts'], s['rates'], '-', color=color, alpha=0.5)
+            continue
+        ax.plot(fit['curve_x'], fit['curve_y'], '--', color=color)
+        if fit['peak'] is not None and fit['saturated']:
+            ax.axvline(fit['peak'], color=color, ls=':')
+
+    ax.set_xlabel('Number of targets')
+    ax.set_ylabel('Messages per second (all targets)')
+    ax.set_ylim(0, None)
+    ax.yaxis.grid(True)
+    ax.legend(loc='best', fontsize='small')
+    return fig
+
+
+def plot_token_heatmap(data, dest_path):
+    # one sender x receiver matrix per phase of a hop; links that were
+    # never used are left blank; jobs saved before failed runs were left
+    # out can have no hops
+    devices = data['devices']
+    if not devices:
+        return None
+    phases = data['phases']
+    fig, axes = plt.subplots(2, 2, figsize=(10, 9))
+    for ax, phase in zip(axes.flat, phases):
+        m = numpy.ma.masked_invalid(
+            numpy.array(data['matrices'][phase], dtype=numpy.float64))
+        im = ax.imshow(m, cmap='viridis', interpolation='nearest')
+        fig.colorbar(im, ax=ax, label='ms')
+        ax.set_title(phase)
+        ax.set_xticks(range(len(devices)))
+        ax.set_yticks(range(len(devices)))
+        ax.set_xticklabels(devices, rotation='vertical', fontsize='small')
+        ax.set_yticklabels(devices, fontsize='small')
+        ax.set_xlabel('Receiver')
+        ax.set_ylabel('Sender')
+        if len(devices) <= 8:
+            for (i, j), v in numpy.ndenumerate(m.filled(numpy.nan)):
+                if not numpy.isnan(v):
+                    ax.text(j, i, '{0:.0f}'.format(v), ha='center',
+                            va='center', color='w', fontsize='small')
+    fig.suptitle('Token hops, payload {0} B'.format(data['payload']))
+    fig.tight_layout(rect=(0, 0, 1, 0.96))
+    return fig
+
+
+def plot_token_timeline(data, dest_path):
+    # every round on its own line, hops one after the other (each hop is
+    # timed by its own sender, so hops are laid out back to back)
+    if not data['rounds']:
+        return None
+    phases = data['phases']
+    fig, ax = plt.subplots(figsize=(12, 1 + 0.5 * len(data['rounds'])))
+    for r, hops in enumerate(data['rounds']):
+        x = 0
+        for hop in hops:
+            for phase, duration in zip(phases, hop):
+                ax.broken_barh([(x, duration)], (r - 0.4, 0.8),
+                               facecolors=HOP_COLORS[phase])
+                x += duration
+            ax.plot([x, x], [r - 0.45, r + 0.45], color='k', lw=0.5)
+
+    ax.set_yticks(range(len(data['rounds'])))
+    ax.set_yticklabels(['round {0}'.format(r + 1)
+                        for r in xrange(len(data['rounds']))])
+    ax.invert_yaxis()
+    ax.set_xlabel('Time (ms)')
+    ax.set_title('Token rounds, payload {0} B ({1})'.format(
+        data['payload'], ' > '.join(data['devices'])))
+    ax.legend([plt.Rectangle((0, 0), 1, 1, fc=HOP_COLORS[p]) for p in phases],
+              phases, loc='lower right', fontsize='small')
+    fig.tight_layout()
+    return fig
+
+
+RENDERERS = {
+    'throughput': plot_throughput,
+    'token': plot_token,
+    'messages': plot_messages,
+    'throughput_over_time': plot_throughput_over_time,
+    'messages_sweep': plot_messages_sweep,
+    'token_heatmap': plot_token_heatmap,
+    'token_timeline': plot_token_timeline,
+}
+
+
+def render_job(job):
+    # the dest of the figure, None when its data had nothing to plot
+    fig = RENDERERS[job['kind']](job['data'], job['dest'])
+    if fig is None:
+        return None
+    try:
+        fig.savefig(job['dest'])
+    finally:
+        plt.close(fig)
+    return job['dest']
+
+
+def render_traced(job):
+    # workers don't share the tracer of the main process, their spans are
+    # sent back with the result; so is the error of a figure that failed,
+    # the other figures are rendered all the same
+    tracing.reset()
+    dest, error = None, None
+    with tracing.span('render', kind=job['kind'], dest=job['dest']):
+        try:
+            dest = render_job(job)
+        except Exception as e:
+            error = '{0}: {1}'.format(type(e).__name__, e)
+    return dest, error, tracing.tracer.spans
+
+
+def render_all(jobs, processes=None):
+    if not jobs:
+        return []
+
+    print 'Rendering {0} figures...'.format(len(jobs))
+    with tracing.span('render_all', jobs=len(jobs)):
+        pool = Pool(processes)
+        try:
+            rendered = pool.map(render_traced, jobs)
+        finally:
+            pool.close()
+            pool.join()
+
+        for _, _, spans in rendered:
+            tracing.tracer.merge(spans, tracing.tracer.current())
+
+    failed = [(job, error) for job, (_, error, _) in zip(jobs, rendered)
+              if error is not None]
+    for job, error in failed:
+        print 'could not render', job['dest'], '-', error
+        tracing.count('render_failures_total', kind=job['kind'])
+    if failed:
+        print '{0} of {1} figures failed'.format(len(failed), len(jobs))
+    return [dest for dest, _, _ in rendered if dest is not None]
+
+
+def main():
+    for dest in render_all([resultstore.load_job(p) for p in sys.argv[1:]]):
+        print dest
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import ingest
+import tracing
+
+CACHE_DIR = 'csv'
+INDEX_NAME = 'index.json'
+# bump when the layout of cached reports changes, old entries stop matching
+CACHE_VERSION = 1
+DEFAULT_MAX_AGE = 30 * 24 * 60 * 60  # s
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+
+def make_key(kind, params):
+    canonical = json.dumps(dict(params, kind=kind, version=CACHE_VERSION),
+                           sort_keys=True)
+    return hashlib.sha1(canonical).hexdigest()
+
+
+class ResultCache(object):
+    def __init__(self, root=CACHE_DIR, max_age=DEFAULT_MAX_AGE,
+                 max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(root, INDEX_NAME)
+        self.lock = threading.Lock()
+        self.index = self._load_index()
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return {}
+        try:
+            with open(self.index_path, 'r') as f:
+                return json.load(f)
+        except ValueError:
+            return {}
+
+    def _save_index(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.index, f, indent=1, sort_keys=True)
+        os.rename(tmp_path, self.index_path)
+
+    def _path(self, kind, key):
+        return os.path.join(self.root, kind, key + '.csv')
+
+    def _drop(self, key):
+        entry = self.index.pop(key)
+        if os.path.exists(entry['path']):
+            os.remove(entry['path'])
+
+    def lookup(self, kind, params):
+        key = make_key(kind, params)
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry['created'] > self.max_age \
+                    or not os.path.exists(entry['path']):
+                self._drop(key)
+                self._save_index()
+                return None
+            entry['used'] = time.time()
+            return entry['path']
+
+    def entry(self, kind, params):
+        with self.lock:
+            return self.index.get(make_key(kind, params))
+
+    def annotate(self, kind, params, **facts):
+        # facts about a stored report that are not in it, e.g. the clock
+        # offsets of its devices when it was taken
+        key = make_key(kind, params)
+        with self.lock:
+            if key in self.index:
+                self.index[key].update(facts)
+                self._save_index()
+
+    def evict(self):
+        now = time.time()
+        with self.lock:
+            for key, entry in self.index.items():
+                if now - entry['created'] > self.max_age:
+                    self._drop(key)
+
+            # least recently used go first
+            total = sum(e['size'] for e in self.index.itervalues())
+            by_use = sorted(self.index.items(), key=lambda (k, e): e['used'])
+            for key, entry in by_use:
+                if total <= self.max_bytes:
+                    break
+                total -= entry['size']
+                self._drop(key)
+
+            self._save_index()
+
+    def _store(self, kind, params, response):
+        # only a report with rows is kept: an error or an empty report
+        # would be served again to every retry and every later run. It is
+        # fetched next to the entry it replaces, which stays otherwise
+        if response.status_code != 200:
+            print kind, 'report failed with status', response.status_code
+            response.close()
+            return
+        key = make_key(kind, params)
+        path = self._path(kind, key)
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError:
+            pass  # already there
+
+        fetched = path + '.fetched'
+        n = 0
+        for row in ingest.iter_response(response, fetched):
+            n += 1
+            yield row
+        if not n:
+            os.remove(fetched)
+            return
+        os.rename(fetched, path)
+
+        now = time.time()
+        tracing.count('bytes_fetched_total', os.path.getsize(path), kind=kind)
+        with self.lock:
+            self.index[key] = dict(kind=kind, params=params, path=path,
+                                   size=os.path.getsize(path),
+                                   created=now, used=now)
+        self.evict()
+
+    def rows(self, kind, params, fetch, cached=True):
+        # rows of the report for kind/params: from disk on a hit, otherwise
+        # fetch() is called for a streamed response that gets stored
+        path = self.lookup(kind, params) if cached else None
+        if path is not None:
+            print 'cache hit:', kind, params
+            tracing.count('cache_hits_total', kind=kind)
+            return ingest.read_report(path)
+
+        tracing.count('cache_misses_total', kind=kind)
+        response = fetch()
+        if response is None:
+            return []
+        return self._store(kind, params, response)
@@ -0,0 +1,44 @@
+import glob
+import json
+import os
+
+RESULTS_DIR = 'results'
+
+
+def job_name(path):
+    # figure.png and its result figure.json are both "figure"
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def job_path(dest_path, results_dir=RESULTS_DIR):
+    return os.path.join(results_dir, job_name(dest_path) + '.json')
+
+
+def make_job(kind, dest_path, data, samples=None, results_dir=RESULTS_DIR,
+             histograms=None):
+    # aggregated results are saved next to the figures, so they can be
+    # rendered again (or elsewhere) without collecting anything; samples
+    # ({metric: {key: [values]}}) are the raw values behind them, for
+    # compare.py, histograms ({metric: {key: Histogram}}) can be merged
+    # with other runs by histogram.py
+    job = dict(kind=kind, dest=dest_path, data=data)
+    if samples is not None:
+        job['samples'] = samples
+    if histograms is not None:
+        job['histograms'] = dict(
+            (metric, dict((key, h.to_dict()) for key, h in hs.iteritems()))
+            for metric, hs in histograms.iteritems())
+    if not os.path.exists(results_dir):
+        os.makedirs(results_dir)
+    with open(job_path(dest_path, results_dir), 'w') as f:
+        json.dump(job, f, indent=1, sort_keys=True)
+    return job
+
+
+def load_job(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def job_paths(results_dir=RESULTS_DIR):
+    return sorted(glob.glob(os.path.join(results_dir, '*.json')))
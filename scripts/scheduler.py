@@ -0,0 +1,41 @@
+from multiprocessing.pool import ThreadPool
+
+
+def round_robin(n):
+    # circle method: every round is a set of disjoint pairs and every
+    # unordered pair of 0..n-1 shows up in exactly one round
+    slots = range(n)
+    if n % 2:
+        slots.append(None)
+    size = len(slots)
+
+    rounds = []
+    for _ in xrange(size - 1):
+        pairs = [(slots[i], slots[size - 1 - i]) for i in xrange(size / 2)]
+        rounds.append([p for p in pairs if None not in p])
+        slots = [slots[0], slots[-1]] + slots[1:-1]
+    return rounds
+
+
+def directed_rounds(n):
+    # each ordered pair (a, b) once: the second half replays the
+    # schedule with directions swapped
+    rounds = round_robin(n)
+    return rounds + [[(b, a) for a, b in r] for r in rounds]
+
+
+def run_rounds(rounds, func, concurrency=None):
+    widest = max([len(r) for r in rounds] or [1])
+    if concurrency is None or concurrency > widest:
+        concurrency = widest
+
+    results = {}
+    pool = ThreadPool(max(concurrency, 1))
+    try:
+        for pairs in rounds:
+            done = pool.map(lambda pair: func(*pair), pairs)
+            results.update(zip(pairs, done))
+    finally:
+        pool.close()
+        pool.join()
+    return results
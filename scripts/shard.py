@@ -0,0 +1,397 @@
+# one token ring campaign split over several controllers, e.g. one per lab:
+#
+#   shard.py plan --shard lab1=192.168.1. --shard lab2=10.0.1.
+#   token_ring.py --plan campaign_plan.json --shard lab1 --results-dir r1
+#   token_ring.py --plan campaign_plan.json --shard lab2 --results-dir r2
+#   shard.py merge r1 r2
+#
+# every ring goes to one shard that reaches all its devices, so no two
+# controllers drive the same device. A shard keeps its own results dir
+# and manifest; merge puts the reports of every shard together, one per
+# unit, with where each came from. reshard hands what is not done yet to
+# the shards given (e.g. without a controller that died) as the next
+# generation of the plan
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import socket
+import time
+
+import campaign
+import inventory
+import manifest
+import token_ring
+
+PLAN_PATH = 'campaign_plan.json'
+SHARD_INFO = 'shard.json'
+PROVENANCE = 'provenance.json'
+
+
+def save_json(data, path):
+    dirname = os.path.dirname(path)
+    if dirname and not os.path.exists(dirname):
+        os.makedirs(dirname)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+    os.rename(tmp_path, path)
+
+
+def load_json(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def parse_shard(spec):
+    # NAME=DEVICE,DEVICE,... where a device is a name, an ip, a mac or an
+    # ip prefix ending with a dot (a whole subnet)
+    name, sep, devices = spec.partition('=')
+    if not sep or not name or not devices:
+        raise argparse.ArgumentTypeError(
+            'expected NAME=DEVICE,..., got {0!r}'.format(spec))
+    return name, devices.split(',')
+
+
+def matches(device, selectors):
+    for s in selectors:
+        if s in (device['name'], device['ip'], device['mac']):
+            return True
+        if s.endswith('.') and device['ip'].startswith(s):
+            return True
+    return False
+
+
+def ring_key(macs):
+    return ','.join(sorted(macs))
+
+
+def assign(rings, reach):
+    # rings: [(macs, units)], reach: {shard: set of macs}. The biggest rings
+    # go first, each to the least loaded shard that reaches all its
+    # devices; [(macs, shard)], shard None when no shard does
+    load = dict((name, 0) for name in reach)
+    out = []
+    for macs, units in sorted(rings, key=lambda r: (-r[1], ring_key(r[0]))):
+        eligible = [name for name in sorted(reach) if set(macs) <= reach[name]]
+        if not eligible:
+            out.append((macs, None))
+            continue
+        shard = min(eligible, key=lambda name: load[name])
+        load[shard] += units
+        out.append((macs, shard))
+    return out
+
+
+def shard_devices(devices, shard_specs):
+    shards = {}
+    for name, selectors in shard_specs:
+        shards[name] = dict(devices=[d['mac'] for d in devices
+                                     if matches(d, selectors)])
+    return shards
+
+
+def make_plan(devices, shard_specs, ring_size=None,
+              payload_lengths=token_ring.PAYLOAD_LENGTHS):
+    devices = [dict(name=d['name'], ip=d['ip'], mac=d['mac'])
+               for d in devices]
+    by_mac = dict((d['mac'], d) for d in devices)
+    shards = shard_devices(devices, shard_specs)
+
+    # rings are made within every shard, out of the devices no earlier
+    # shard has taken: rings never share a device, so the shards never
+    # drive one at the same time
+    rings = []
+    taken = set()
+    for name, _ in shard_specs:
+        members = [by_mac[m] for m in shards[name]['devices']
+                   if m not in taken]
+        taken.update(d['mac'] for d in members)
+        rings += [r for r in campaign.split_rings(members, ring_size)
+                  if len(r) >= 2]
+
+    units = {}
+    reach = dict((name, set(s['devices'])) for name, s in shards.iteritems())
+    for macs, shard in assign(
+            [([d['mac'] for d in ring], len(campaign.ring_tests(
+                ring, payload_lengths))) for ring in rings],
+            reach):
+        for ds, pl in campaign.ring_tests([by_mac[m] for m in macs],
+                                          payload_lengths):
+            units[campaign.unit_id(ds, pl)] = dict(
+                ordering=[d['mac'] for d in ds], payload_length=pl,
+                shard=shard)
+
+    return dict(campaign=time.strftime('%Y%m%d-%H%M%S'), generation=0,
+                payload_lengths=list(payload_lengths), devices=devices,
+                shards=shards, units=units)
+
+
+def shard_work(plan, name):
+    # (rings, unit ids) left to shard name
+    units = set(uid for uid, u in plan['units'].iteritems()
+                if u['shard'] == name and not u.get('done'))
+    rings = {}
+    for uid in units:
+        macs = plan['units'][uid]['ordering']
+        rings.setdefault(ring_key(macs), set(macs))
+    return [[d for d in plan['devices'] if d['mac'] in macs]
+            for _, macs in sorted(rings.iteritems())], units
+
+
+def start_shard(plan, name, results_dir):
+    # what merge needs to know about the reports in results_dir
+    if name not in plan['shards']:
+        raise KeyError(name)
+    save_json(dict(campaign=plan['campaign'], generation=plan['generation'],
+                   shard=name, host=socket.gethostname(),
+                   started=time.time()),
+              os.path.join(results_dir, SHARD_INFO))
+
+
+def sha1(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), ''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def locate(shard_dir, result):
+    # reports are <results dir>/<ordering>/<file>, wherever the results
+    # dir was on the controller that ran the shard
+    if not result:
+        return None
+    path = os.path.join(shard_dir, *result.replace('\\', '/').split('/')[-2:])
+    return path if os.path.exists(path) else None
+
+
+def finished_units(plan, shard_dirs):
+    # {unit_id: [copy, ...]} of the units of plan that some shard finished,
+    # the earliest copy first
+    found = {}
+    seen = set()
+    for shard_dir in shard_dirs:
+        if os.path.realpath(shard_dir) in seen:
+            continue
+        seen.add(os.path.realpath(shard_dir))
+
+        info_path = os.path.join(shard_dir, SHARD_INFO)
+        if not os.path.exists(info_path):
+            print shard_dir, 'is not the results dir of a shard, skipping it'
+            continue
+        info = load_json(info_path)
+        if info['campaign'] != plan['campaign']:
+            print shard_dir, 'belongs to campaign', info['campaign'], \
+                'not', plan['campaign'], 'skipping it'
+            continue
+
+        units = manifest.Manifest(
+            os.path.join(shard_dir, token_ring.MANIFEST_NAME)).units
+        for uid, unit in units.iteritems():
+            if uid not in plan['units'] or unit['state'] != manifest.DONE:
+                continue
+            source = locate(shard_dir, unit['result'])
+            if source is None:
+                print shard_dir, 'lost the report of', uid
+                continue
+            found.setdefault(uid, []).append(dict(
+                shard=info['shard'], host=info['host'],
+                generation=info['generation'], source=source,
+                finished=unit.get('updated'), attempts=unit['attempts'],
+                sha1=sha1(source)))
+
+    for copies in found.itervalues():
+        copies.sort(key=lambda c: (c['finished'], c['source']))
+    return found
+
+
+def merge(plan, shard_dirs, out_dir=token_ring.RESULTS_DIR):
+    # one report per unit in out_dir, laid out like the results dir of a
+    # single controller (archive.py reads it as it is), and provenance.json
+    # with the shard, host and file every report came from
+    if os.path.realpath(out_dir) in [os.path.realpath(d) for d in shard_dirs]:
+        raise ValueError('cannot merge into a shard ({0})'.format(out_dir))
+    found = finished_units(plan, shard_dirs)
+
+    units = {}
+    dropped = 0
+    for uid, copies in sorted(found.iteritems()):
+        keep = copies[0]
+        unit = plan['units'][uid]
+        # a unit always lands in the same file, merging again overwrites
+        path = os.path.join(os.path.basename(os.path.dirname(keep['source'])),
+                            'token_{0}_1.csv'.format(unit['payload_length']))
+        dest = os.path.join(out_dir, path)
+        if not os.path.exists(os.path.dirname(dest)):
+            os.makedirs(os.path.dirname(dest))
+        shutil.copyfile(keep['source'], dest)
+
+        # a unit done twice was resharded while its first shard still
+        # went on; identical copies are the same file merged twice
+        units[uid] = dict(keep, path=path, duplicates=[
+            dict(c, identical=c['sha1'] == keep['sha1']) for c in copies[1:]])
+        dropped += len(copies) - 1
+
+    missing = sorted(set(plan['units']) - set(found))
+    save_json(dict(campaign=plan['campaign'], generation=plan['generation'],
+                   merged=time.time(), units=units, missing=missing),
+              os.path.join(out_dir, PROVENANCE))
+    print '{0} of {1} units merged into {2}, {3} duplicates dropped, {4} ' \
+          'missing'.format(len(units), len(plan['units']), out_dir, dropped,
+                           len(missing))
+    return units, missing
+
+
+def reshard(plan, shard_dirs, shard_specs=None):
+    # the next generation of plan: what no shard finished goes to the
+    # shards given (by default the same ones), finished units stay with
+    # the shard that did them
+    new = dict(plan, generation=plan['generation'] + 1,
+               units=dict((uid, dict(u)) for uid, u in
+                          plan['units'].iteritems()))
+    if shard_specs:
+        new['shards'] = shard_devices(plan['devices'], shard_specs)
+    found = finished_units(plan, shard_dirs)
+
+    left = {}
+    for uid, unit in new['units'].iteritems():
+        if uid in found:
+            unit['done'] = True
+            unit['shard'] = found[uid][0]['shard']
+            continue
+        unit.pop('done', None)
+        macs, uids = left.setdefault(ring_key(unit['ordering']),
+                                     (unit['ordering'], []))
+        uids.append(uid)
+
+    reach = dict((name, set(s['devices']))
+                 for name, s in new['shards'].iteritems())
+    uids_of = dict((ring_key(macs), uids) for macs, uids in left.itervalues())
+    for macs, shard in assign([(macs, len(uids))
+                               for macs, uids in left.itervalues()], reach):
+        for uid in uids_of[ring_key(macs)]:
+            new['units'][uid]['shard'] = shard
+    return new
+
+
+def print_plan(plan):
+    names = dict((d['mac'], d['name']) for d in plan['devices'])
+    for name in sorted(plan['shards']):
+        rings, units = shard_work(plan, name)
+        print '{0}: {1} units left, rings: {2}'.format(
+            name, len(units), '; '.join(
+                ', '.join(d['name'] for d in ring) for ring in rings) or '-')
+    unassigned = [u for u in plan['units'].itervalues()
+                  if u['shard'] is None and not u.get('done')]
+    if unassigned:
+        rings = set(ring_key(u['ordering']) for u in unassigned)
+        print '{0} units in {1} rings no shard reaches: {2}'.format(
+            len(unassigned), len(rings), '; '.join(
+                ', '.join(names[m] for m in r.split(','))
+                for r in sorted(rings)))
+
+
+def status(plan, shard_dirs):
+    found = finished_units(plan, shard_dirs)
+    # shards resharded away still did their part
+    names = set(plan['shards']) | set(u['shard'] for u in
+                                      plan['units'].itervalues())
+    for name in sorted(names - set([None])):
+        planned = [uid for uid, u in plan['units'].iteritems()
+                   if u['shard'] == name]
+        print '{0}: {1} of {2} units done'.format(
+            name, len([uid for uid in planned if uid in found]), len(planned))
+    print '{0} of {1} units done in total'.format(len(found),
+                                                  len(plan['units']))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Split a token ring campaign over several controllers '
+                    'and merge their results.')
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+
+    def add_plan_argument(p):
+        p.add_argument('--plan', type=str, metavar='PATH', default=PLAN_PATH,
+                       help='Campaign plan (default: %(default)s)')
+
+    def add_shard_arguments(p, help):
+        p.add_argument('--shard', dest='shards', action='append',
+                       type=parse_shard, metavar='NAME=DEVICE,...',
+                       default=[], help=help)
+
+    plan_parser = commands.add_parser(
+        'plan', help='Plan a campaign and split it in shards')
+    add_plan_argument(plan_parser)
+    add_shard_arguments(plan_parser,
+                        'A controller and the devices (names, ips, macs or '
+                        'ip prefixes like 192.168.1.) it reaches; repeat '
+                        'for every controller')
+    plan_parser.add_argument('--inventory', type=str, metavar='PATH',
+                             default=None,
+                             help='Devices found by main.py discover '
+                                  '(default: the devices of token_ring.py)')
+    plan_parser.add_argument('--ring-size', '-s', dest='ring_size', type=int,
+                             metavar='N', default=None,
+                             help='Split the devices of every shard into '
+                                  'disjoint rings of N devices')
+
+    for name, help in (('status', 'How far every shard got'),
+                       ('merge', 'Merge the results of the shards'),
+                       ('reshard', 'Hand the unfinished units to the '
+                                   'shards again')):
+        p = commands.add_parser(name, help=help)
+        add_plan_argument(p)
+        p.add_argument('shard_dirs', metavar='SHARD_DIR', nargs='+',
+                       help='Results dir of a shard')
+        if name == 'merge':
+            p.add_argument('--out', type=str, metavar='DIR',
+                           default=token_ring.RESULTS_DIR,
+                           help='Where the merged results go (default: '
+                                '%(default)s)')
+        if name == 'reshard':
+            add_shard_arguments(p, 'The controllers to hand the unfinished '
+                                   'units to (default: the ones of the plan)')
+
+    args = parser.parse_args()
+    if args.command == 'plan' and not args.shards:
+        plan_parser.error('you must give at least one shard')
+    return args
+
+
+def main():
+    args = parse_args()
+
+    if args.command == 'plan':
+        if args.inventory is None:
+            devices = token_ring.DEVICES
+        else:
+            devices = sorted(inventory.load_inventory(args.inventory)
+                             .itervalues(), key=lambda d: d['name'])
+        plan = make_plan(devices, args.shards, args.ring_size)
+        save_json(plan, args.plan)
+        print 'Campaign', plan['campaign'], 'planned in', args.plan
+        print_plan(plan)
+        return
+
+    plan = load_json(args.plan)
+    if args.command == 'status':
+        status(plan, args.shard_dirs)
+    elif args.command == 'merge':
+        try:
+            merge(plan, args.shard_dirs, args.out)
+        except ValueError as e:
+            print e
+    elif args.command == 'reshard':
+        plan = reshard(plan, args.shard_dirs, args.shards)
+        save_json(plan, args.plan)
+        print 'Generation', plan['generation'], 'of campaign', \
+            plan['campaign'], 'planned in', args.plan
+        print_plan(plan)
+
+
+if __name__ == '__main__':
+    main()
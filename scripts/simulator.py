@@ -0,0 +1,378 @@
+import argparse
+import BaseHTTPServer
+import json
+import random
+import socket
+import SocketServer
+import threading
+import time
+import urlparse
+import uuid as uuidlib
+
+# mirrors the defaults of BenchService and the benchmark runners
+DEFAULT_ITERATIONS = 10
+DEFAULT_MESSAGE_SIZE = 2 * 1000 * 1024
+DEFAULT_MESSAGES = 1
+THROUGHPUT_MESSAGE_SIZE = 2 * 1000 * 1024
+PAYLOAD_LENGTH = 128
+NUM_ROUNDS = 5
+TOKEN_MAX_SLEEP = 2000  # ms
+
+DEFAULT_LINK = dict(
+    bandwidth=1500.0,  # kbit/s
+    latency=40.0,  # ms, one way
+    jitter=10.0,  # ms, standard deviation
+    failure_rate=0.0,  # probability a connection fails
+)
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+class Fleet(object):
+    # state shared by every virtual device: link models, clocks and token
+    # runs
+
+    def __init__(self, config=None, time_scale=0.01, seed=None,
+                 clock_skew=0.0, clock_drift=0.0):
+        config = config or {}
+        self.default_link = dict(DEFAULT_LINK, **config.get('default', {}))
+        self.links = config.get('links', {})
+        self.clocks = config.get('clocks', {})
+        self.clock_skew = clock_skew
+        self.clock_drift = clock_drift
+        self.time_scale = time_scale
+        self.random = random.Random(seed)
+        self.devices = {}
+        self.tokens = {}
+        self.lock = threading.Lock()
+        self.servers = []
+        self.epoch = now_ms()
+
+    def add_device(self, name, mac, ip, port):
+        # every device has its own wall clock: offset (ms) and drift (ppm)
+        # from the config, or random within the skew and drift given
+        clock = dict(
+            offset=self.random.uniform(-self.clock_skew, self.clock_skew),
+            drift=self.random.uniform(-self.clock_drift, self.clock_drift))
+        clock.update(self.clocks.get(name, {}))
+        device = dict(name=name, mac=mac, ip=ip, port=port, clock=clock)
+        self.devices[mac] = device
+        return device
+
+    def clock(self, device, t):
+        # what the wall clock of device reads at (simulated) time t
+        c = device['clock']
+        return int(t + c['offset'] + (t - self.epoch) * c['drift'] / 10 ** 6)
+
+    def link(self, sender, receiver):
+        return dict(self.default_link, **self.links.get(
+            '{0}->{1}'.format(sender['name'], receiver['name']), {}))
+
+    def delay(self, link):
+        with self.lock:
+            return max(0.0, self.random.gauss(link['latency'], link['jitter']))
+
+    def fails(self, link):
+        with self.lock:
+            return self.random.random() < link['failure_rate']
+
+    def transfer_ms(self, link, size):
+        return size * 8 / link['bandwidth']  # bits / (kbit / s) = ms
+
+    def wait(self, duration_ms):
+        # simulated time passes faster (or not at all) in real life
+        if self.time_scale > 0:
+            time.sleep(duration_ms / 1000.0 * self.time_scale)
+
+    def throughput(self, receiver, sender, iterations):
+        link = self.link(sender, receiver)
+        if self.fails(link):
+            return []
+
+        rows = []
+        for _ in xrange(iterations):
+            ms = self.transfer_ms(link, THROUGHPUT_MESSAGE_SIZE) + \
+                 self.delay(link)
+            rows.append((sender['name'], receiver['name'],
+                         THROUGHPUT_MESSAGE_SIZE, int(ms * 10 ** 6)))
+        self.wait(sum(r[3] for r in rows) / 10.0 ** 6)
+        return rows
+
+    def messages(self, master, targets, messages, size):
+        # the messages to a target go one after the other over its link,
+        # and the targets share the master's radio: with n of them every
+        # transfer takes n times as long
+        start = now_ms()
+        free = dict((t['mac'], start) for t in targets)  # link free from
+        rows = []
+        last = start
+        for _ in xrange(messages):
+            for target in targets:
+                link = self.link(master, target)
+                if self.fails(link):
+                    continue
+                started = free[target['mac']]
+                received = started + self.delay(link) * 2  # connect
+                done = received + self.transfer_ms(link, size) * len(targets)
+                finished = done + self.delay(link)
+                free[target['mac']] = done
+                last = max(last, finished)
+                # received is stamped by the target, the rest by the master
+                rows.append((master['name'], target['name'], size,
+                             self.clock(master, started),
+                             self.clock(target, received),
+                             self.clock(master, finished)))
+        self.wait(last - start)
+        return rows
+
+    def launch_token(self, master, macs, payload_length, rounds):
+        ring = [master] + [self.devices[m] for m in macs if m != master['mac']]
+        token_id = str(uuidlib.uuid4())
+        launched = time.time()
+
+        # the whole run is laid out up front; rows become visible to /tokres
+        # when the master gets the token back at the end of each round
+        t = t0 = now_ms()
+        published = []
+        lost = False
+        for _ in xrange(rounds):
+            round_rows = []
+            for i, sender in enumerate(ring):
+                receiver = ring[(i + 1) % len(ring)]
+                link = self.link(sender, receiver)
+                if self.fails(link):
+                    lost = True
+                    break
+                with self.lock:
+                    sleep = self.random.randint(0, TOKEN_MAX_SLEEP)
+                started = t + sleep
+                connected = started + self.delay(link) * 2
+                received = connected + self.transfer_ms(link, payload_length)
+                finished = received + self.delay(link)
+                t = finished + self.delay(link)  # token object
+                # every hop is stamped by its sender
+                round_rows.append((sender['mac'], receiver['mac'],
+                                   payload_length, NUM_ROUNDS,
+                                   self.clock(sender, started),
+                                   self.clock(sender, connected),
+                                   self.clock(sender, received),
+                                   self.clock(sender, finished), sleep))
+            if lost:
+                break
+            visible_at = launched + (t - t0) / 1000.0 * self.time_scale
+            published.append((visible_at, round_rows))
+
+        with self.lock:
+            self.tokens[token_id] = published
+        return token_id
+
+    def token_results(self, token_id):
+        with self.lock:
+            published = self.tokens.get(token_id)
+        if published is None:
+            return None
+        rows = [r for at, rr in published if at <= time.time() for r in rr]
+        return rows or None
+
+
+def to_csv(header, rows):
+    lines = [','.join(header)]
+    lines.extend(','.join(str(v) for v in row) for row in rows)
+    return '\n'.join(lines) + '\n'
+
+
+class DeviceHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, body, content_type='text/plain'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def int_param(self, params, name, default):
+        try:
+            return int(params[name][0])
+        except (KeyError, ValueError):
+            return default
+
+    def targets(self, params, name):
+        fleet = self.server.fleet
+        return [fleet.devices[m] for m in params.get(name, [])
+                if m in fleet.devices]
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        params = urlparse.parse_qs(url.query)
+        handler = getattr(self, 'handle_' + url.path.strip('/'), None)
+        if handler is None:
+            return self.reply(404, 'not found')
+        handler(params)
+
+    def handle_mac(self, params):
+        device = self.server.device
+        self.reply(200, '{0}\n{1}'.format(device['name'], device['mac']))
+
+    def handle_time(self, params):
+        self.reply(200, str(self.server.fleet.clock(self.server.device,
+                                                    now_ms())))
+
+    def handle_throughput(self, params):
+        targets = self.targets(params, 'target')
+        if not targets:
+            return self.reply(400, 'unknown target')
+        rows = self.server.fleet.throughput(
+            self.server.device, targets[0],
+            self.int_param(params, 'iterations', DEFAULT_ITERATIONS))
+        self.reply(200, to_csv(('from', 'to', 'bytes', 'nanotime'), rows),
+                   'text/csv')
+
+    def handle_messages(self, params):
+        targets = self.targets(params, 'target')
+        if not targets:
+            return self.reply(400, 'must specify at least a target')
+        rows = self.server.fleet.messages(
+            self.server.device, targets,
+            self.int_param(params, 'messages', DEFAULT_MESSAGES),
+            self.int_param(params, 'size', DEFAULT_MESSAGE_SIZE))
+        self.reply(200, to_csv(('from', 'to', 'message_size', 'started',
+                                'received', 'finished'), rows), 'text/csv')
+
+    def handle_token(self, params):
+        macs = [m for m in params.get('devices', [])
+                if m in self.server.fleet.devices]
+        if len(macs) < 2:
+            return self.reply(400, 'must specify at least two devices\n'
+                                   'Devices received: ' + ', '.join(macs))
+        token_id = self.server.fleet.launch_token(
+            self.server.device, macs,
+            self.int_param(params, 'payloadLength', PAYLOAD_LENGTH),
+            self.int_param(params, 'rounds', NUM_ROUNDS))
+        self.reply(200, token_id)
+
+    def handle_tokres(self, params):
+        token_id = params.get('uuid', [''])[0]
+        rows = self.server.fleet.token_results(token_id)
+        if rows is None:
+            return self.reply(204, '')
+        self.reply(200, to_csv(
+            ('sender', 'receiver', 'payloadSize', 'numRounds', 'started',
+             'connected', 'received', 'finished', 'sleep'), rows), 'text/csv')
+
+
+class DeviceServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 64
+
+    def __init__(self, fleet, device):
+        BaseHTTPServer.HTTPServer.__init__(
+            self, (device['ip'], device['port']), DeviceHandler)
+        self.fleet = fleet
+        self.device = device
+
+
+def device_ips(n, base_ip):
+    # consecutive addresses from base_ip; on Linux all of 127.0.0.0/8 is
+    # loopback, so hundreds of devices can listen on the same port
+    packed = reduce(lambda acc, b: acc * 256 + int(b), base_ip.split('.'), 0)
+    ips = []
+    for i in xrange(n):
+        value = packed + i
+        ips.append('.'.join(str((value >> s) & 0xff) for s in (24, 16, 8, 0)))
+    return ips
+
+
+def start_fleet(n, base_ip='127.0.1.1', port=38080, config=None,
+                time_scale=0.01, seed=None, clock_skew=0.0, clock_drift=0.0,
+                first=1):
+    fleet = Fleet(config, time_scale, seed, clock_skew, clock_drift)
+    for i, ip in enumerate(device_ips(n, base_ip), first):
+        device = fleet.add_device('sim-{0:03d}'.format(i),
+                                  '02:00:00:00:{0:02X}:{1:02X}'.format(
+                                      i >> 8, i & 0xff),
+                                  ip, port)
+        server = DeviceServer(fleet, device)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        fleet.servers.append(server)
+    return fleet
+
+
+def stop_fleet(fleet):
+    for server in fleet.servers:
+        server.shutdown()
+        server.server_close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Run virtual devices that speak the BenchService API.')
+    parser.add_argument('--devices', '-n', type=int, default=5,
+                        help='Number of virtual devices')
+    parser.add_argument('--base-ip', '-b', dest='base_ip', type=str,
+                        default='127.0.1.1',
+                        help='Address of the first device, the others follow')
+    parser.add_argument('--port', '-p', type=int, default=38080,
+                        help='Port every device listens on')
+    parser.add_argument('--config', '-c', type=str, default=None,
+                        help='JSON file with a "default" link model, '
+                             'per-link overrides in "links" ("A->B": {...}) '
+                             'and per-device clocks in "clocks" ("A": '
+                             '{"offset": ms, "drift": ppm})')
+    parser.add_argument('--time-scale', '-s', dest='time_scale', type=float,
+                        default=0.01,
+                        help='Real seconds per simulated second (0: answer '
+                             'immediately)')
+    parser.add_argument('--clock-skew', dest='clock_skew', type=float,
+                        default=0.0,
+                        help='Devices get a random clock offset of up to '
+                             'this many ms')
+    parser.add_argument('--clock-drift', dest='clock_drift', type=float,
+                        default=0.0,
+                        help='Devices get a random clock drift of up to '
+                             'this many ppm')
+    parser.add_argument('--first', type=int, default=1,
+                        help='Number of the first device; fleets started '
+                             'side by side (e.g. one per simulated lab) '
+                             'need different names and macs')
+    parser.add_argument('--seed', type=int, default=None)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    config = None
+    if args.config:
+        with open(args.config, 'r') as f:
+            config = json.load(f)
+
+    try:
+        fleet = start_fleet(args.devices, args.base_ip, args.port, config,
+                            args.time_scale, args.seed, args.clock_skew,
+                            args.clock_drift, args.first)
+    except socket.error as e:
+        print 'could not start the devices:', e
+        return
+
+    print ' '.join(d['ip'] for d in sorted(fleet.devices.values(),
+                                           key=lambda d: d['name']))
+    try:
+        while True:
+            time.sleep(1)
+    finally:
+        stop_fleet(fleet)
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,130 @@
+import itertools
+import math
+
+import numpy
+
+import campaign
+
+COUNTS = (10, 40)
+SIZES = (16 * 1024, 256 * 1024, 2000 * 1024)  # bytes, 2000 KB is the default
+CURVE_POINTS = 50
+# a fitted peak this many times past the largest fan-out is no peak at all
+# (kappa is just noise around zero)
+MAX_EXTRAPOLATION = 10
+
+
+def plan(devices, counts=COUNTS, sizes=SIZES, fanouts=None, masters=1):
+    # configurations (master, targets, messages, size) of the sweep, by
+    # mac; with more than one master the devices are split in disjoint
+    # groups, one master each, so their configurations can run together
+    group_size = int(math.ceil(len(devices) / float(masters)))
+    configs = []
+    for group in campaign.split_rings(devices, group_size):
+        master, others = group[0], group[1:]
+        ks = [k for k in (fanouts or xrange(1, len(others) + 1))
+              if 1 <= k <= len(others)]
+        for count, size, k in itertools.product(counts, sizes, ks):
+            configs.append((master['mac'],
+                            tuple(d['mac'] for d in others[:k]),
+                            count, size))
+    return configs
+
+
+def waves(configs):
+    # greedy packing: each wave is a set of configurations sharing no
+    # device, in plan order as far as possible
+    pending = list(configs)
+    out = []
+    while pending:
+        used = set()
+        wave = []
+        rest = []
+        for config in pending:
+            devices = set((config[0],) + config[1])
+            if devices & used:
+                rest.append(config)
+            else:
+                wave.append(config)
+                used |= devices
+        out.append(wave)
+        pending = rest
+    return out
+
+
+def usl(n, lam, sigma, kappa):
+    # universal scalability law: throughput with n targets given the
+    # single target rate, contention (sigma) and coherency cost (kappa)
+    return lam * n / (1 + sigma * (n - 1) + kappa * n * (n - 1))
+
+
+def fit_usl(fanouts, rates):
+    # None when there are too few points to fit three parameters; scipy
+    # is only loaded once there is something to fit
+    from scipy.optimize import curve_fit
+
+    n = numpy.asarray(fanouts, dtype=numpy.float64)
+    x = numpy.asarray(rates, dtype=numpy.float64)
+    if len(numpy.unique(n)) < 3 or not numpy.all(numpy.isfinite(x)):
+        return None
+
+    try:
+        (lam, sigma, kappa), _ = curve_fit(
+            usl, n, x, p0=(max(x[0] / n[0], 1e-6), 0.1, 0.01),
+            bounds=([0, 0, 0], [numpy.inf, numpy.inf, numpy.inf]))
+    except (RuntimeError, ValueError):
+        return None
+
+    # the fan-out with the highest throughput; past it adding targets
+    # makes the master slower overall
+    peak = None
+    if kappa > 0 and sigma < 1:
+        peak = math.sqrt((1 - sigma) / kappa)
+        if peak > MAX_EXTRAPOLATION * n.max():
+            peak = None
+    curve_x = numpy.linspace(1, max(n.max(), min(peak or 0, 4 * n.max())),
+                             CURVE_POINTS)
+    return dict(
+        lam=lam, sigma=sigma, kappa=kappa, peak=peak,
+        peak_rate=usl(peak, lam, sigma, kappa) if peak else None,
+        saturated=bool(peak is not None and peak <= n.max()),
+        curve_x=curve_x.tolist(),
+        curve_y=usl(curve_x, lam, sigma, kappa).tolist(),
+    )
+
+
+def measure(arr):
+    # aggregate of one configuration: every message counts, the makespan
+    # goes from the first start to the last pong on the master's clock.
+    # The rate of a configuration that failed (nothing came back) is None
+    if not len(arr):
+        return dict(received=0, makespan=None, rate=None, rtt=None, rtts=[])
+    makespan = (arr['finished'].max() - arr['started'].min()) / 1000.0
+    rtts = arr['finished'] - arr['started']
+    return dict(
+        received=len(arr),
+        makespan=makespan,
+        rate=len(arr) / makespan if makespan > 0 else None,
+        rtt=rtts.mean(),
+        rtts=rtts.tolist(),
+    )
+
+
+def curves(results):
+    # results: {config: measure(...)}; one scaling curve per master,
+    # message count and size. Fan-outs without a rate are no data point,
+    # they are listed as failed and left out of the fit
+    series = {}
+    for (master, targets, count, size), m in results.iteritems():
+        series.setdefault((master, count, size), []).append(
+            (len(targets), m['rate']))
+
+    out = []
+    for (master, count, size), points in sorted(series.items()):
+        points.sort()
+        fanouts = [k for k, r in points if r is not None]
+        rates = [r for _, r in points if r is not None]
+        out.append(dict(master=master, messages=count, size=size,
+                        fanouts=fanouts, rates=rates,
+                        failed=[k for k, r in points if r is None],
+                        fit=fit_usl(fanouts, rates)))
+    return out
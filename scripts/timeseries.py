@@ -0,0 +1,142 @@
+import sys
+
+import numpy
+from numpy.lib.stride_tricks import as_strided
+
+import analysis
+
+WINDOW = 50  # samples
+POINTS = 1000  # plotting budget
+PERCENTILES = (10, 50, 90)
+ALPHA = 0.1  # weight of the newest sample in the EWMA
+STALL_FRACTION = 0.2  # of the median rate
+STALL_MIN = 3  # samples
+
+
+def sliding_mean(values, window):
+    # mean of every full window, aligned to the window's last sample
+    c = numpy.cumsum(numpy.concatenate(([0.0], values)))
+    return (c[window:] - c[:-window]) / window
+
+
+def windows(values, window, step=1):
+    # read-only view of the windows starting every step samples, no copy
+    values = numpy.ascontiguousarray(values)
+    n = (len(values) - window) // step + 1
+    stride = values.strides[0]
+    return as_strided(values, shape=(n, window),
+                      strides=(stride * step, stride), writeable=False)
+
+
+def sliding_percentiles(values, window, q=PERCENTILES, points=POINTS):
+    # percentiles of at most ~points windows, evenly spread; returns the
+    # index of the last sample of each window and one row per percentile
+    step = max(1, (len(values) - window + 1) // points)
+    view = windows(values, window, step)
+    ends = numpy.arange(len(view)) * step + window - 1
+    return ends, numpy.percentile(view, q, axis=1)
+
+
+def ewma(values, alpha=ALPHA):
+    # y[i] = alpha * x[i] + (1 - alpha) * y[i - 1], starting from x[0];
+    # scipy is only loaded by the runs that smooth something
+    from scipy.signal import lfilter
+
+    values = numpy.asarray(values, dtype=numpy.float64)
+    if not len(values):
+        return values
+    y, _ = lfilter([alpha], [1, alpha - 1], values,
+                   zi=[(1 - alpha) * values[0]])
+    return y
+
+
+def stalls(values, fraction=STALL_FRACTION, min_length=STALL_MIN):
+    # (first, last) sample of every run of at least min_length samples
+    # below fraction * median
+    if not len(values):
+        return []
+    slow = numpy.concatenate(
+        ([False], values < fraction * numpy.median(values), [False]))
+    edges = numpy.flatnonzero(numpy.diff(slow.astype(numpy.int8)))
+    starts, ends = edges[::2], edges[1::2] - 1
+    keep = ends - starts + 1 >= min_length
+    return zip(starts[keep].tolist(), ends[keep].tolist())
+
+
+def lttb(x, y, points=POINTS):
+    # largest triangle three buckets: indices of the points that keep the
+    # visual shape of y(x)
+    n = len(x)
+    if points >= n or points < 3:
+        return numpy.arange(n)
+
+    bounds = numpy.linspace(1, n - 1, points - 1).astype(numpy.int64)
+    picked = numpy.empty(points, dtype=numpy.int64)
+    picked[0], picked[-1] = 0, n - 1
+    a = 0
+    for i in xrange(points - 2):
+        lo, hi = bounds[i], bounds[i + 1]
+        nlo, nhi = hi, bounds[i + 2] if i + 2 < len(bounds) else n
+        cx, cy = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = numpy.abs((x[a] - cx) * (y[lo:hi] - y[a]) -
+                         (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(numpy.argmax(area))
+        picked[i + 1] = a
+    return picked
+
+
+def decimate(n, points=POINTS):
+    # evenly spaced indices, for curves that are already smooth
+    return numpy.unique(numpy.linspace(0, n - 1, min(n, points))
+                        .astype(numpy.int64))
+
+
+def throughput_series(arr, window=None, points=POINTS):
+    # one sender -> receiver report as a time series: every sample is
+    # placed at the end of its transfer, seconds from the first one
+    rates = analysis.throughput_rates(arr)
+    t = numpy.cumsum(arr['nanotime']) / 10.0 ** 9
+    if window is None:
+        window = max(1, min(WINDOW, len(rates) // 5))
+    window = min(window, len(rates))
+
+    if not len(rates):
+        return dict(window=window, t=[], kbps=[], mean_t=[], mean=[],
+                    ewma_t=[], ewma=[], band_t=[], percentiles={}, stalls=[])
+
+    raw = lttb(t, rates, points)
+    mean = sliding_mean(rates, window)
+    mean_idx = decimate(len(mean), points)
+    smooth = ewma(rates)
+    smooth_idx = decimate(len(smooth), points)
+    ends, pct = sliding_percentiles(rates, window, PERCENTILES, points)
+
+    return dict(
+        window=window,
+        t=t[raw].tolist(),
+        kbps=rates[raw].tolist(),
+        mean_t=t[mean_idx + window - 1].tolist(),
+        mean=mean[mean_idx].tolist(),
+        ewma_t=t[smooth_idx].tolist(),
+        ewma=smooth[smooth_idx].tolist(),
+        band_t=t[ends].tolist(),
+        percentiles=dict(zip([str(q) for q in PERCENTILES], pct.tolist())),
+        stalls=[(t[s] - arr['nanotime'][s] / 10.0 ** 9, t[e])
+                for s, e in stalls(rates)],
+    )
+
+
+def main():
+    for path in sys.argv[1:]:
+        arr = analysis.load(path, analysis.THROUGHPUT_DTYPE)
+        keys, inverse = analysis.group_by(arr, 'from', 'to')
+        for i, k in enumerate(keys):
+            series = throughput_series(arr[inverse == i])
+            print '{0} -> {1}: {2} samples, window {3}'.format(
+                k['from'], k['to'], (inverse == i).sum(), series['window'])
+            for start, end in series['stalls']:
+                print '  stall from {0:.1f} s to {1:.1f} s'.format(start, end)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+import argparse
+import csv
+import os
+import threading
+import requests
+import time
+
+import analysis
+import campaign
+import client
+import dashboard
+import manifest
+import poller
+import tracing
+
+DEVICES = [
+    {'name': 'n4', 'ip': '192.168.1.100', 'mac': '40:B0:FA:5F:26:8A'},
+    {'name': 'n5', 'ip': '192.168.1.107', 'mac': 'BC:F5:AC:5C:50:87'},
+    {'name': 'mi', 'ip': '192.168.1.102', 'mac': '74:51:BA:46:90:A2'},
+    # {'name': 'opo', 'ip': '10.0.1.116', 'mac': 'C0:EE:FB:34:B6:CC'},
+    {'name': 'n7', 'ip': '192.168.1.109', 'mac': '50:46:5D:CC:65:4E'}
+]
+
+ROUNDS = 5
+PAYLOAD_LENGTHS = [256, 512, 1024, 2048, 4096]
+RESULTS_DIR = 'token_results'
+MANIFEST_NAME = 'manifest.json'
+FAILED_SUFFIX = '.failed'
+COOLDOWN = 1  # s, between two successful runs
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run a token ring campaign.')
+
+    parser.add_argument('--ring', '-r', dest='rings', action='append',
+                        metavar='NAME,NAME,...', default=[],
+                        help='Devices (by name) of a ring; repeat to drive '
+                             'several rings at once')
+
+    parser.add_argument('--ring-size', '-s', dest='ring_size', type=int,
+                        metavar='N', default=None,
+                        help='Split DEVICES into disjoint rings of N devices')
+
+    parser.add_argument('--results-dir', dest='results_dir', type=str,
+                        metavar='DIR', default=RESULTS_DIR,
+                        help='Where the reports are saved (default: '
+                             '%(default)s)')
+
+    parser.add_argument('--manifest', '-m', type=str, metavar='PATH',
+                        default=None,
+                        help='Campaign manifest; an unfinished campaign is '
+                             'resumed from it (default: {0} in the results '
+                             'dir)'.format(MANIFEST_NAME))
+
+    parser.add_argument('--plan', type=str, metavar='PATH', default=None,
+                        help='Run a shard of a campaign planned by '
+                             'shard.py (--shard says which one)')
+
+    parser.add_argument('--shard', type=str, metavar='NAME', default=None,
+                        help='Shard of the plan to run')
+
+    parser.add_argument('--dashboard', type=int, metavar='PORT',
+                        nargs='?', const=dashboard.DASHBOARD_PORT,
+                        default=None,
+                        help='Serve a live dashboard of every ring on '
+                             'localhost (default port: {0})'.format(
+                            dashboard.DASHBOARD_PORT))
+
+    parser.add_argument('--trace-dir', type=str, metavar='DIR',
+                        dest='trace_dir', default=tracing.TRACE_DIR,
+                        help='Where the timing trace and the metrics of the '
+                             'campaign are written')
+
+    parser.add_argument('--fresh', '-f', action='store_true', default=False,
+                        help='Forget the unfinished campaign in the manifest '
+                             'and start over')
+
+    args = parser.parse_args()
+    if (args.plan is None) != (args.shard is None):
+        parser.error('--plan and --shard go together')
+    if args.manifest is None:
+        args.manifest = os.path.join(args.results_dir, MANIFEST_NAME)
+    return args
+
+
+def make_rings(args):
+    if not args.rings:
+        return campaign.split_rings(DEVICES, args.ring_size)
+
+    by_name = dict((d['name'], d) for d in DEVICES)
+    return [[by_name[name] for name in ring.split(',')] for ring in args.rings]
+
+
+class LiveRings(object):
+    # connection cost and rtt of every ring by payload length, one figure
+    # per ring on the dashboard
+
+    def __init__(self, live):
+        self.live = live
+        self.lock = threading.Lock()
+        self.rings = {}
+
+    def add(self, ring_id, pl, content):
+        arr = analysis.load_token(csv.DictReader(content.splitlines()))
+        if not len(arr):
+            return
+        conn = (arr['connected'] - arr['started']).mean()
+        rtt = (arr['finished'] - arr['started']).mean() - conn
+
+        with self.lock:
+            runs = self.rings.setdefault(ring_id, {})
+            runs.setdefault(pl, []).append((conn, rtt))
+            sizes = sorted(runs)
+            data = dict(sizes=sizes,
+                        conns=[sum(c for c, _ in runs[s]) / len(runs[s])
+                               for s in sizes],
+                        rtts=[sum(r for _, r in runs[s]) / len(runs[s])
+                              for s in sizes])
+        self.live.update('ring-{0}'.format(ring_id), 'token', data)
+
+    def progress(self, total, ring_id, done, failed, eta):
+        self.live.set_status('campaign', '{0} of {1} done, {2} failed, '
+                                         'ETA {3}'.format(
+            done, total, failed, campaign.format_eta(eta)))
+
+
+@tracing.traced('run_test')
+def run_test(token_poller, ring_id, ds, pl, fname=None, live_rings=None,
+             results_dir=RESULTS_DIR):
+    master = ds[0]
+    devices = ds[1:]
+    tag = '[ring {0}]'.format(ring_id)
+
+    print tag, 'devices:', ', '.join([d['name'] for d in ds]), \
+        'master:', master['name'], 'payload length:', pl
+
+    try:
+        uuid = launch_token(master['ip'], [d['mac'] for d in devices], pl,
+                            ROUNDS)
+    except requests.RequestException as e:
+        # the campaign goes on with the rings that still work, this test
+        # is retried when the campaign is resumed
+        print tag, 'Failed, could not reach', master['name'], '-', e
+        return False, fname
+    print tag, 'uuid:', uuid
+    if fname is None:
+        # a retried test overwrites what its failed attempt left behind
+        fname = get_fname(ds, pl, results_dir)
+
+    job = token_poller.submit(master['ip'], uuid, len(ds), pl, ROUNDS)
+    response = job.wait()
+    if response is not None:
+        # what a failed run left is kept aside, for archive.py only the
+        # report of the retry counts
+        save_results(response.content.strip(),
+                     fname if job.ok else fname + FAILED_SUFFIX)
+
+    if job.ok:
+        print tag, 'Succesful! Results saved as:', fname
+        if live_rings is not None:
+            live_rings.add(ring_id, pl, response.content)
+        time.sleep(COOLDOWN)
+    else:
+        print tag, 'Failed'
+        # let a stuck token drain before the same devices go again
+        if client.healthy(master['ip']):
+            time.sleep(job.expected)
+    return job.ok, fname
+
+
+def main():
+    args = parse_args()
+    payload_lengths = PAYLOAD_LENGTHS
+    rings = make_rings(args)
+    units = None
+    if args.plan is not None:
+        import shard
+
+        plan = shard.load_json(args.plan)
+        payload_lengths = plan['payload_lengths']
+        rings, units = shard.shard_work(plan, args.shard)
+        shard.start_shard(plan, args.shard, args.results_dir)
+        print 'shard {0} of campaign {1}, generation {2}: {3} units'.format(
+            args.shard, plan['campaign'], plan['generation'], len(units))
+    token_poller = poller.TokenPoller()
+
+    if args.fresh:
+        manifest.Manifest(args.manifest).remove()
+    campaign_manifest = manifest.Manifest(args.manifest)
+
+    for i, ring in enumerate(rings):
+        print 'ring {0}: {1}'.format(i, ', '.join([d['name'] for d in ring]))
+
+    live = live_rings = None
+    if args.dashboard is not None:
+        live = dashboard.Dashboard(port=args.dashboard).start()
+        live_rings = LiveRings(live)
+        print 'Live results at', live.url
+
+    runner = campaign.CampaignRunner(
+        rings, payload_lengths,
+        lambda ring_id, ds, pl, fname:
+        run_test(token_poller, ring_id, ds, pl, fname, live_rings,
+                 args.results_dir),
+        campaign_manifest,
+        live_rings and (lambda *args: live_rings.progress(
+            runner.progress.total, *args)),
+        units,
+        # shard.py merge reads the manifest of a finished shard
+        keep_manifest=units is not None
+    )
+    counts = campaign_manifest.counts(runner.unit_ids)
+    if counts[manifest.DONE]:
+        print 'Resuming campaign: {0} of {1} tests already done'.format(
+            counts[manifest.DONE], len(runner.unit_ids))
+
+    try:
+        progress = runner.run()
+    finally:
+        token_poller.close()
+        client.client.close()
+        print 'Trace saved as', tracing.export(args.trace_dir)
+        if live is not None:
+            live.close()
+
+    print '=================='
+    print 'Finished!'
+    print 'total tests:', progress.done, '(this run)'
+    print 'succesful:', progress.done - progress.failed
+    print 'failed:', progress.failed
+    if client.unhealthy():
+        print 'unhealthy devices:', ', '.join(client.unhealthy())
+
+
+def get_fname(devices, payload_length, results_dir=RESULTS_DIR):
+    dirname = os.path.join(results_dir, campaign.ordering_name(devices))
+    if not os.path.exists(dirname):
+        os.makedirs(dirname)
+
+    idx = 1
+    while True:
+        fname = os.path.join(dirname, 'token_{0}_{1}.csv'.format(payload_length, idx))
+        if not os.path.exists(fname):
+            return fname
+        idx += 1
+
+
+def save_results(results, fname):
+    with open(fname, 'w') as f:
+        f.write(results)
+
+
+# raises requests.RequestException once the client gives up on the master
+
+@tracing.traced('launch_token')
+def launch_token(master_ip, devices_addr, payload_length=512, rounds=5):
+    tracing.count('requests_total', endpoint='token')
+    return client.get('http://{0}:38080/token'.format(master_ip),
+                      params=dict(devices=devices_addr,
+                                  payloadLength=payload_length,
+                                  rounds=rounds)).content.strip()
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,182 @@
+import contextlib
+import itertools
+import json
+import os
+import threading
+import time
+
+TRACE_DIR = 'traces'
+METRICS_NAME = 'btbench.prom'
+METRICS_PREFIX = 'btbench_'
+
+HELP = {
+    'span_seconds': 'Time spent in each harness operation',
+    'requests_total': 'HTTP requests sent to the devices',
+    'retries_total': 'Operations retried after a failure',
+    'cache_hits_total': 'Reports served from the result cache',
+    'cache_misses_total': 'Reports fetched from the devices',
+    'bytes_fetched_total': 'Bytes of reports fetched from the devices',
+    'device_failures_total': 'Failed requests per device',
+    'circuit_open_total': 'Times a device was given up on after repeated failures',
+    'token_polls_total': 'Requests to /tokres',
+}
+
+
+class Tracer(object):
+    # nested timing spans (one stack per thread) and labelled counters
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.ids = itertools.count(1)
+        self.started = time.time()
+        self.spans = []
+        self.counters = {}
+
+    def _stack(self):
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    def current(self):
+        stack = self._stack()
+        return stack[-1]['id'] if stack else None
+
+    @contextlib.contextmanager
+    def span(self, name, **attrs):
+        stack = self._stack()
+        span = dict(id=next(self.ids), parent=self.current(), name=name,
+                    thread=threading.current_thread().name,
+                    start=time.time(), attrs=attrs)
+        stack.append(span)
+        try:
+            yield span
+        except Exception as e:
+            span['error'] = type(e).__name__
+            raise
+        finally:
+            stack.pop()
+            span['duration'] = time.time() - span['start']
+            with self.lock:
+                self.spans.append(span)
+            self.count('span_seconds_sum', span['duration'], operation=name)
+            self.count('span_seconds_count', 1, operation=name)
+
+    def bind(self, func):
+        # spans opened by func in another thread (e.g. a pool worker) are
+        # children of the span that is current here
+        parent = self.current()
+
+        def bound(*args, **kwargs):
+            stack = self._stack()
+            stack.append(dict(id=parent))
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stack.pop()
+        return bound
+
+    def count(self, metric, value=1, **labels):
+        key = (metric, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def merge(self, spans, parent=None):
+        # spans recorded by another process (e.g. a render worker), their
+        # roots become children of parent
+        ids = dict((s['id'], next(self.ids)) for s in spans)
+        for span in spans:
+            span = dict(span, id=ids[span['id']],
+                        parent=ids.get(span['parent'], parent))
+            with self.lock:
+                self.spans.append(span)
+            self.count('span_seconds_sum', span['duration'],
+                       operation=span['name'])
+            self.count('span_seconds_count', 1, operation=span['name'])
+
+    def write_trace(self, path):
+        with self.lock:
+            spans = sorted(self.spans, key=lambda s: s['start'])
+            counters = sorted(self.counters.items())
+        with open(path, 'w') as f:
+            for span in spans:
+                f.write(json.dumps(dict(span, type='span'),
+                                   sort_keys=True) + '\n')
+            for (name, labels), value in counters:
+                f.write(json.dumps(dict(type='counter', name=name,
+                                        labels=dict(labels), value=value),
+                                   sort_keys=True) + '\n')
+
+    def write_metrics(self, path):
+        # Prometheus text format, e.g. for node_exporter's textfile collector
+        with self.lock:
+            counters = sorted(self.counters.items())
+
+        lines = []
+        declared = set()
+        for (name, labels), value in counters:
+            family = name
+            kind = 'counter'
+            if name.startswith('span_seconds_'):
+                family = 'span_seconds'
+                kind = 'summary'
+            if family not in declared:
+                declared.add(family)
+                lines.append('# HELP {0}{1} {2}'.format(
+                    METRICS_PREFIX, family, HELP.get(family, family)))
+                lines.append('# TYPE {0}{1} {2}'.format(
+                    METRICS_PREFIX, family, kind))
+            lines.append('{0}{1}{2} {3}'.format(
+                METRICS_PREFIX, name, format_labels(labels), repr(value)))
+
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.rename(tmp_path, path)
+
+    def export(self, dirname=TRACE_DIR):
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+        trace_path = os.path.join(dirname, 'trace-{0}.jsonl'.format(
+            time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started))))
+        self.write_trace(trace_path)
+        self.write_metrics(os.path.join(dirname, METRICS_NAME))
+        return trace_path
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escape = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+    return '{' + ','.join('{0}="{1}"'.format(k, escape(v))
+                          for k, v in labels) + '}'
+
+
+# the tracer of this process
+tracer = Tracer()
+span = tracer.span
+bind = tracer.bind
+count = tracer.count
+export = tracer.export
+
+
+def traced(name):
+    def decorator(func):
+        def wrapper(*args, **kwargs):
+            with tracer.span(name):
+                return func(*args, **kwargs)
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+    return decorator
+
+
+def reset():
+    # a fresh tracer for this process (render workers start from a fork)
+    global tracer, span, bind, count, export
+    tracer = Tracer()
+    span = tracer.span
+    bind = tracer.bind
+    count = tracer.count
+    export = tracer.export